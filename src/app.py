@@ -20,17 +20,22 @@ from symptoms import (
     render_symptom_selector,
     validate_symptoms,
     display_selected_symptoms,
+    get_all_symptoms,
     get_all_symptoms_flat
 )
 from knowledge_base import (
     get_knowledge_base,
     get_disease_names,
     get_all_categories,
+    get_data_problems,
     display_disease_card
 )
 from inference_engine import (
     diagnose,
-    InferenceEngine
+    triage,
+    InferenceEngine,
+    DiagnosisSession,
+    get_engine
 )
 from cases import (
     load_test_cases,
@@ -180,6 +185,12 @@ def display_header():
     """, unsafe_allow_html=True)
 
 
+def display_data_problems():
+    """Muestra los errores de los datos que se están sorteando con la última versión válida"""
+    for problem in get_data_problems():
+        st.error(f"⚠️ Error en los datos (se usa la última versión válida): {problem}")
+
+
 def display_severity_alert(severity):
     """Muestra alerta según severidad"""
     severity_lower = severity.lower()
@@ -199,6 +210,21 @@ def display_severity_alert(severity):
         st.info("ℹ️ **RECOMENDACIÓN:** Consulte con un profesional de la salud si los síntomas persisten o empeoran.")
 
 
+def display_triage_alert(triage_result):
+    """Alerta del triaje de emergencia (se muestra antes del diferencial completo)"""
+    if not triage_result or not triage_result['emergency']:
+        return
+    diseases = ''.join(f"<li>{alert['disease']}</li>" for alert in triage_result['alerts'])
+    st.markdown(f"""
+    <div class="emergency-alert">
+        <h3>🚨 ALERTA DE EMERGENCIA</h3>
+        <p><strong>Los síntomas son compatibles con condiciones que requieren atención médica URGENTE:</strong></p>
+        <ul>{diseases}</ul>
+        <p>Por favor, acuda inmediatamente a un servicio de emergencias o llame al 911</p>
+    </div>
+    """, unsafe_allow_html=True)
+
+
 def generate_diagnosis_hash(disease, confidence, timestamp):
     """Genera un hash único para un diagnóstico"""
     data = f"{disease}_{confidence}_{timestamp}"
@@ -894,6 +920,121 @@ def generate_html_report(symptoms, results, method, top_n=5):
 # PÁGINAS DE LA APLICACIÓN
 # ====================================
 
+def display_live_differential(selected_symptoms, top_n=3, hierarchy=False):
+    """Diferencial en vivo: se actualiza incrementalmente con cada síntoma marcado"""
+    session = st.session_state.get('diagnosis_session')
+    engine = get_engine(hierarchy)
+    if session is None or session.engine is not engine:
+        session = DiagnosisSession(engine)
+        st.session_state.diagnosis_session = session
+    session.sync(selected_symptoms)
+
+    preview = session.ranking('forward', top_k=top_n,
+                              absent_symptoms=st.session_state.get('dismissed_questions'))
+    if preview:
+        st.markdown("#### 🔄 Diferencial en vivo")
+        for i, result in enumerate(preview, 1):
+            st.caption(f"{i}. {result['disease']} ({result['confidence'] * 100:.1f}%)")
+
+
+def display_differential_table(selected_symptoms, hierarchy=False):
+    """Tabla diferencial: encadenamiento hacia atrás sobre todas las enfermedades"""
+    import pandas as pd
+
+    table = get_engine(hierarchy).backward_chaining_table(
+        selected_symptoms, absent_symptoms=st.session_state.get('dismissed_questions')
+    )
+    df = pd.DataFrame({
+        'Enfermedad': table['hypothesis'],
+        'Confirmación (%)': (table['confidence'] * 100).round(1),
+        'Confirmada': table['confirmed'],
+        'Presentes': table['present_count'],
+        'Principales faltantes': table['missing_count'],
+        'Síntomas faltantes': [', '.join(symptoms) for symptoms in table['missing_symptoms']],
+        'Ausentes confirmados': [', '.join(symptoms) for symptoms in table['absent_symptoms']]
+    })
+    only_matches = st.checkbox("Solo enfermedades con algún síntoma presente", value=True,
+                               key="differential_only_matches")
+    if only_matches:
+        df = df[df['Presentes'] > 0]
+    st.dataframe(df.sort_values('Confirmación (%)', ascending=False),
+                 use_container_width=True, hide_index=True)
+
+
+def mark_symptom(symptom):
+    """Marca un síntoma sugerido en el selector (callback de botón)"""
+    for category, symptoms in get_all_symptoms().items():
+        if symptom in symptoms:
+            st.session_state[f"symptom_{category}_{symptom}"] = True
+    st.session_state.get('dismissed_questions', set()).discard(symptom)
+
+
+def dismiss_question(symptom):
+    """Registra un síntoma sugerido que el paciente no presenta (ausente confirmado)"""
+    st.session_state.setdefault('dismissed_questions', set()).add(symptom)
+
+
+def display_suggested_questions(selected_symptoms, top_n=3, hierarchy=False):
+    """Siguientes síntomas a preguntar, por ganancia de información esperada"""
+    dismissed = st.session_state.get('dismissed_questions', set())
+    questions = get_engine(hierarchy).next_questions(
+        selected_symptoms, top_n, candidates=get_all_symptoms_flat(), absent_symptoms=dismissed
+    )
+    if not questions:
+        return
+    st.markdown("#### ❓ Preguntas sugeridas")
+    for question in questions:
+        col1, col2, col3 = st.columns([4, 1, 1])
+        col1.caption(f"¿Presenta **{question['symptom']}**?")
+        col2.button("Sí", key=f"ask_yes_{question['symptom']}",
+                    on_click=mark_symptom, args=(question['symptom'],))
+        col3.button("No", key=f"ask_no_{question['symptom']}",
+                    on_click=dismiss_question, args=(question['symptom'],))
+
+
+def undo_dismissal(symptom):
+    """Retira un síntoma de los ausentes confirmados (callback de botón)"""
+    st.session_state.get('dismissed_questions', set()).discard(symptom)
+
+
+def display_dismissed_questions():
+    """Síntomas descartados como ausentes, con opción de deshacer"""
+    dismissed = st.session_state.get('dismissed_questions', set())
+    if not dismissed:
+        return
+    st.markdown("#### 🚫 Ausentes confirmados")
+    for symptom in sorted(dismissed):
+        col1, col2 = st.columns([5, 1])
+        col1.caption(f"No presenta **{symptom}**")
+        col2.button("Deshacer", key=f"undo_no_{symptom}",
+                    on_click=undo_dismissal, args=(symptom,))
+
+
+def render_intensity_sliders(selected_symptoms):
+    """Intensidad (leve a grave) de cada síntoma seleccionado para el método difuso"""
+    st.markdown("#### 🌡️ Intensidad de los síntomas")
+    intensities = {}
+    for symptom in selected_symptoms:
+        intensities[symptom] = st.slider(symptom, min_value=0.0, max_value=1.0, value=1.0, step=0.1,
+                                         key=f"intensity_{symptom}")
+    return intensities
+
+
+def display_comorbidity(selected_symptoms, max_size=2, top_n=3, hierarchy=False):
+    """Mejores combinaciones de enfermedades que explican juntas los síntomas"""
+    explanations = get_engine(hierarchy).comorbidity_search(selected_symptoms, max_size, top_n)
+    if not explanations:
+        st.info("No se encontraron explicaciones combinadas.")
+        return
+    for explanation in explanations:
+        st.markdown(f"**{' + '.join(explanation['diseases'])}** "
+                    f"(cobertura {explanation['coverage'] * 100:.0f}%)")
+        if explanation['unexplained_symptoms']:
+            st.caption("Sin explicar: " + ", ".join(explanation['unexplained_symptoms']))
+        if explanation['missing_symptoms']:
+            st.caption("Principales ausentes: " + ", ".join(explanation['missing_symptoms']))
+
+
 def page_home():
     """Página principal de diagnóstico"""
     st.markdown("## 🩺 Nueva Consulta de Diagnóstico")
@@ -921,9 +1062,16 @@ def page_home():
     # Validar y mostrar resumen
     if validate_symptoms(selected_symptoms):
         st.session_state.selected_symptoms = selected_symptoms
+        # Un síntoma marcado después prevalece sobre su ausencia
+        st.session_state.get('dismissed_questions', set()).difference_update(selected_symptoms)
 
         st.markdown("---")
         display_selected_symptoms(selected_symptoms)
+        # El checkbox se dibuja más abajo; su valor ya está en session_state
+        live_hierarchy = st.session_state.get('use_hierarchy', False)
+        display_live_differential(selected_symptoms, hierarchy=live_hierarchy)
+        display_suggested_questions(selected_symptoms, hierarchy=live_hierarchy)
+        display_dismissed_questions()
 
         st.markdown("---")
         st.markdown("### ⚙️ Configuración de Diagnóstico")
@@ -933,12 +1081,15 @@ def page_home():
         with col1:
             method = st.radio(
                 "Método de Inferencia:",
-                ['hybrid', 'forward', 'rules'],
+                ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
                 index=0,
                 format_func=lambda x: {
                     'hybrid': '🔄 Híbrido (Recomendado) - Combina múltiples métodos',
                     'forward': '➡️ Encadenamiento Hacia Adelante - De síntomas a diagnóstico',
-                    'rules': '📋 Basado en Reglas - Utiliza reglas IF-THEN predefinidas'
+                    'rules': '📋 Basado en Reglas - Utiliza reglas IF-THEN predefinidas',
+                    'bayes': '🎲 Naive Bayes - Probabilidad a posteriori de cada enfermedad',
+                    'noisy_or': '🔀 Noisy-OR - Cada enfermedad como causa probable de sus síntomas',
+                    'fuzzy': '🌡️ Difuso - Considera la intensidad de cada síntoma'
                 }[x],
                 help="El método híbrido proporciona los mejores resultados al combinar diferentes estrategias de inferencia"
             )
@@ -952,6 +1103,14 @@ def page_home():
                 help="Cantidad de diagnósticos más probables a mostrar",
                 key="top_n"
             )
+            use_hierarchy = st.checkbox(
+                "Usar jerarquía de síntomas",
+                value=False,
+                help="Un síntoma específico (p. ej. 'Fiebre alta') también cumple los requisitos del general ('Fiebre')",
+                key="use_hierarchy"
+            )
+
+        intensities = render_intensity_sliders(selected_symptoms) if method == 'fuzzy' else None
 
         # Botón de diagnóstico
         st.markdown("---")
@@ -963,10 +1122,21 @@ def page_home():
                 if 'button_counter' in st.session_state:
                     st.session_state.button_counter = 0
 
+                # Triaje de emergencia: la alerta se muestra antes del diagnóstico completo
+                triage_result = triage(selected_symptoms, hierarchy=use_hierarchy)
+                st.session_state.triage_result = triage_result
+                triage_placeholder = st.empty()
+                with triage_placeholder.container():
+                    display_triage_alert(triage_result)
+
                 # Realizar diagnóstico
-                results = diagnose(selected_symptoms, method)
+                results = diagnose(intensities or selected_symptoms, method,
+                                   absent_symptoms=st.session_state.get('dismissed_questions'),
+                                   hierarchy=use_hierarchy)
+                triage_placeholder.empty()
                 st.session_state.diagnosis_results = results
                 st.session_state.diagnosis_method = method
+                st.session_state.diagnosis_hierarchy = use_hierarchy
                 st.session_state.diagnosis_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
                 # Resetear estado PDF
@@ -980,6 +1150,8 @@ def page_home():
                     st.warning("⚠️ No se encontraron diagnósticos que coincidan con los síntomas seleccionados.")
                     st.info("💡 Intente agregar más síntomas o consulte directamente con un profesional de la salud.")
     else:
+        # Sin selección no hay preguntas respondidas que conservar
+        st.session_state.pop('dismissed_questions', None)
         st.warning("⚠️ Por favor, seleccione al menos un síntoma para continuar.")
 
     # ==================================================================
@@ -989,9 +1161,11 @@ def page_home():
         results = st.session_state.diagnosis_results
         curr_top_n = st.session_state.get('top_n', 5)
         method = st.session_state.get('diagnosis_method', 'hybrid')
+        use_hierarchy = st.session_state.get('diagnosis_hierarchy', False)
 
         st.markdown("---")
         st.markdown("## 📊 Resultados del Diagnóstico")
+        display_triage_alert(st.session_state.get('triage_result'))
 
         # Mostrar resultados
         for i, result in enumerate(results[:curr_top_n], 1):
@@ -1015,6 +1189,12 @@ def page_home():
             severe_count = sum(1 for r in results[:curr_top_n] if 'grave' in str(r.get('severity', '')).lower())
             st.metric("Condiciones Graves", severe_count)
 
+        with st.expander("🧮 Tabla diferencial (encadenamiento hacia atrás)", expanded=False):
+            display_differential_table(st.session_state.selected_symptoms, hierarchy=use_hierarchy)
+
+        with st.expander("🧩 Explicaciones combinadas (comorbilidad)", expanded=False):
+            display_comorbidity(st.session_state.selected_symptoms, hierarchy=use_hierarchy)
+
         # ============================================
         # SECCIÓN PDF
         # ============================================
@@ -1318,8 +1498,10 @@ def page_test_cases():
 
             method = st.radio(
                 "Método:",
-                ['hybrid', 'forward', 'rules'],
-                format_func=lambda x: {'hybrid': 'Híbrido', 'forward': 'Forward', 'rules': 'Reglas'}[x]
+                ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
+                format_func=lambda x: {'hybrid': 'Híbrido', 'forward': 'Forward', 'rules': 'Reglas',
+                                       'bayes': 'Bayes', 'noisy_or': 'Noisy-OR',
+                                       'fuzzy': 'Difuso'}[x]
             )
 
             if st.button("🔍 Ejecutar Diagnóstico"):
@@ -1333,7 +1515,7 @@ def page_test_cases():
 
         method = st.radio(
             "Método para evaluación:",
-            ['hybrid', 'forward', 'rules'],
+            ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
             key='eval_method'
         )
 
@@ -1483,6 +1665,7 @@ def main():
     load_custom_css()
     initialize_session_state()
     display_header()
+    display_data_problems()
 
     # Sidebar
     with st.sidebar:
@@ -7,35 +7,16 @@ Permite cargar, visualizar y ejecutar casos de prueba
 
 import streamlit as st
 import pandas as pd
-import os
-from inference_engine import diagnose, InferenceEngine
+from snapshot import get_section
+from inference_engine import diagnose, diagnose_batch, InferenceEngine
 from symptoms import display_selected_symptoms
 
 
 def load_test_cases():
-    """Carga casos de prueba desde CSV"""
-    cases_path = os.path.join(os.path.dirname(__file__), "..", "data", "test_cases.csv")
-    
+    """Carga casos de prueba desde el snapshot compilado de test_cases.csv"""
     try:
-        df = pd.read_csv(cases_path)
-        cases = []
-        
-        for _, row in df.iterrows():
-            symptoms = [s.strip() for s in str(row['sintomas']).split('|') if s.strip()]
-            
-            case = {
-                'id': str(row['caso_id']).strip(),
-                'nombre': str(row['nombre_caso']).strip(),
-                'symptoms': symptoms,
-                'expected_diagnosis': str(row['diagnostico_esperado']).strip(),
-                'severity': str(row['severidad']).strip(),
-                'edad': int(row['edad']),
-                'sexo': str(row['sexo']).strip(),
-                'descripcion': str(row['descripcion_caso']).strip()
-            }
-            cases.append(case)
-        
-        return cases
+        # Copia por caso: el snapshot en memoria es compartido
+        return [dict(case, symptoms=list(case['symptoms'])) for case in get_section('cases')]
         
     except FileNotFoundError:
         st.warning("⚠️ Archivo test_cases.csv no encontrado. Usando casos predeterminados.")
@@ -218,8 +199,11 @@ def get_default_test_cases():
 
 def run_test_case(case, method='hybrid'):
     """Ejecuta un caso de prueba y retorna resultados"""
-    results = diagnose(case['symptoms'], method)
-    
+    return summarize_test_case(case, diagnose(case['symptoms'], method))
+
+
+def summarize_test_case(case, results):
+    """Ubica el diagnóstico esperado dentro de los resultados de un caso"""
     # Verificar si el diagnóstico esperado está en los resultados
     expected = case['expected_diagnosis']
     found = False
@@ -250,9 +234,10 @@ def evaluate_test_cases(cases, method='hybrid'):
     top3_hits = 0
     
     detailed_results = []
+    batch_results = diagnose_batch([case['symptoms'] for case in cases], method)
     
-    for case in cases:
-        result = run_test_case(case, method)
+    for case, results in zip(cases, batch_results):
+        result = summarize_test_case(case, results)
         detailed_results.append(result)
         
         if result['expected_found']:
@@ -362,11 +347,14 @@ def main():
             
             method = st.radio(
                 "Método de inferencia:",
-                ['hybrid', 'forward', 'rules'],
+                ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
                 format_func=lambda x: {
                     'hybrid': 'Híbrido',
                     'forward': 'Encadenamiento Adelante',
-                    'rules': 'Basado en Reglas'
+                    'rules': 'Basado en Reglas',
+                    'bayes': 'Naive Bayes',
+                    'noisy_or': 'Noisy-OR',
+                    'fuzzy': 'Difuso'
                 }[x]
             )
             
@@ -396,12 +384,15 @@ def main():
         
         method = st.radio(
             "Método para evaluación:",
-            ['hybrid', 'forward', 'rules'],
+            ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
             key='eval_method',
             format_func=lambda x: {
                 'hybrid': 'Híbrido',
                 'forward': 'Encadenamiento Adelante',
-                'rules': 'Basado en Reglas'
+                'rules': 'Basado en Reglas',
+                'bayes': 'Naive Bayes',
+                'noisy_or': 'Noisy-OR',
+                'fuzzy': 'Difuso'
             }[x]
         )
         
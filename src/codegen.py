@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+codegen.py
+Generación de código Python a partir del conjunto de reglas compilado
+Cada regla se traduce a pruebas de bitmask en línea, agrupadas por su
+síntoma disparador; los refinamientos se anidan dentro de su regla general
+(DAG de subsunción) y solo prueban los requeridos que agregan.
+El módulo generado del conjunto de reglas del dataset se guarda en
+data/cache con la firma en el nombre (solo el vigente: los anteriores se
+borran) y se importa en lugar de interpretar las reglas en cada consulta;
+es legible para depurar una regla. Los demás conjuntos viven en memoria.
+"""
+
+import glob
+import hashlib
+import importlib.util
+import os
+import types
+
+from snapshot import CACHE_DIR, write_atomic
+
+# Cambiar al modificar el código generado
+CODEGEN_FORMAT = 2
+
+# Módulos ya importados por firma
+_modules = {}
+
+
+def rule_set_signature(rule_set):
+    """Hash de todo lo que determina el código generado"""
+    digest = hashlib.sha256(f"codegen:{CODEGEN_FORMAT};".encode())
+    digest.update(repr(rule_set.always).encode())
+    for rule in rule_set.rules:
+        digest.update(repr((rule.position, rule.id, rule.conclusion,
+                            rule.required, rule.trigger, rule.anchor)).encode())
+    return digest.hexdigest()
+
+
+def generate_source(rule_set, signature=None):
+    """Código fuente del módulo con la función match(q) del conjunto de reglas"""
+    signature = signature or rule_set_signature(rule_set)
+    lines = [
+        '# -*- coding: utf-8 -*-',
+        '"""',
+        'Reglas compiladas a código (generado por codegen.py, no editar)',
+        f'Firma: {signature}',
+        '"""',
+        '',
+        f'SIGNATURE = {signature!r}',
+        '',
+        '',
+        'def match(q):',
+        '    """Posiciones (en orden) de las reglas cuyos requeridos están en q"""',
+        f'    m = {list(rule_set.always)!r}',
+    ]
+    for trigger in sorted(rule_set.triggers):
+        trigger_bit = 1 << trigger
+        lines.append(f'    if q & {trigger_bit:#x}:  # {rule_set.decode(trigger_bit)[0]!r}')
+        for position in rule_set.triggers[trigger]:
+            _emit_rule(lines, rule_set, position, rule_set.rules[position].required & ~trigger_bit, 2)
+    lines += ['    m.sort()', '    return m', '']
+    return '\n'.join(lines)
+
+
+def _emit_rule(lines, rule_set, position, test, depth):
+    """Prueba de una regla y, dentro, la de sus refinamientos"""
+    rule = rule_set.rules[position]
+    indent = '    ' * depth
+    comment = f'  # {rule.id!r} -> {rule.conclusion!r}'
+    if test:
+        lines.append(f'{indent}if q & {test:#x} == {test:#x}:{comment}')
+        indent += '    '
+        depth += 1
+        comment = ''
+    lines.append(f'{indent}m.append({position}){comment}')
+    for child in rule_set.refinements[position]:
+        _emit_rule(lines, rule_set, child, rule_set.rules[child].delta, depth)
+
+
+def _import_file(path, name):
+    """Importa un módulo desde archivo; None si no existe o no es válido"""
+    if not os.path.exists(path):
+        return None
+    try:
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    except (OSError, SyntaxError):
+        return None
+    return module
+
+
+def _prune(cache_dir, keep):
+    """Borra los módulos generados (y su bytecode) de otros conjuntos de reglas"""
+    for pattern in ('rules_*.py', os.path.join('__pycache__', 'rules_*.pyc')):
+        for path in glob.glob(os.path.join(cache_dir, pattern)):
+            if not os.path.basename(path).startswith(f"{keep}."):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+def load_matcher(rule_set, cache_dir=CACHE_DIR, persist=True):
+    """
+    Módulo generado para el conjunto de reglas. Con persist reutiliza el
+    archivo en caché si su firma coincide; si no, lo genera, lo guarda y
+    borra los de otros conjuntos (sin caché escribible, o sin persist, el
+    código vive solo en memoria).
+    """
+    signature = rule_set_signature(rule_set)
+    module = _modules.get(signature)
+    if module is not None:
+        return module
+
+    name = f"rules_{signature[:16]}"
+    path = os.path.join(cache_dir, f"{name}.py")
+    module = _import_file(path, name) if persist else None
+    if module is None or getattr(module, 'SIGNATURE', None) != signature:
+        # Recién generado se compila en memoria; las próximas cargas importan el archivo
+        source = generate_source(rule_set, signature)
+        if persist:
+            write_atomic(path, source)
+            _prune(cache_dir, name)
+        module = types.ModuleType(name)
+        module.__file__ = path
+        exec(compile(source, path, 'exec'), module.__dict__)
+
+    _modules[signature] = module
+    return module
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+comorbidity.py
+Explicaciones multi-enfermedad (comorbilidad) por ramificación y poda
+Busca los conjuntos de hasta k enfermedades que mejor explican juntos los
+síntomas del usuario: pocos síntomas sin explicar y pocos síntomas
+principales faltantes. La búsqueda recorre combinaciones sobre los bitsets
+de la KB compilada y poda con cotas inferiores admisibles del costo.
+"""
+
+import heapq
+
+from knowledge_base import popcount
+
+# Costo de cada síntoma principal faltante de una enfermedad del conjunto
+MISSING_WEIGHT = 0.5
+# Costo por enfermedad agregada (prefiere explicaciones parsimoniosas)
+SIZE_PENALTY = 0.5
+
+
+def explanation_cost(compiled_kb, query, diseases):
+    """
+    Costo de un conjunto de enfermedades (índices de la KB compilada):
+    síntomas sin explicar + MISSING_WEIGHT·principales faltantes +
+    SIZE_PENALTY·tamaño
+    """
+    covered = 0
+    cost = 0.0
+    for idx in diseases:
+        covered |= compiled_kb.all_masks[idx]
+        cost += MISSING_WEIGHT * popcount(compiled_kb.main_masks[idx] & ~query) + SIZE_PENALTY
+    return cost + popcount(query & ~covered)
+
+
+def _best_gain(uncovered, masks, penalties, start, budget):
+    """
+    Cota de la mayor reducción de costo al agregar hasta budget enfermedades
+    desde start: suma de las budget mejores (cobertura nueva - costo propio)
+    """
+    if budget <= 0:
+        return 0
+    gains = []
+    for j in range(start, len(masks)):
+        gain = popcount(uncovered & masks[j]) - penalties[j]
+        if gain > 0:
+            gains.append(gain)
+    return sum(heapq.nlargest(budget, gains))
+
+
+def search_explanations(compiled_kb, query, max_size=2, top_n=5):
+    """
+    Los top_n conjuntos de hasta max_size enfermedades de menor costo,
+    como lista de (costo, índices ordenados), de menor a mayor costo.
+    Solo participan las enfermedades con algún síntoma de la consulta:
+    agregar otra solo suma costo.
+    """
+    if not query or max_size <= 0 or top_n <= 0:
+        return []
+
+    # Primero las que más cubren: buenas soluciones temprano, más poda
+    order = sorted(compiled_kb.candidates(query),
+                   key=lambda idx: (-popcount(query & compiled_kb.all_masks[idx]), idx))
+    masks = [query & compiled_kb.all_masks[idx] for idx in order]
+    penalties = [MISSING_WEIGHT * popcount(compiled_kb.main_masks[idx] & ~query) + SIZE_PENALTY
+                 for idx in order]
+    # Unión de las coberturas desde cada posición
+    suffix_union = [0] * (len(order) + 1)
+    for j in range(len(order) - 1, -1, -1):
+        suffix_union[j] = suffix_union[j + 1] | masks[j]
+
+    # Heap de los mejores: (-costo, -tamaño, índices negados) -> la raíz es el peor
+    best = []
+
+    def worst_cost():
+        return -best[0][0] if len(best) >= top_n else float('inf')
+
+    def visit(start, chosen, uncovered, cost):
+        budget = max_size - len(chosen)
+        for j in range(start, len(order)):
+            child_uncovered = uncovered & ~masks[j]
+            child_cost = cost + penalties[j]
+            # Cota inferior del subárbol que agrega la enfermedad j
+            remaining = popcount(child_uncovered)
+            bound = child_cost + max(
+                popcount(child_uncovered & ~suffix_union[j + 1]),
+                remaining - _best_gain(child_uncovered, masks, penalties, j + 1, budget - 1)
+            )
+            if bound > worst_cost():
+                continue
+
+            child = chosen + [order[j]]
+            total = child_cost + remaining
+            key = (-total, -len(child), [-idx for idx in sorted(child)])
+            if len(best) < top_n:
+                heapq.heappush(best, key)
+            elif key > best[0]:
+                heapq.heapreplace(best, key)
+            if budget > 1:
+                visit(j + 1, child, child_uncovered, child_cost)
+
+    visit(0, [], query, 0.0)
+    ranked = sorted(best, reverse=True)
+    return [(-total, sorted(-idx for idx in negated)) for total, _, negated in ranked]
@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+"""
+fuzzy.py
+Inferencia difusa con intensidades de síntomas en [0, 1]
+Cada enfermedad y cada regla recibe un grado de pertenencia: t-norma (min)
+sobre sus síntomas requeridos (principales de la KB, requeridos de la regla)
+y s-norma (max) sobre los opcionales (secundarios, opcionales de la regla).
+Los grados se calculan para todas las enfermedades y reglas a la vez con
+reducciones de NumPy sobre las coordenadas de la KB compilada.
+"""
+
+from collections.abc import Mapping
+
+import numpy as np
+
+from rules import OPTIONAL_BONUS, MAX_RULE_CONFIDENCE
+
+# Bonificación máxima por opcionales, la misma de las reglas IF-THEN
+FUZZY_OPTIONAL_BONUS = OPTIONAL_BONUS
+
+
+class MembershipGroups:
+    """
+    Conjuntos de síntomas por fila (enfermedad o regla) como columnas
+    concatenadas; reduce() aplica una t-norma o s-norma a cada conjunto
+    """
+
+    def __init__(self, masks, ids):
+        rows, cols = [], []
+        for row, mask in enumerate(masks):
+            symptom_ids = ids(mask)
+            rows += [row] * len(symptom_ids)
+            cols += symptom_ids
+        rows = np.array(rows, dtype=np.intp)
+        self.num_rows = len(masks)
+        self.cols = np.array(cols, dtype=np.intp)
+        # Inicio de cada fila no vacía dentro de cols, y su fila
+        self.starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]]) if len(rows) else rows
+        self.rows = rows[self.starts]
+        self.sizes = np.bincount(rows, minlength=self.num_rows)
+
+    def reduce(self, norm, intensities, empty):
+        """Grado (consultas x filas) de cada conjunto; empty para los vacíos"""
+        degrees = np.full((intensities.shape[0], self.num_rows), empty, dtype=np.float64)
+        if len(self.cols):
+            degrees[:, self.rows] = norm.reduceat(intensities[:, self.cols], self.starts, axis=1)
+        return degrees
+
+
+class FuzzyScorer:
+    """
+    Grupos de síntomas de la KB y de las reglas de diagnóstico, en el
+    espacio de IDs del conjunto de reglas (KB + síntomas propios de reglas).
+    Un solo nivel, como CompiledRuleSet.infer: los hechos intermedios solo
+    cuentan si se dan con intensidad.
+    """
+
+    def __init__(self, compiled_kb, rule_set):
+        self.compiled_kb = compiled_kb
+        self.rule_set = rule_set
+        self.num_symptoms = compiled_kb.num_symptoms + len(rule_set.extra_names)
+        ids = compiled_kb.ids
+
+        self.disease_required = MembershipGroups(compiled_kb.main_masks, ids)
+        self.disease_optional = MembershipGroups(
+            [all_mask & ~main_mask for all_mask, main_mask in zip(compiled_kb.all_masks, compiled_kb.main_masks)],
+            ids
+        )
+
+        rules = [rule for rule in rule_set.rules if not rule.is_fact]
+        self.rules = tuple(rules)
+        self.rule_required = MembershipGroups([rule.required for rule in rules], ids)
+        self.rule_optional = MembershipGroups([rule.optional for rule in rules], ids)
+        self.rule_confidence = np.array([rule.confidence for rule in rules], dtype=np.float64)
+        # Índice en la KB de la conclusión de cada regla (-1 si no está)
+        self.rule_disease = np.array([compiled_kb.disease_index.get(rule.conclusion, -1) for rule in rules],
+                                     dtype=np.intp)
+
+        # Pares (síntoma, ancestro) del cierre de la jerarquía es-un
+        pairs = [(symptom_id, ancestor_id)
+                 for symptom_id in ids(compiled_kb.hierarchy_mask)
+                 for ancestor_id in ids(compiled_kb.ancestor_masks[symptom_id] & ~(1 << symptom_id))]
+        self.hierarchy_children = np.array([child for child, _ in pairs], dtype=np.intp)
+        self.hierarchy_ancestors = np.array([ancestor for _, ancestor in pairs], dtype=np.intp)
+
+    def intensity_matrix(self, symptom_sets, hierarchy=False):
+        """
+        Matriz (consultas x síntomas) de intensidades. Cada consulta es un
+        dict síntoma -> intensidad en [0, 1] o una lista de síntomas
+        (intensidad 1); los síntomas desconocidos se ignoran. Con
+        hierarchy, cada ancestro toma la mayor intensidad de sus descendientes.
+        """
+        known = self.compiled_kb.symptom_ids
+        extra = self.rule_set.extra_ids
+        matrix = np.zeros((len(symptom_sets), self.num_symptoms), dtype=np.float64)
+        for row, symptoms in enumerate(symptom_sets):
+            items = symptoms.items() if isinstance(symptoms, Mapping) else ((s, 1.0) for s in symptoms)
+            for symptom, intensity in items:
+                intensity = float(intensity)
+                if not 0.0 <= intensity <= 1.0:
+                    raise ValueError(f"Intensidad fuera de [0, 1] para {symptom!r}: {intensity}")
+                symptom_id = known.get(symptom, extra.get(symptom))
+                if symptom_id is not None:
+                    matrix[row, symptom_id] = intensity
+        if hierarchy and len(self.hierarchy_children):
+            for row in range(len(matrix)):
+                np.maximum.at(matrix[row], self.hierarchy_ancestors, matrix[row, self.hierarchy_children])
+        return matrix
+
+    def memberships(self, intensities):
+        """
+        Grados (consultas x filas) para una matriz de intensidades:
+        disease = min(principales) · (1 - BONO + BONO · max(secundarios));
+        rule = min(requeridos) · confianza con el bono de la regla, con
+        max(opcionales) en lugar de la fracción de opcionales presentes.
+        Sin secundarios no hay descuento; sin principales el grado es 0.
+        """
+        disease_required = self.disease_required.reduce(np.minimum, intensities, 0.0)
+        disease_optional = self.disease_optional.reduce(np.maximum, intensities, 1.0)
+        rule_required = self.rule_required.reduce(np.minimum, intensities, 1.0)
+        rule_optional = self.rule_optional.reduce(np.maximum, intensities, 0.0)
+
+        # rule_confidence de rules.py, vectorizada sobre todas las reglas
+        rule_confidence = np.where(
+            self.rule_optional.sizes > 0,
+            np.minimum(self.rule_confidence + rule_optional * OPTIONAL_BONUS, MAX_RULE_CONFIDENCE),
+            self.rule_confidence
+        )
+        return {
+            'disease_required': disease_required,
+            'disease_optional': disease_optional,
+            'disease': disease_required * (1 - FUZZY_OPTIONAL_BONUS + FUZZY_OPTIONAL_BONUS * disease_optional),
+            'rule_required': rule_required,
+            'rule_optional': rule_optional,
+            'rule': rule_required * rule_confidence,
+        }
+
+    def disease_scores(self, memberships):
+        """
+        Grado final por enfermedad de la KB: s-norma (max) entre su grado
+        propio y el de las reglas que la concluyen
+        """
+        scores = memberships['disease'].copy()
+        in_kb = self.rule_disease >= 0
+        for row in range(scores.shape[0]):
+            np.maximum.at(scores[row], self.rule_disease[in_kb], memberships['rule'][row, in_kb])
+        return scores
+
+
+def build_fuzzy_scorer(compiled_kb, rule_set):
+    """Compila los grupos de la inferencia difusa"""
+    return FuzzyScorer(compiled_kb, rule_set)
@@ -6,18 +6,215 @@ Implementa encadenamiento hacia adelante y hacia atrás
 """
 
 import streamlit as st
-from knowledge_base import get_knowledge_base, create_simple_rules
+from knowledge_base import (
+    get_knowledge_base,
+    get_rules,
+    get_compiled_knowledge_base,
+    freeze_knowledge_base,
+    freeze_rules,
+    popcount
+)
+from rules import compile_rules
+from rete import build_network
+from prover import build_prover
+from triage import build_triage
+from fuzzy import build_fuzzy_scorer
+from comorbidity import search_explanations
+from snapshot import get_data_version
 from collections import defaultdict
+from collections.abc import Mapping
+import heapq
 import math
+import threading
+import numpy as np
+
+# Con KB de este tamaño o mayor, el backend 'auto' usa NumPy
+VECTORIZE_MIN_DISEASES = 256
+
+# Holgura de las cotas superiores frente al redondeo de punto flotante
+BOUND_EPSILON = 1e-9
+
+# Modelos probabilísticos, con sus matrices en la KB compilada (model_matrices)
+PROBABILISTIC_MODELS = ('bayes', 'noisy_or')
+
+# Score mínimo para listar una enfermedad (coincidencia, reglas o combinado)
+MIN_CONFIDENCE = 0.2
+
+# Posterior mínima para listar una enfermedad en los métodos probabilísticos
+MIN_POSTERIOR = 0.001
+
+# Fracción del score que pierde una enfermedad si todos sus síntomas
+# principales están confirmados ausentes (proporcional a los ausentes)
+ABSENT_MAIN_PENALTY = 0.5
+
+
+def select_top_k(candidates, top_k, evaluate):
+    """
+    Selección top-k con poda por cota superior.
+    candidates: lista de (cota, candidato); evaluate(candidato) retorna
+    None o (clave, item), con clave única cuyo primer elemento es el score.
+    Los candidatos se evalúan por cota decreciente y se descartan en cuanto
+    su cota no alcanza al peor elemento del heap. Retorna los items en el
+    mismo orden que un ordenamiento completo por clave descendente.
+    """
+    if top_k <= 0:
+        return []
+    
+    heap = []
+    for bound, candidate in sorted(candidates, key=lambda c: c[0], reverse=True):
+        if len(heap) >= top_k and bound + BOUND_EPSILON < heap[0][0][0]:
+            break
+        scored = evaluate(candidate)
+        if scored is None:
+            continue
+        if len(heap) < top_k:
+            heapq.heappush(heap, scored)
+        elif scored[0] > heap[0][0]:
+            heapq.heapreplace(heap, scored)
+    
+    return [item for _, item in sorted(heap, key=lambda entry: entry[0], reverse=True)]
+
+
+class DiagnosisResult(Mapping):
+    """
+    Resultado de diagnóstico compacto (__slots__). Guarda el ID de la
+    enfermedad, los scores y los síntomas coincidentes como bitset; la
+    descripción, categoría, severidad y recomendaciones se resuelven desde
+    la KB solo al accederlas. Se usa como un dict de solo lectura.
+    """
+    
+    __slots__ = ('_engine', 'kind', 'disease', 'disease_id', 'confidence',
+                 'forward_confidence', 'rule_confidence', 'method', 'matched', 'main_matched')
+    
+    # Claves expuestas según el método que produjo el resultado
+    KEYS = {
+        'forward': ('disease', 'confidence', 'matched_symptoms', 'main_matches',
+                    'category', 'severity', 'description', 'recommendations'),
+        'rules': ('disease', 'confidence', 'matched_symptoms',
+                  'category', 'severity', 'description', 'recommendations'),
+        'hybrid': ('disease', 'forward_confidence', 'rule_confidence', 'final_confidence',
+                   'matched_symptoms', 'category', 'severity', 'description',
+                   'recommendations', 'method'),
+        'bayes': ('disease', 'confidence', 'matched_symptoms',
+                  'category', 'severity', 'description', 'recommendations'),
+        'noisy_or': ('disease', 'confidence', 'matched_symptoms',
+                     'category', 'severity', 'description', 'recommendations'),
+        'fuzzy': ('disease', 'confidence', 'matched_symptoms',
+                  'category', 'severity', 'description', 'recommendations'),
+    }
+    
+    # Valores para conclusiones de reglas que no están en la KB
+    DEFAULTS = {'category': 'Desconocida', 'severity': 'moderada', 'description': '', 'recommendations': ()}
+    
+    def __init__(self, engine, kind, disease, confidence, matched, main_matched=0,
+                 forward_confidence=0, rule_confidence=0, method=None):
+        self._engine = engine
+        self.kind = kind
+        self.disease = disease
+        self.disease_id = engine.compiled.disease_index.get(disease)
+        self.confidence = confidence
+        # Bitset de IDs, o tupla de nombres si algún síntoma no está internado
+        self.matched = matched
+        self.main_matched = main_matched
+        self.forward_confidence = forward_confidence
+        self.rule_confidence = rule_confidence
+        self.method = method
+    
+    def _symptoms(self, matched):
+        if isinstance(matched, tuple):
+            return list(matched)
+        return self._engine.compiled.decode(matched)
+    
+    def __getitem__(self, key):
+        if key not in self.KEYS[self.kind]:
+            raise KeyError(key)
+        if key == 'disease':
+            return self.disease
+        if key in ('confidence', 'final_confidence'):
+            return self.confidence
+        if key == 'forward_confidence':
+            return self.forward_confidence
+        if key == 'rule_confidence':
+            return self.rule_confidence
+        if key == 'method':
+            return self.method
+        if key == 'matched_symptoms':
+            return self._symptoms(self.matched)
+        if key == 'main_matches':
+            return self._symptoms(self.main_matched)
+        
+        # Campos descriptivos: se leen de la KB al accederlos
+        if self.disease_id is None:
+            value = self.DEFAULTS[key]
+        else:
+            value = self._engine.knowledge_base[self.disease][key]
+        return list(value) if key == 'recommendations' else value
+    
+    def __iter__(self):
+        return iter(self.KEYS[self.kind])
+    
+    def __len__(self):
+        return len(self.KEYS[self.kind])
+    
+    def __reduce__(self):
+        # Al serializar se materializa como dict (sin arrastrar el motor)
+        return dict, (dict(self),)
+    
+    def __repr__(self):
+        return f"DiagnosisResult({dict(self)!r})"
 
 
 class InferenceEngine:
     """Motor de inferencia con múltiples estrategias de razonamiento"""
     
-    def __init__(self):
+    def __init__(self, backend='auto', frozen=False, rules=None, hierarchy=False):
+        """
+        backend: 'python' (bitsets), 'numpy' (matrices vectorizadas) o
+        'auto' (NumPy a partir de VECTORIZE_MIN_DISEASES enfermedades)
+        frozen: congela la KB y las reglas (mapping proxies y tuplas) para
+        que una misma instancia atienda diagnósticos concurrentes sin locks
+        rules: reglas IF-THEN a usar (por defecto, las de rules_knowledge.csv,
+        compartidas e inmutables; para modificarlas pasar create_simple_rules())
+        hierarchy: expande cada consulta con los ancestros de sus síntomas
+        en la jerarquía es-un (symptom_hierarchy.csv), p. ej. 'Fiebre alta'
+        cumple un requisito de 'Fiebre'. Desactivado: coincidencia exacta
+        """
         self.knowledge_base = get_knowledge_base()
-        self.rules = create_simple_rules()
-        self.diagnosis_results = []
+        self.frozen = frozen
+        if frozen:
+            self.knowledge_base = freeze_knowledge_base(self.knowledge_base)
+        if rules is None:
+            self.rules, self.rule_set, self.network, self.prover = get_compiled_rules()
+            # La KB compilada de las reglas: un solo espacio de IDs aunque
+            # la versión de los datos cambie entre las dos consultas
+            self.compiled = self.rule_set.compiled_kb
+        else:
+            self.compiled = get_compiled_knowledge_base()
+        if backend == 'auto':
+            backend = 'numpy' if self.compiled.num_diseases >= VECTORIZE_MIN_DISEASES else 'python'
+        if backend not in ('python', 'numpy'):
+            raise ValueError(f"Backend desconocido: {backend}")
+        self.backend = backend
+        self.hierarchy = hierarchy
+        if rules is None:
+            self.triage_tier = build_triage(self.knowledge_base, self.compiled, self.rule_set)
+            self.fuzzy_scorer = build_fuzzy_scorer(self.compiled, self.rule_set)
+        else:
+            self.rules = freeze_rules(rules) if frozen else rules
+            self.compile_rules()
+    
+    def compile_rules(self):
+        """
+        Compila las reglas a bitsets con índice de disparadores, a la red
+        Rete, al índice por conclusión del encadenamiento hacia atrás, al
+        nivel de triaje y a los grupos de la inferencia difusa. En un motor
+        no congelado debe llamarse de nuevo tras modificar self.rules.
+        """
+        self.rule_set = compile_rules(self.rules, self.compiled)
+        self.network = build_network(self.rules)
+        self.prover = build_prover(self.rules)
+        self.triage_tier = build_triage(self.knowledge_base, self.compiled, self.rule_set)
+        self.fuzzy_scorer = build_fuzzy_scorer(self.compiled, self.rule_set)
         
     def calculate_match_score(self, user_symptoms, disease_symptoms):
         """Calcula score de coincidencia entre síntomas del usuario y enfermedad"""
@@ -25,8 +222,13 @@ class InferenceEngine:
             return 0.0
         
         matches = len(set(user_symptoms) & set(disease_symptoms))
-        total_disease = len(disease_symptoms)
-        total_user = len(user_symptoms)
+        return self.f1_from_counts(matches, len(user_symptoms), len(disease_symptoms))
+    
+    @staticmethod
+    def f1_from_counts(matches, total_user, total_disease):
+        """F1 entre síntomas del usuario y de la enfermedad a partir de conteos"""
+        if not total_disease:
+            return 0.0
         
         # Precisión y recall
         precision = matches / total_user if total_user > 0 else 0
@@ -40,163 +242,708 @@ class InferenceEngine:
         
         return f1_score
     
-    def forward_chaining(self, user_symptoms):
-        """Encadenamiento hacia adelante - De síntomas a diagnóstico"""
+    @classmethod
+    def combined_score(cls, main_matches, main_count, all_matches, total_user, all_count):
+        """Score combinado a partir de conteos: 70% principales presentes, 30% F1 general"""
+        main_score = main_matches / main_count if main_count else 0
+        return (main_score * 0.7) + (cls.f1_from_counts(all_matches, total_user, all_count) * 0.3)
+    
+    def _encode_query(self, user_symptoms):
+        """
+        (bitset, cantidad de síntomas) de una consulta. Con jerarquía, el
+        bitset incluye los ancestros y la cantidad suma los agregados: igual
+        que diagnosticar la lista de síntomas con sus ancestros
+        """
+        query = self.compiled.encode(user_symptoms)
+        if not self.hierarchy:
+            return query, len(user_symptoms)
+        expanded = self.compiled.expand(query)
+        return expanded, len(user_symptoms) + popcount(expanded & ~query)
+    
+    def _encode(self, user_symptoms):
+        """Bitset de una consulta (expandido con la jerarquía si está activa)"""
+        return self._encode_query(user_symptoms)[0]
+    
+    def _encode_rules(self, user_symptoms):
+        """Bitset de una consulta en el espacio de IDs de las reglas"""
+        query = self.rule_set.encode(user_symptoms)
+        return self.compiled.expand(query) if self.hierarchy else query
+    
+    def _expand_names(self, user_symptoms):
+        """Síntomas de la consulta más sus ancestros (para la red Rete y el prover)"""
+        if not self.hierarchy:
+            return user_symptoms
+        compiled = self.compiled
+        return list(dict.fromkeys(list(user_symptoms) + compiled.decode(compiled.expand(compiled.encode(user_symptoms)))))
+    
+    def _encode_absent(self, absent_symptoms, query):
+        """Bitset de síntomas confirmados ausentes; un síntoma presente no cuenta como ausente"""
+        if not absent_symptoms:
+            return 0
+        return self.compiled.encode(absent_symptoms) & ~query
+    
+    def _absent_factor(self, idx, absent):
+        """Factor de penalización por principales confirmados ausentes de la enfermedad idx"""
+        main_count = self.compiled.main_counts[idx]
+        if not absent or not main_count:
+            return 1.0
+        return 1 - ABSENT_MAIN_PENALTY * popcount(absent & self.compiled.main_masks[idx]) / main_count
+    
+    def forward_chaining(self, user_symptoms, top_k=None, absent_symptoms=None):
+        """
+        Encadenamiento hacia adelante - De síntomas a diagnóstico.
+        Con top_k solo se retornan los top_k mejores, podando por cota.
+        absent_symptoms: síntomas confirmados ausentes; cada principal
+        ausente resta una parte del score (ABSENT_MAIN_PENALTY)
+        """
+        if top_k is not None:
+            return self._forward_top_k(user_symptoms, top_k, absent_symptoms)
+        if self.backend == 'numpy':
+            return self.forward_chaining_vectorized(user_symptoms, absent_symptoms)
+        
         results = []
+        compiled = self.compiled
+        query, total_user = self._encode_query(user_symptoms)
+        absent = self._encode_absent(absent_symptoms, query)
         
-        for disease_name, disease_info in self.knowledge_base.items():
-            # Síntomas principales
-            main_symptoms = disease_info['symptoms_main']
-            # Todos los síntomas
-            all_symptoms = disease_info['symptoms_all']
-            
-            # Calcular coincidencias
-            main_matches = set(user_symptoms) & set(main_symptoms)
-            all_matches = set(user_symptoms) & set(all_symptoms)
-            
-            # Score basado en síntomas principales
-            main_score = len(main_matches) / len(main_symptoms) if main_symptoms else 0
-            
-            # Score general
-            overall_score = self.calculate_match_score(user_symptoms, all_symptoms)
-            
-            # Peso combinado (70% principales, 30% general)
-            combined_score = (main_score * 0.7) + (overall_score * 0.3)
-            
-            if combined_score > 0.2:  # Umbral mínimo
-                results.append({
-                    'disease': disease_name,
-                    'confidence': combined_score,
-                    'matched_symptoms': list(all_matches),
-                    'main_matches': list(main_matches),
-                    'category': disease_info['category'],
-                    'severity': disease_info['severity'],
-                    'description': disease_info['description'],
-                    'recommendations': disease_info['recommendations']
-                })
+        # Solo se puntúan las enfermedades con algún síntoma en común
+        for idx in compiled.candidates(query):
+            combined_score = self._forward_score(idx, query, total_user, absent)
+            if combined_score > MIN_CONFIDENCE:
+                results.append(self._forward_result(idx, combined_score, query))
         
         # Ordenar por confianza
         results.sort(key=lambda x: x['confidence'], reverse=True)
         return results
     
-    def backward_chaining(self, user_symptoms, hypothesis_disease):
-        """Encadenamiento hacia atrás - Verifica una hipótesis"""
+    def _forward_score(self, idx, query, total_user, absent=0):
+        """Score combinado de la enfermedad idx (coincidencias por AND + popcount)"""
+        compiled = self.compiled
+        score = self.combined_score(popcount(query & compiled.main_masks[idx]), compiled.main_counts[idx],
+                                    popcount(query & compiled.all_masks[idx]), total_user, compiled.all_counts[idx])
+        return score * self._absent_factor(idx, absent)
+    
+    def _forward_bounds(self, query, total_user, absent=0):
+        """
+        Cotas superiores del score de cada candidata: {idx: (cota, score)}.
+        Con bitsets la cota sale solo de los principales (el F1 se acota
+        suponiendo que todos los secundarios coinciden) y el score queda
+        en None; con NumPy los scores exactos ya sirven de cota.
+        """
+        compiled = self.compiled
+        if self.backend == 'numpy':
+            absent_matrix = compiled.query_vector(absent)[None, :] if absent else None
+            scores = self._forward_scores(compiled.query_vector(query)[None, :], [total_user], absent_matrix)[0]
+            return {idx: (float(scores[idx]), float(scores[idx])) for idx in np.flatnonzero(scores).tolist()}
+        
+        bounds = {}
+        for idx in compiled.candidates(query):
+            main_count = compiled.main_counts[idx]
+            all_count = compiled.all_counts[idx]
+            main_matches = popcount(query & compiled.main_masks[idx])
+            max_matches = min(total_user, main_matches + all_count - main_count)
+            bound = self.combined_score(main_matches, main_count, max_matches, total_user, all_count)
+            bounds[idx] = (bound * self._absent_factor(idx, absent), None)
+        return bounds
+    
+    def _forward_top_k(self, user_symptoms, top_k, absent_symptoms=None):
+        """Top-k del encadenamiento hacia adelante con poda por cota superior"""
+        query, total_user = self._encode_query(user_symptoms)
+        absent = self._encode_absent(absent_symptoms, query)
+        bounds = self._forward_bounds(query, total_user, absent)
+        
+        def evaluate(idx):
+            score = bounds[idx][1]
+            if score is None:
+                score = self._forward_score(idx, query, total_user, absent)
+            if score > MIN_CONFIDENCE:
+                return (score, -idx), (idx, score)
+            return None
+        
+        candidates = [(bound, idx) for idx, (bound, _) in bounds.items() if bound + BOUND_EPSILON > MIN_CONFIDENCE]
+        return [self._forward_result(idx, score, query)
+                for idx, score in select_top_k(candidates, top_k, evaluate)]
+    
+    def forward_chaining_vectorized(self, user_symptoms, absent_symptoms=None):
+        """
+        Encadenamiento hacia adelante vectorizado: un producto
+        matriz-vector por tipo de síntoma calcula los scores de todas las
+        enfermedades a la vez
+        """
+        compiled = self.compiled
+        query, total_user = self._encode_query(user_symptoms)
+        absent = self._encode_absent(absent_symptoms, query)
+        absent_matrix = compiled.query_vector(absent)[None, :] if absent else None
+        scores = self._forward_scores(compiled.query_vector(query)[None, :], [total_user], absent_matrix)[0]
+        
+        selected = np.flatnonzero(scores > MIN_CONFIDENCE)
+        order = selected[np.argsort(-scores[selected], kind='stable')]
+        return [self._forward_result(idx, float(scores[idx]), query) for idx in order.tolist()]
+    
+    def _forward_scores(self, query_matrix, total_users, absent_matrix=None):
+        """
+        Scores combinados (consultas x enfermedades) con las mismas
+        operaciones que la versión escalar: 70% principales + 30% F1,
+        penalizados por los principales de absent_matrix
+        """
+        matrices = self.compiled.matrices
+        main_hits = (query_matrix @ matrices['main'].T).astype(np.float64)
+        all_hits = (query_matrix @ matrices['all'].T).astype(np.float64)
+        main_counts = matrices['main_counts']
+        all_counts = matrices['all_counts']
+        total_users = np.asarray(total_users, dtype=np.float64)[:, None]
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            main_score = np.where(main_counts > 0, main_hits / main_counts, 0.0)
+            precision = np.where(total_users > 0, all_hits / total_users, 0.0)
+            recall = np.where(all_counts > 0, all_hits / all_counts, 0.0)
+            f1_score = np.where(precision + recall > 0,
+                                2 * (precision * recall) / (precision + recall), 0.0)
+            scores = (main_score * 0.7) + (f1_score * 0.3)
+            if absent_matrix is not None:
+                absent_hits = (absent_matrix @ matrices['main'].T).astype(np.float64)
+                scores *= 1 - ABSENT_MAIN_PENALTY * np.where(main_counts > 0, absent_hits / main_counts, 0.0)
+        
+        return scores
+    
+    def _forward_result(self, idx, confidence, query):
+        """Resultado de encadenamiento hacia adelante para la enfermedad idx"""
+        compiled = self.compiled
+        return DiagnosisResult(
+            self, 'forward', compiled.disease_names[idx], confidence,
+            matched=query & compiled.all_masks[idx],
+            main_matched=query & compiled.main_masks[idx]
+        )
+    
+    def bayes_inference(self, user_symptoms, top_k=None):
+        """
+        Naive Bayes (Bernoulli) sobre la matriz de log-verosimilitudes de la
+        KB, con prior uniforme: los síntomas no marcados cuentan como
+        ausentes. La log-verosimilitud de cada enfermedad es una suma sobre
+        las columnas de la consulta; confidence es la posterior normalizada
+        sobre toda la KB. Se listan las enfermedades con algún síntoma en
+        común y posterior de al menos MIN_POSTERIOR.
+        """
+        return self._posterior_inference('bayes', user_symptoms, top_k)
+
+    def noisy_or_inference(self, user_symptoms, top_k=None):
+        """
+        Noisy-OR: cada enfermedad causa cada síntoma de su lista con una
+        probabilidad de enlace (principal / secundario) y cualquier síntoma
+        puede aparecer por una causa de fondo (leak):
+        P(s|d) = 1 - (1 - leak)(1 - enlace(d, s)).
+        Ranking por verosimilitud del patrón observado (presentes y
+        ausentes), en espacio logarítmico, como bayes_inference
+        """
+        return self._posterior_inference('noisy_or', user_symptoms, top_k)
+
+    def _posterior_inference(self, kind, user_symptoms, top_k=None):
+        """Log-verosimilitud de un modelo probabilístico: total de ausentes + suma de log-odds de la consulta"""
+        query = self._encode(user_symptoms)
+        if not query:
+            return []
+        log_scores = self._log_scores(kind, query)
+        return self._posterior_results(kind, self._posteriors(log_scores[None, :])[0], query, top_k)
+
+    def _log_scores(self, kind, query):
+        """
+        Log-verosimilitud de cada enfermedad para el bitset de una consulta.
+        Individual y por lotes suman igual (mismas columnas, mismo orden):
+        un producto de matrices redondea distinto y cambia el orden de los empates
+        """
+        matrices = self.compiled.model_matrices(kind)
+        return matrices['log_absent_total'] + matrices['log_odds'][:, self.compiled.ids(query)].sum(axis=1)
+
+    @staticmethod
+    def _posteriors(log_scores):
+        """Softmax por fila de log-verosimilitudes (consultas x enfermedades)"""
+        shifted = np.exp(log_scores - log_scores.max(axis=1, keepdims=True))
+        return shifted / shifted.sum(axis=1, keepdims=True)
+
+    def _posterior_results(self, kind, posterior, query, top_k=None):
+        """Resultados de una fila de posteriores, de mayor a menor"""
+        compiled = self.compiled
+        candidates = np.array(compiled.candidates(query), dtype=np.intp)
+        candidates = candidates[posterior[candidates] >= MIN_POSTERIOR]
+        order = candidates[np.argsort(-posterior[candidates], kind='stable')]
+        if top_k is not None:
+            order = order[:max(top_k, 0)]
+        return [
+            DiagnosisResult(self, kind, compiled.disease_names[idx], float(posterior[idx]),
+                            matched=query & compiled.all_masks[idx])
+            for idx in order.tolist()
+        ]
+
+    def bayes_batch(self, symptom_sets):
+        """Naive Bayes para varios pacientes: un softmax sobre la matriz consultas x enfermedades"""
+        return self._posterior_batch('bayes', symptom_sets)
+
+    def noisy_or_batch(self, symptom_sets):
+        """Noisy-OR para varios pacientes: un softmax sobre la matriz consultas x enfermedades"""
+        return self._posterior_batch('noisy_or', symptom_sets)
+
+    def _posterior_batch(self, kind, symptom_sets):
+        if not symptom_sets:
+            return []
+        queries = [self._encode(symptoms) for symptoms in symptom_sets]
+        posteriors = self._posteriors(np.array([self._log_scores(kind, query) for query in queries]))
+        return [self._posterior_results(kind, posteriors[row], query) if query else []
+                for row, query in enumerate(queries)]
+
+    def fuzzy_memberships(self, intensities):
+        """
+        Grados de pertenencia difusos de todas las enfermedades de la KB y
+        de todas las reglas de diagnóstico (ver fuzzy.py). intensities es
+        un dict síntoma -> intensidad en [0, 1] o una lista de síntomas
+        """
+        scorer = self.fuzzy_scorer
+        memberships = scorer.memberships(scorer.intensity_matrix([intensities], self.hierarchy))
+        return {key: degrees[0] for key, degrees in memberships.items()}
+    
+    def fuzzy_rules(self, intensities):
+        """Reglas con grado mayor que 0, de mayor a menor grado"""
+        memberships = self.fuzzy_memberships(intensities)
+        rules = self.fuzzy_scorer.rules
+        degrees = memberships['rule']
+        fired = np.flatnonzero(degrees > 0)
+        return [
+            {
+                'rule_id': rules[position].id,
+                'conclusion': rules[position].conclusion,
+                'confidence': float(degrees[position]),
+                'strength': float(memberships['rule_required'][position])
+            }
+            for position in fired[np.argsort(-degrees[fired], kind='stable')].tolist()
+        ]
+    
+    def fuzzy_inference(self, intensities, top_k=None):
+        """
+        Inferencia difusa con intensidades de síntomas (leve < 1 < grave):
+        cada enfermedad recibe el máximo entre su grado de pertenencia en la
+        KB y el de las reglas que la concluyen. Con intensidades 0/1
+        equivale a exigir todos los principales o una regla cumplida.
+        """
+        return self.fuzzy_batch([intensities], top_k=top_k)[0]
+    
+    def fuzzy_batch(self, symptom_sets, top_k=None):
+        """Inferencia difusa para varios pacientes con las mismas reducciones"""
+        if not symptom_sets:
+            return []
+        scorer = self.fuzzy_scorer
+        intensities = scorer.intensity_matrix(symptom_sets, self.hierarchy)
+        memberships = scorer.memberships(intensities)
+        scores = scorer.disease_scores(memberships)
+        return [self._fuzzy_results(intensities[row], memberships['rule'][row], scores[row], top_k)
+                for row in range(len(symptom_sets))]
+    
+    def _fuzzy_results(self, intensities, rule_degrees, scores, top_k=None):
+        """Resultados de una consulta difusa, de mayor a menor grado"""
+        compiled = self.compiled
+        scorer = self.fuzzy_scorer
+        query = 0
+        for symptom_id in np.flatnonzero(intensities > 0).tolist():
+            query |= 1 << symptom_id
+        
+        # Síntomas de las reglas disparadas por conclusión; grado de las que no están en la KB
+        rule_masks = {}
+        outside_kb = {}
+        for position in np.flatnonzero(rule_degrees > 0).tolist():
+            rule = scorer.rules[position]
+            rule_masks[rule.conclusion] = rule_masks.get(rule.conclusion, 0) | rule.required | rule.optional
+            if scorer.rule_disease[position] < 0:
+                outside_kb[rule.conclusion] = max(outside_kb.get(rule.conclusion, 0.0), float(rule_degrees[position]))
+        
+        ranked = [(-float(scores[idx]), idx, compiled.disease_names[idx]) for idx in np.flatnonzero(scores > 0).tolist()]
+        ranked += [(-degree, compiled.num_diseases + order, disease)
+                   for order, (disease, degree) in enumerate(outside_kb.items())]
+        ranked.sort()
+        if top_k is not None:
+            ranked = ranked[:max(top_k, 0)]
+        
+        results = []
+        for neg_score, idx, disease in ranked:
+            matched = query & rule_masks.get(disease, 0)
+            if idx < compiled.num_diseases:
+                matched |= query & compiled.all_masks[idx]
+            if matched >> compiled.num_symptoms:
+                matched = tuple(self.rule_set.decode(matched))
+            results.append(DiagnosisResult(self, 'fuzzy', disease, -neg_score, matched))
+        return results
+    
+    def symptom_posterior(self, user_symptoms, absent_symptoms=None):
+        """
+        Distribución a posteriori sobre las enfermedades (orden de la KB)
+        dados los síntomas presentes y los confirmados ausentes: prior
+        uniforme y verosimilitudes del modelo probabilístico de la KB
+        """
+        compiled = self.compiled
+        if not compiled.num_diseases:
+            return np.zeros(0)
+        query = self._encode(user_symptoms)
+        matrices = compiled.model_matrices('bayes')
+        log_posterior = matrices['log_likelihood'][:, compiled.ids(query)].sum(axis=1)
+        absent_ids = compiled.ids(self._encode_absent(absent_symptoms, query))
+        if absent_ids:
+            log_posterior = log_posterior + matrices['log_absent'][:, absent_ids].sum(axis=1)
+        posterior = np.exp(log_posterior - log_posterior.max())
+        return posterior / posterior.sum()
+
+    def next_questions(self, user_symptoms, top_n=3, candidates=None, exclude=(), posterior=None,
+                       absent_symptoms=None):
+        """
+        Siguientes síntomas a preguntar, por ganancia de información esperada
+        sobre el diagnóstico, para todos los síntomas en una pasada:
+        I(s) = H(P(s)) - Σ_d p(d)·H(s|d), con P(s) = Σ_d p(d)·P(s|d).
+        posterior: distribución sobre las enfermedades (por defecto,
+        symptom_posterior); candidates: síntomas elegibles (por defecto,
+        todos); exclude: síntomas ya preguntados; absent_symptoms: respuestas
+        negativas, que entran en el posterior y no se vuelven a preguntar
+        """
+        compiled = self.compiled
+        matrices = compiled.model_matrices('bayes')
+        if posterior is None:
+            posterior = self.symptom_posterior(user_symptoms, absent_symptoms)
+        if not len(posterior):
+            return []
+
+        p_present = posterior @ matrices['likelihood']
+        prior_entropy = -(p_present * np.log(p_present) + (1 - p_present) * np.log1p(-p_present))
+        gain = np.maximum(prior_entropy - posterior @ matrices['likelihood_entropy'], 0)
+
+        eligible = np.zeros(compiled.num_symptoms, dtype=bool)
+        if candidates is None:
+            eligible[:] = True
+        else:
+            eligible[compiled.ids(compiled.encode(candidates))] = True
+        # Ni los ya marcados ni los que implican (sus ancestros, con jerarquía) ni los ya preguntados
+        asked = compiled.encode(exclude) | compiled.encode(absent_symptoms or ())
+        eligible[compiled.ids(self._encode(user_symptoms) | asked)] = False
+        eligible_ids = np.flatnonzero(eligible)
+
+        count = min(top_n, len(eligible_ids))
+        if count <= 0:
+            return []
+        eligible_gain = gain[eligible_ids]
+        top = np.argpartition(-eligible_gain, count - 1)[:count]
+        # Mayor ganancia primero; empates por ID de síntoma
+        top = top[np.lexsort((eligible_ids[top], -eligible_gain[top]))]
+        return [
+            {
+                'symptom': compiled.symptom_names[eligible_ids[i]],
+                'information_gain': float(eligible_gain[i]),
+                'probability': float(p_present[eligible_ids[i]])
+            }
+            for i in top
+        ]
+
+    def _rule_matches(self, rule_result):
+        """Síntomas de una regla disparada (requeridos + opcionales) como bitset"""
+        symptoms = rule_result['required_met'] + rule_result['optional_met']
+        symptom_ids = self.compiled.symptom_ids
+        if all(symptom in symptom_ids for symptom in symptoms):
+            return self.compiled.encode(symptoms)
+        return tuple(symptoms)
+    
+    def backward_chaining(self, user_symptoms, hypothesis_disease, absent_symptoms=None):
+        """
+        Encadenamiento hacia atrás - Verifica una hipótesis.
+        Los principales confirmados ausentes (absent_symptoms) bajan el
+        nivel de confirmación y no se listan como faltantes
+        """
         if hypothesis_disease not in self.knowledge_base:
             return None
         
         disease_info = self.knowledge_base[hypothesis_disease]
-        required_symptoms = disease_info['symptoms_main']
-        all_symptoms = disease_info['symptoms_all']
+        compiled = self.compiled
+        idx = compiled.disease_index[hypothesis_disease]
+        query = self._encode(user_symptoms)
+        absent = self._encode_absent(absent_symptoms, query)
         
         # Verificar síntomas presentes
-        present = set(user_symptoms) & set(all_symptoms)
-        missing = set(required_symptoms) - set(user_symptoms)
+        present = query & compiled.all_masks[idx]
+        missing = compiled.main_masks[idx] & ~query & ~absent
         
         # Calcular nivel de confirmación
-        confirmation_level = len(present) / len(all_symptoms) if all_symptoms else 0
+        all_count = compiled.all_counts[idx]
+        confirmation_level = popcount(present) / all_count if all_count else 0
+        confirmation_level *= self._absent_factor(idx, absent)
         
         return {
             'hypothesis': hypothesis_disease,
             'confirmed': confirmation_level > 0.5,
             'confidence': confirmation_level,
-            'present_symptoms': list(present),
-            'missing_symptoms': list(missing),
+            'present_symptoms': compiled.decode(present),
+            'missing_symptoms': compiled.decode(missing),
+            'absent_symptoms': compiled.decode(absent & compiled.all_masks[idx]),
             'description': disease_info['description'],
-            'recommendations': disease_info['recommendations']
+            'recommendations': list(disease_info['recommendations'])
         }
+
+    def triage(self, user_symptoms):
+        """
+        Triaje de emergencia: solo las reglas y enfermedades graves, antes
+        (y mucho más rápido) que el diagnóstico completo
+        """
+        alerts = self.triage_tier.check(self._encode_rules(user_symptoms))
+        return {'emergency': bool(alerts), 'alerts': alerts}
+
+    def comorbidity_search(self, user_symptoms, max_size=2, top_n=5):
+        """
+        Mejores explicaciones conjuntas: conjuntos de hasta max_size
+        enfermedades que cubren los síntomas con pocos sin explicar y pocos
+        principales faltantes (ver comorbidity.py), de menor a mayor costo
+        """
+        compiled = self.compiled
+        query = self._encode(user_symptoms)
+        explanations = []
+        for cost, diseases in search_explanations(compiled, query, max_size, top_n):
+            covered = 0
+            missing = 0
+            for idx in diseases:
+                covered |= compiled.all_masks[idx]
+                missing |= compiled.main_masks[idx] & ~query
+            explanations.append({
+                'diseases': [compiled.disease_names[idx] for idx in diseases],
+                'cost': cost,
+                'coverage': popcount(query & covered) / popcount(query),
+                'unexplained_symptoms': compiled.decode(query & ~covered),
+                'missing_symptoms': compiled.decode(missing)
+            })
+        return explanations
+
+    def prove_hypothesis(self, user_symptoms, hypothesis, absent_symptoms=None):
+        """
+        Encadenamiento hacia atrás dirigido por objetivos: prueba la
+        hipótesis a través de las reglas que la concluyen, con hechos
+        intermedios como subobjetivos. Retorna certeza y árbol de prueba.
+        Las reglas con un requerido confirmado ausente se descartan sin
+        probar sus demás condiciones
+        """
+        result = self.prover.prove(self._expand_names(user_symptoms), hypothesis, absent=absent_symptoms or ())
+        return {
+            'hypothesis': hypothesis,
+            'proven': result['proven'],
+            'certainty': result['certainty'],
+            'proof': result['proof']
+        }
+
+    def backward_chaining_table(self, user_symptoms, diseases=None, absent_symptoms=None):
+        """
+        Encadenamiento hacia atrás sobre todas las hipótesis (o las de
+        diseases) en una sola pasada matricial, con los mismos valores que
+        backward_chaining (absent_symptoms incluido). Retorna una tabla columnar
+        {columna: valores} con una fila por enfermedad (orden de la KB o el
+        de diseases), lista para pd.DataFrame(tabla)
+        """
+        compiled = self.compiled
+        matrices = compiled.matrices
+        if diseases is None:
+            rows = np.arange(compiled.num_diseases)
+        else:
+            rows = np.array([compiled.disease_index[name] for name in dict.fromkeys(diseases)
+                             if name in compiled.disease_index], dtype=np.intp)
+        query = self._encode(user_symptoms)
+        query_ids = np.array(compiled.ids(query), dtype=np.intp)
+        absent_ids = np.array(compiled.ids(self._encode_absent(absent_symptoms, query)), dtype=np.intp)
+
+        # Presentes: solo las columnas de la consulta
+        present = matrices['all'][np.ix_(rows, query_ids)]
+        present_counts = present.sum(axis=1, dtype=np.float64)
+        all_counts = matrices['all_counts'][rows]
+        confidence = np.divide(present_counts, all_counts,
+                               out=np.zeros(len(rows)), where=all_counts > 0)
+
+        # Ausentes confirmados: penalización por principales, como _absent_factor
+        absent = matrices['all'][np.ix_(rows, absent_ids)]
+        absent_main = matrices['main'][np.ix_(rows, absent_ids)].sum(axis=1, dtype=np.float64)
+        main_counts = matrices['main_counts'][rows]
+        confidence *= 1 - ABSENT_MAIN_PENALTY * np.divide(absent_main, main_counts,
+                                                          out=np.zeros(len(rows)), where=main_counts > 0)
+
+        # Principales faltantes: filtro sobre las coordenadas no nulas
+        position = np.full(compiled.num_diseases, -1, dtype=np.intp)
+        position[rows] = np.arange(len(rows))
+        in_query = np.zeros(compiled.num_symptoms, dtype=bool)
+        in_query[query_ids] = True
+        in_query[absent_ids] = True
+        main_rows, main_cols = matrices['main_rows'], matrices['main_cols']
+        keep = (position[main_rows] >= 0) & ~in_query[main_cols]
+        missing_rows, missing_cols = position[main_rows[keep]], main_cols[keep]
+
+        symptom_names = compiled.symptom_names
+        present_symptoms = [[] for _ in rows]
+        for row, column in zip(*np.nonzero(present)):
+            present_symptoms[row].append(symptom_names[query_ids[column]])
+        missing_symptoms = [[] for _ in rows]
+        for row, symptom_id in zip(missing_rows.tolist(), missing_cols.tolist()):
+            missing_symptoms[row].append(symptom_names[symptom_id])
+        absent_symptoms = [[] for _ in rows]
+        for row, column in zip(*np.nonzero(absent)):
+            absent_symptoms[row].append(symptom_names[absent_ids[column]])
+
+        return {
+            'hypothesis': [compiled.disease_names[idx] for idx in rows],
+            'confirmed': confidence > 0.5,
+            'confidence': confidence,
+            'present_count': present_counts.astype(np.intp),
+            'missing_count': np.bincount(missing_rows, minlength=len(rows)),
+            'present_symptoms': present_symptoms,
+            'missing_symptoms': missing_symptoms,
+            'absent_symptoms': absent_symptoms
+        }
+
+    def rule_based_inference(self, user_symptoms, top_k=None, absent_symptoms=None):
+        """
+        Inferencia basada en reglas IF-THEN. Solo se revisan las reglas
+        cuyo síntoma disparador está entre los del usuario. Si hay reglas
+        que consumen hechos intermedios se usa la red Rete (multinivel),
+        que no deriva hechos confirmados ausentes (absent_symptoms). En el
+        conjunto plano una regla con un requerido ausente ya falla en el
+        AND de sus requeridos: la consulta nunca incluye ausentes.
+        """
+        if self.network.chains:
+            matched_rules = self.network.infer(self._expand_names(user_symptoms), absent=absent_symptoms or ())
+            return matched_rules if top_k is None else matched_rules[:max(top_k, 0)]
+        
+        query = self._encode_rules(user_symptoms)
+        if top_k is not None:
+            return self._rules_top_k(query, top_k)
+        return self.rule_set.infer(query)
     
-    def rule_based_inference(self, user_symptoms):
-        """Inferencia basada en reglas IF-THEN"""
-        matched_rules = []
+    def _rules_top_k(self, query, top_k):
+        """Top-k de reglas disparadas, evaluando por cota de confianza decreciente"""
+        rule_set = self.rule_set
         
-        for rule in self.rules:
-            required = set(rule['conditions']['required'])
-            optional = set(rule['conditions'].get('optional', []))
-            
-            # Verificar condiciones requeridas
-            required_met = required.issubset(set(user_symptoms))
-            
-            if required_met:
-                # Contar opcionales cumplidos
-                optional_met = len(optional & set(user_symptoms))
-                total_optional = len(optional)
-                
-                # Ajustar confianza según opcionales
-                base_confidence = rule['confidence']
-                if total_optional > 0:
-                    optional_bonus = (optional_met / total_optional) * 0.15
-                    final_confidence = min(base_confidence + optional_bonus, 0.99)
-                else:
-                    final_confidence = base_confidence
-                
-                matched_rules.append({
-                    'rule_id': rule['id'],
-                    'conclusion': rule['conclusion'],
-                    'confidence': final_confidence,
-                    'required_met': list(required),
-                    'optional_met': list(optional & set(user_symptoms))
-                })
-        
-        matched_rules.sort(key=lambda x: x['confidence'], reverse=True)
-        return matched_rules
-    
-    def hybrid_inference(self, user_symptoms):
+        def evaluate(position):
+            result = rule_set.evaluate(position, query)
+            return (result['confidence'], -position), result
+        
+        candidates = [(rule_set.rules[position].bound, position) for position in rule_set.match(query)
+                      if not rule_set.rules[position].is_fact]
+        return select_top_k(candidates, top_k, evaluate)
+    
+    def chain_rules(self, user_symptoms):
+        """
+        Encadenamiento hacia adelante multinivel (red Rete): memoria de
+        trabajo final con la certeza de cada hecho y reglas en orden de disparo
+        """
+        return self.network.run(self._expand_names(user_symptoms))
+    
+    def hybrid_inference(self, user_symptoms, top_k=None, absent_symptoms=None):
         """Inferencia híbrida combinando múltiples métodos"""
-        # Ejecutar todos los métodos
-        forward_results = self.forward_chaining(user_symptoms)
-        rule_results = self.rule_based_inference(user_symptoms)
+        if top_k is not None:
+            return self._hybrid_top_k(user_symptoms, top_k, absent_symptoms)
         
-        # Combinar resultados
-        combined_results = {}
+        # Ejecutar todos los métodos
+        forward_results = self.forward_chaining(user_symptoms, absent_symptoms=absent_symptoms)
+        rule_results = self.rule_based_inference(user_symptoms, absent_symptoms=absent_symptoms)
+        return self.combine_hybrid(forward_results, rule_results)
+    
+    def combine_hybrid(self, forward_results, rule_results):
+        """Combina resultados de encadenamiento hacia adelante y de reglas"""
+        # Combinar resultados: disease -> [forward, regla, final, coincidencias, método]
+        combined = {}
         
         # Agregar resultados de forward chaining
         for result in forward_results:
-            disease = result['disease']
-            combined_results[disease] = {
-                'disease': disease,
-                'forward_confidence': result['confidence'],
-                'rule_confidence': 0,
-                'final_confidence': result['confidence'],
-                'matched_symptoms': result['matched_symptoms'],
-                'category': result['category'],
-                'severity': result['severity'],
-                'description': result['description'],
-                'recommendations': result['recommendations'],
-                'method': 'forward_chaining'
-            }
+            combined[result.disease] = [result.confidence, 0, result.confidence,
+                                        result.matched, 'forward_chaining']
         
         # Agregar/actualizar con resultados de reglas
         for result in rule_results:
             disease = result['conclusion']
-            if disease in combined_results:
+            entry = combined.get(disease)
+            if entry is not None:
                 # Combinar confianzas (promedio ponderado)
-                fwd_conf = combined_results[disease]['forward_confidence']
+                fwd_conf = entry[0]
                 rule_conf = result['confidence']
-                combined_results[disease]['rule_confidence'] = rule_conf
-                combined_results[disease]['final_confidence'] = (fwd_conf * 0.6) + (rule_conf * 0.4)
-                combined_results[disease]['method'] = 'hybrid'
+                entry[1] = rule_conf
+                entry[2] = (fwd_conf * 0.6) + (rule_conf * 0.4)
+                entry[4] = 'hybrid'
             else:
                 # Solo de reglas
-                disease_info = self.knowledge_base.get(disease, {})
-                combined_results[disease] = {
-                    'disease': disease,
-                    'forward_confidence': 0,
-                    'rule_confidence': result['confidence'],
-                    'final_confidence': result['confidence'],
-                    'matched_symptoms': result['required_met'] + result['optional_met'],
-                    'category': disease_info.get('category', 'Desconocida'),
-                    'severity': disease_info.get('severity', 'moderada'),
-                    'description': disease_info.get('description', ''),
-                    'recommendations': disease_info.get('recommendations', []),
-                    'method': 'rule_based'
-                }
+                combined[disease] = [0, result['confidence'], result['confidence'],
+                                     self._rule_matches(result), 'rule_based']
         
         # Convertir a lista y ordenar
-        final_results = list(combined_results.values())
-        final_results.sort(key=lambda x: x['final_confidence'], reverse=True)
+        final_results = [
+            DiagnosisResult(self, 'hybrid', disease, final, matched,
+                            forward_confidence=fwd_conf, rule_confidence=rule_conf, method=method)
+            for disease, (fwd_conf, rule_conf, final, matched, method) in combined.items()
+        ]
+        final_results.sort(key=lambda x: x.confidence, reverse=True)
         
         return final_results
     
+    def _hybrid_top_k(self, user_symptoms, top_k, absent_symptoms=None):
+        """
+        Top-k híbrido. Las reglas se evalúan completas (son baratas) y el
+        encadenamiento hacia adelante solo para las enfermedades cuya cota
+        de confianza final puede entrar al top-k. La clave reproduce el
+        orden de combine_hybrid: primero las enfermedades del
+        encadenamiento (por score e índice) y luego las solo de reglas.
+        """
+        compiled = self.compiled
+        query, total_user = self._encode_query(user_symptoms)
+        absent = self._encode_absent(absent_symptoms, query)
+        rule_results = self.rule_based_inference(user_symptoms, absent_symptoms=absent_symptoms)
+        
+        # Confianzas de reglas por enfermedad y posición de su primera regla
+        rules_by_disease = {}
+        for position, result in enumerate(rule_results):
+            rules_by_disease.setdefault(result['conclusion'], (position, []))[1].append(result['confidence'])
+        
+        def final_confidence(forward_score, rule_confs):
+            if forward_score is not None:
+                return (forward_score * 0.6) + (rule_confs[-1] * 0.4) if rule_confs else forward_score
+            # Solo reglas: una segunda regla se combina con confianza hacia adelante 0
+            return rule_confs[0] if len(rule_confs) == 1 else rule_confs[-1] * 0.4
+        
+        forward_bounds = self._forward_bounds(query, total_user, absent)
+        candidates = []
+        for idx, (bound, _) in forward_bounds.items():
+            if bound + BOUND_EPSILON > MIN_CONFIDENCE:
+                rule_confs = rules_by_disease.get(compiled.disease_names[idx], (None, []))[1]
+                final_bound = final_confidence(bound + BOUND_EPSILON, rule_confs)
+                if rule_confs:
+                    final_bound = max(final_bound, final_confidence(None, rule_confs))
+                candidates.append((final_bound, compiled.disease_names[idx]))
+        for disease, (_, rule_confs) in rules_by_disease.items():
+            idx = compiled.disease_index.get(disease)
+            if idx is None or idx not in forward_bounds or forward_bounds[idx][0] + BOUND_EPSILON <= MIN_CONFIDENCE:
+                candidates.append((final_confidence(None, rule_confs), disease))
+        
+        forward_scores = {}
+        
+        def evaluate(disease):
+            position, rule_confs = rules_by_disease.get(disease, (None, []))
+            idx = compiled.disease_index.get(disease)
+            score = None
+            if idx is not None and idx in forward_bounds:
+                score = forward_bounds[idx][1]
+                if score is None:
+                    score = self._forward_score(idx, query, total_user, absent)
+                if score <= MIN_CONFIDENCE:
+                    score = None
+            if score is None and not rule_confs:
+                return None
+            final = final_confidence(score, rule_confs)
+            if score is not None:
+                forward_scores[disease] = (idx, score)
+                return (final, 0, score, -idx), disease
+            return (final, -1, -position, 0), disease
+        
+        selected = set(select_top_k(candidates, top_k, evaluate))
+        forward_results = sorted(
+            (self._forward_result(idx, score, query)
+             for disease, (idx, score) in forward_scores.items() if disease in selected),
+            key=lambda r: (-r['confidence'], compiled.disease_index[r['disease']])
+        )
+        return self.combine_hybrid(
+            forward_results,
+            [result for result in rule_results if result['conclusion'] in selected]
+        )
+    
     def explain_diagnosis(self, diagnosis_result):
         """Genera explicación del diagnóstico"""
         disease = diagnosis_result['disease']
@@ -238,35 +985,294 @@ class InferenceEngine:
         else:
             return "Baja", "🔴"
 
+    def rules_as_diagnosis(self, rule_results):
+        """Convierte reglas disparadas al formato de resultado de diagnóstico"""
+        return [
+            DiagnosisResult(self, 'rules', r['conclusion'], r['confidence'], self._rule_matches(r))
+            for r in rule_results
+        ]
+    
+    def diagnose(self, user_symptoms, method='hybrid', top_k=None, absent_symptoms=None):
+        """
+        Diagnóstico de un paciente con el método indicado.
+        top_k limita la respuesta a los top_k mejores resultados.
+        Con method='fuzzy', user_symptoms puede ser un dict síntoma ->
+        intensidad en [0, 1]; los demás métodos usan solo sus síntomas.
+        absent_symptoms: síntomas confirmados ausentes, usados por
+        'forward', 'rules' e 'hybrid' (los métodos probabilísticos y el
+        difuso ya tratan como ausente todo síntoma no marcado)
+        """
+        if not user_symptoms:
+            return []
+        
+        if method == 'forward':
+            return self.forward_chaining(user_symptoms, top_k=top_k, absent_symptoms=absent_symptoms)
+        if method == 'rules':
+            return self.rules_as_diagnosis(
+                self.rule_based_inference(user_symptoms, top_k=top_k, absent_symptoms=absent_symptoms))
+        if method == 'bayes':
+            return self.bayes_inference(user_symptoms, top_k=top_k)
+        if method == 'noisy_or':
+            return self.noisy_or_inference(user_symptoms, top_k=top_k)
+        if method == 'fuzzy':
+            return self.fuzzy_inference(user_symptoms, top_k=top_k)
+        return self.hybrid_inference(user_symptoms, top_k=top_k, absent_symptoms=absent_symptoms)
+    
+    def forward_chaining_batch(self, symptom_sets):
+        """
+        Encadenamiento hacia adelante para varios pacientes: un único
+        producto matriz de consultas x matriz de la KB
+        """
+        if not symptom_sets:
+            return []
+        
+        compiled = self.compiled
+        queries, total_users = zip(*(self._encode_query(symptoms) for symptoms in symptom_sets))
+        query_matrix = np.zeros((len(queries), compiled.num_symptoms), dtype=np.float32)
+        for row, query in enumerate(queries):
+            query_matrix[row, compiled.ids(query)] = 1
+        scores = self._forward_scores(query_matrix, total_users)
+        
+        batch_results = []
+        for row, query in enumerate(queries):
+            row_scores = scores[row]
+            selected = np.flatnonzero(row_scores > MIN_CONFIDENCE)
+            order = selected[np.argsort(-row_scores[selected], kind='stable')]
+            batch_results.append([self._forward_result(idx, float(row_scores[idx]), query)
+                                  for idx in order.tolist()])
+        return batch_results
+    
+    def diagnose_batch(self, symptom_sets, method='hybrid'):
+        """
+        Diagnóstico de N pacientes en una pasada. Los conjuntos de síntomas
+        idénticos (sin importar el orden) se calculan una sola vez.
+        Con method='fuzzy' cada paciente puede ser un dict de intensidades.
+        """
+        unique_index = {}
+        unique_sets = []
+        positions = []
+        for symptoms in symptom_sets:
+            if isinstance(symptoms, Mapping):
+                key = tuple(sorted(symptoms.items()))
+                symptoms = dict(symptoms) if method == 'fuzzy' else list(symptoms)
+            else:
+                key = tuple(sorted(symptoms))
+                symptoms = list(symptoms)
+            if key not in unique_index:
+                unique_index[key] = len(unique_sets)
+                unique_sets.append(symptoms)
+            positions.append(unique_index[key])
+        
+        pending = [symptoms for symptoms in unique_sets if symptoms]
+        forward_batch = iter(self.forward_chaining_batch(pending)
+                             if method not in ('rules', 'fuzzy') + tuple(PROBABILISTIC_MODELS) else [])
+        posterior_batch = iter(self._posterior_batch(method, pending) if method in PROBABILISTIC_MODELS else [])
+        fuzzy_batch = iter(self.fuzzy_batch(pending) if method == 'fuzzy' else [])
+        
+        unique_results = []
+        for symptoms in unique_sets:
+            if not symptoms:
+                unique_results.append([])
+            elif method in PROBABILISTIC_MODELS:
+                unique_results.append(next(posterior_batch))
+            elif method == 'fuzzy':
+                unique_results.append(next(fuzzy_batch))
+            elif method == 'forward':
+                unique_results.append(next(forward_batch))
+            elif method == 'rules':
+                unique_results.append(self.rules_as_diagnosis(self.rule_based_inference(symptoms)))
+            else:  # hybrid
+                unique_results.append(self.combine_hybrid(next(forward_batch),
+                                                          self.rule_based_inference(symptoms)))
+        
+        # Cada paciente recibe su propia lista; los resultados son de solo lectura
+        return [list(unique_results[position]) for position in positions]
+
 
-def diagnose(user_symptoms, method='hybrid'):
+class DiagnosisSession:
+    """
+    Diagnóstico incremental mientras el paciente selecciona síntomas.
+    Mantiene contadores de coincidencias por enfermedad; agregar o quitar
+    un síntoma solo actualiza las enfermedades de su lista en el índice
+    invertido, y el ranking se arma con las enfermedades activas. Con un
+    motor con jerarquía, cada síntoma aporta también sus ancestros; un
+    ancestro compartido se cuenta una vez mientras lo implique alguno.
+    """
+    
+    def __init__(self, engine=None, symptoms=()):
+        self.engine = engine if engine is not None else get_engine()
+        num_diseases = self.engine.compiled.num_diseases
+        self.symptoms = []
+        self.query = 0
+        # Síntomas marcados (bitset) y cuántos marcados implican cada ID de query
+        self.selected = 0
+        self.implied_by = {}
+        self.main_hits = [0] * num_diseases
+        self.all_hits = [0] * num_diseases
+        # Enfermedades con al menos una coincidencia
+        self.active = set()
+        for symptom in symptoms:
+            self.add_symptom(symptom)
+    
+    def _update_counters(self, symptom, delta):
+        compiled = self.engine.compiled
+        symptom_id = compiled.symptom_ids.get(symptom)
+        if symptom_id is None:
+            return
+        self.selected ^= 1 << symptom_id
+        implied = compiled.ancestor_masks[symptom_id] if self.engine.hierarchy else 1 << symptom_id
+        for implied_id in compiled.ids(implied):
+            count = self.implied_by.get(implied_id, 0) + delta
+            if count:
+                self.implied_by[implied_id] = count
+            else:
+                del self.implied_by[implied_id]
+            # Solo cambian los contadores cuando el síntoma entra o sale de la consulta
+            if count == (1 if delta > 0 else 0):
+                self._update_postings(implied_id, delta)
+    
+    def _update_postings(self, symptom_id, delta):
+        compiled = self.engine.compiled
+        self.query ^= 1 << symptom_id
+        for idx in compiled.main_postings[symptom_id]:
+            self.main_hits[idx] += delta
+            self.all_hits[idx] += delta
+        for idx in compiled.secondary_postings[symptom_id]:
+            self.all_hits[idx] += delta
+        for idx in compiled.main_postings[symptom_id] + compiled.secondary_postings[symptom_id]:
+            if self.all_hits[idx]:
+                self.active.add(idx)
+            else:
+                self.active.discard(idx)
+    
+    def add_symptom(self, symptom):
+        """Agrega un síntoma; retorna False si ya estaba"""
+        if symptom in self.symptoms:
+            return False
+        self.symptoms.append(symptom)
+        self._update_counters(symptom, 1)
+        return True
+    
+    def remove_symptom(self, symptom):
+        """Quita un síntoma; retorna False si no estaba"""
+        if symptom not in self.symptoms:
+            return False
+        self.symptoms.remove(symptom)
+        self._update_counters(symptom, -1)
+        return True
+    
+    def sync(self, selected_symptoms):
+        """Aplica solo las diferencias con una nueva selección de síntomas"""
+        selected = list(dict.fromkeys(selected_symptoms))
+        selected_set = set(selected)
+        for symptom in [s for s in self.symptoms if s not in selected_set]:
+            self.remove_symptom(symptom)
+        for symptom in selected:
+            self.add_symptom(symptom)
+    
+    def forward_results(self, top_k=None, absent_symptoms=None):
+        """Encadenamiento hacia adelante a partir de los contadores"""
+        engine = self.engine
+        compiled = engine.compiled
+        # Como InferenceEngine._encode_query: los ancestros agregados cuentan
+        total_user = len(self.symptoms) + popcount(self.query & ~self.selected)
+        absent = engine._encode_absent(absent_symptoms, self.query)
+        
+        scored = []
+        for idx in self.active:
+            combined_score = engine.combined_score(self.main_hits[idx], compiled.main_counts[idx],
+                                                   self.all_hits[idx], total_user, compiled.all_counts[idx])
+            combined_score *= engine._absent_factor(idx, absent)
+            if combined_score > MIN_CONFIDENCE:
+                scored.append((-combined_score, idx))
+        
+        scored.sort()
+        if top_k is not None:
+            scored = scored[:max(top_k, 0)]
+        return [engine._forward_result(idx, -neg_score, self.query) for neg_score, idx in scored]
+    
+    def ranking(self, method='hybrid', top_k=None, absent_symptoms=None):
+        """Ranking actual con el método indicado (mismo formato y argumentos que diagnose)"""
+        if not self.symptoms:
+            return []
+        
+        engine = self.engine
+        if method == 'forward':
+            return self.forward_results(top_k, absent_symptoms)
+        if method == 'rules':
+            return engine.rules_as_diagnosis(
+                engine.rule_based_inference(self.symptoms, top_k=top_k, absent_symptoms=absent_symptoms))
+        if method in PROBABILISTIC_MODELS:
+            return engine._posterior_inference(method, self.symptoms, top_k)
+        if method == 'fuzzy':
+            return engine.fuzzy_inference(self.symptoms, top_k)
+        
+        results = engine.combine_hybrid(self.forward_results(absent_symptoms=absent_symptoms),
+                                        engine.rule_based_inference(self.symptoms, absent_symptoms=absent_symptoms))
+        return results if top_k is None else results[:max(top_k, 0)]
+
+
+# Reglas del dataset compiladas: {versión de datos, (reglas, conjunto, red, prover)}
+_compiled_rules = {'version': None, 'compiled': None}
+_compiled_rules_lock = threading.Lock()
+
+
+def get_compiled_rules():
+    """
+    Reglas del dataset con su conjunto compilado, su red Rete y su índice
+    para el encadenamiento hacia atrás, compilados una vez por versión de
+    los datos y compartidos por todos los motores
+    """
+    version = get_data_version()
+    if _compiled_rules['version'] != version:
+        with _compiled_rules_lock:
+            if _compiled_rules['version'] != version:
+                rules = get_rules()
+                rule_set = compile_rules(rules, get_compiled_knowledge_base(), persist=True)
+                _compiled_rules['compiled'] = (rules, rule_set, build_network(rules), build_prover(rules))
+                _compiled_rules['version'] = version
+    return _compiled_rules['compiled']
+
+
+# Motores compartidos por proceso (sin y con jerarquía): {versión de datos, motor}
+_shared_engine = {'version': None, 'engine': None}
+_shared_hierarchy_engine = {'version': None, 'engine': None}
+_shared_engine_lock = threading.Lock()
+
+
+def get_engine(hierarchy=False):
+    """
+    Motor de inferencia compartido, construido una vez por versión de la
+    base de conocimiento. Si los datos cambian se construye uno nuevo.
+    Está congelado: es seguro usarlo desde varios hilos a la vez.
+    hierarchy: motor que expande las consultas con la jerarquía de síntomas
+    """
+    shared = _shared_hierarchy_engine if hierarchy else _shared_engine
+    version = get_data_version()
+    if shared['version'] != version:
+        with _shared_engine_lock:
+            if shared['version'] != version:
+                shared['engine'] = InferenceEngine(frozen=True, hierarchy=hierarchy)
+                shared['version'] = version
+    return shared['engine']
+
+
+def triage(user_symptoms, hierarchy=False):
+    """Triaje de emergencia con el motor compartido"""
+    return get_engine(hierarchy).triage(user_symptoms)
+
+
+def diagnose(user_symptoms, method='hybrid', top_k=None, absent_symptoms=None, hierarchy=False):
     """Función principal de diagnóstico"""
     if not user_symptoms:
         return []
     
-    engine = InferenceEngine()
-    
-    if method == 'forward':
-        results = engine.forward_chaining(user_symptoms)
-    elif method == 'rules':
-        rule_results = engine.rule_based_inference(user_symptoms)
-        # Convertir formato
-        results = []
-        for r in rule_results:
-            disease_info = engine.knowledge_base.get(r['conclusion'], {})
-            results.append({
-                'disease': r['conclusion'],
-                'confidence': r['confidence'],
-                'matched_symptoms': r['required_met'] + r['optional_met'],
-                'category': disease_info.get('category', 'Desconocida'),
-                'severity': disease_info.get('severity', 'moderada'),
-                'description': disease_info.get('description', ''),
-                'recommendations': disease_info.get('recommendations', [])
-            })
-    else:  # hybrid
-        results = engine.hybrid_inference(user_symptoms)
-    
-    return results
+    return get_engine(hierarchy).diagnose(user_symptoms, method, top_k=top_k, absent_symptoms=absent_symptoms)
+
+
+def diagnose_batch(symptom_sets, method='hybrid', hierarchy=False):
+    """Diagnóstico por lotes: una lista de resultados por paciente"""
+    return get_engine(hierarchy).diagnose_batch(symptom_sets, method)
 
 
 def main():
@@ -291,23 +1297,27 @@ def main():
     
     method = st.radio(
         "Método de inferencia:",
-        ['hybrid', 'forward', 'rules'],
+        ['hybrid', 'forward', 'rules', 'bayes', 'noisy_or', 'fuzzy'],
         format_func=lambda x: {
             'hybrid': 'Híbrido (Recomendado)',
             'forward': 'Encadenamiento Hacia Adelante',
-            'rules': 'Basado en Reglas'
+            'rules': 'Basado en Reglas',
+            'bayes': 'Naive Bayes',
+            'noisy_or': 'Noisy-OR',
+            'fuzzy': 'Difuso'
         }[x]
     )
     
     if st.button("🔍 Realizar Diagnóstico") and test_symptoms:
         with st.spinner("Procesando..."):
-            results = diagnose(test_symptoms, method)
+            engine = get_engine()
+            results = engine.diagnose(test_symptoms, method)
             
             st.success(f"✅ Se encontraron {len(results)} posibles diagnósticos")
             
             for i, result in enumerate(results[:5], 1):
                 confidence = result.get('final_confidence', result.get('confidence', 0))
-                level, emoji = InferenceEngine().get_confidence_level_label(confidence)
+                level, emoji = engine.get_confidence_level_label(confidence)
                 
                 with st.expander(f"{emoji} #{i} - {result['disease']} ({confidence*100:.1f}%)", expanded=(i==1)):
                     col1, col2 = st.columns([2, 1])
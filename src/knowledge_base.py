@@ -5,36 +5,20 @@ Modulo desarrollado por Germain - Base de Conocimiento del Sistema Experto
 """
 
 import streamlit as st
-import pandas as pd
-import os
+import numpy as np
+import threading
+from types import MappingProxyType
+from snapshot import get_section, get_data_version, get_data_errors
 
 @st.cache_data
-def load_diseases_from_dataset():
-    """Carga enfermedades desde CSV"""
-    dataset_path = os.path.join(os.path.dirname(__file__), "..", "data", "diseases_knowledge.csv")
-    
+def load_diseases_from_dataset(data_version=None):
+    """
+    Carga enfermedades desde el snapshot compilado de diseases_knowledge.csv.
+    data_version forma parte de la clave de caché: un cambio en los datos
+    produce una nueva entrada en lugar de servir la versión anterior.
+    """
     try:
-        df = pd.read_csv(dataset_path)
-        knowledge_base = {}
-        
-        for _, row in df.iterrows():
-            disease_name = str(row['enfermedad']).strip()
-            
-            main_symptoms = [s.strip() for s in str(row['sintomas_principales']).split('|') if s.strip()]
-            secondary_symptoms = [s.strip() for s in str(row['sintomas_secundarios']).split('|') if s.strip()]
-            recommendations = [r.strip() for r in str(row['recomendaciones']).split('|') if r.strip()]
-            
-            knowledge_base[disease_name] = {
-                'symptoms_main': main_symptoms,
-                'symptoms_secondary': secondary_symptoms,
-                'symptoms_all': main_symptoms + secondary_symptoms,
-                'description': str(row['descripcion']).strip(),
-                'severity': str(row['severidad']).strip(),
-                'recommendations': recommendations,
-                'category': str(row['categoria']).strip()
-            }
-        
-        return knowledge_base
+        return get_section('diseases')
         
     except Exception as e:
         st.error(f"Error al cargar datos: {str(e)}")
@@ -42,7 +26,7 @@ def load_diseases_from_dataset():
 
 def get_knowledge_base():
     """Retorna la base de conocimiento completa"""
-    return load_diseases_from_dataset()
+    return load_diseases_from_dataset(get_data_version())
 
 def get_disease_names():
     """Lista de nombres de enfermedades"""
@@ -59,255 +43,473 @@ def get_symptoms_for_disease(disease_name, include_secondary=True):
         return []
     return disease_info.get("symptoms_all" if include_secondary else "symptoms_main", [])
 
+# ====================================
+# BASE DE CONOCIMIENTO COMPILADA
+# ====================================
+
+# Modelo probabilístico de la KB: P(síntoma presente | enfermedad)
+LIKELIHOOD_MAIN = 0.9
+LIKELIHOOD_SECONDARY = 0.5
+LIKELIHOOD_ABSENT = 0.02
+
+# Modelo noisy-OR: probabilidad de que la enfermedad cause cada síntoma de
+# su lista y de que un síntoma aparezca por otra causa (leak)
+NOISY_OR_LINK_MAIN = 0.8
+NOISY_OR_LINK_SECONDARY = 0.4
+NOISY_OR_LEAK = 0.01
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:  # Python < 3.10
+    def popcount(mask):
+        """Cantidad de bits activos de un bitset"""
+        return bin(mask).count('1')
+
+
+class CompiledKnowledgeBase:
+    """
+    Base de conocimiento compilada para el motor de inferencia.
+    Cada síntoma se interna como un entero denso y los perfiles de cada
+    enfermedad se guardan como bitsets (int de Python), de modo que las
+    coincidencias se calculan con AND + popcount.
+    """
+    
+    def __init__(self, knowledge_base, extra_symptoms=(), hierarchy=()):
+        """
+        extra_symptoms: síntomas sin enfermedad asociada (catálogo, reglas)
+        que también reciben ID, tras los de la KB
+        hierarchy: pares (síntoma, padre) de la jerarquía es-un
+        """
+        self.symptom_ids = {}
+        self.symptom_names = []
+        self.disease_names = list(knowledge_base.keys())
+        self.disease_index = {name: idx for idx, name in enumerate(self.disease_names)}
+        
+        self.main_masks = []
+        self.all_masks = []
+        # Longitudes de las listas originales (denominadores de los scores)
+        self.main_counts = []
+        self.all_counts = []
+        
+        for info in knowledge_base.values():
+            self.main_masks.append(self.intern_all(info['symptoms_main']))
+            self.all_masks.append(self.intern_all(info['symptoms_all']))
+            self.main_counts.append(len(info['symptoms_main']))
+            self.all_counts.append(len(info['symptoms_all']))
+        for symptom in extra_symptoms:
+            self.intern(symptom)
+        
+        # Jerarquía es-un: cierre de ancestros de cada síntoma como bitset
+        parents = {}
+        for symptom, parent in hierarchy:
+            parents.setdefault(self.intern(symptom), []).append(self.intern(parent))
+        self.ancestor_masks = _ancestor_closure(parents, self.symptom_names)
+        # Síntomas con algún padre: los únicos que expand() tiene que mirar
+        self.hierarchy_mask = 0
+        for symptom_id in parents:
+            self.hierarchy_mask |= 1 << symptom_id
+        
+        # Índice invertido síntoma -> enfermedades (principales / secundarios)
+        self.main_postings = [[] for _ in self.symptom_names]
+        self.secondary_postings = [[] for _ in self.symptom_names]
+        for idx in range(len(self.disease_names)):
+            main_mask = self.main_masks[idx]
+            for symptom_id in self.ids(main_mask):
+                self.main_postings[symptom_id].append(idx)
+            for symptom_id in self.ids(self.all_masks[idx] & ~main_mask):
+                self.secondary_postings[symptom_id].append(idx)
+        
+        self._freeze()
+    
+    def _freeze(self):
+        """
+        Congela las estructuras una vez construidas: la KB compilada se
+        comparte entre motores e hilos y no debe modificarse
+        """
+        self.symptom_ids = MappingProxyType(self.symptom_ids)
+        self.symptom_names = tuple(self.symptom_names)
+        self.disease_names = tuple(self.disease_names)
+        self.disease_index = MappingProxyType(self.disease_index)
+        self.main_masks = tuple(self.main_masks)
+        self.all_masks = tuple(self.all_masks)
+        self.main_counts = tuple(self.main_counts)
+        self.all_counts = tuple(self.all_counts)
+        self.main_postings = tuple(tuple(postings) for postings in self.main_postings)
+        self.secondary_postings = tuple(tuple(postings) for postings in self.secondary_postings)
+        self.ancestor_masks = tuple(self.ancestor_masks)
+        self._matrices = None
+        self._model_matrices = {}
+        self._matrices_lock = threading.Lock()
+    
+    def intern(self, symptom):
+        """ID entero del síntoma, asignando uno nuevo si no existe"""
+        symptom_id = self.symptom_ids.get(symptom)
+        if symptom_id is None:
+            symptom_id = len(self.symptom_names)
+            self.symptom_ids[symptom] = symptom_id
+            self.symptom_names.append(symptom)
+        return symptom_id
+    
+    def intern_all(self, symptoms):
+        """Bitset de una lista de síntomas, internando los nuevos"""
+        mask = 0
+        for symptom in symptoms:
+            mask |= 1 << self.intern(symptom)
+        return mask
+    
+    def encode(self, symptoms):
+        """Bitset de síntomas conocidos (los desconocidos no coinciden con nada)"""
+        mask = 0
+        ids = self.symptom_ids
+        for symptom in symptoms:
+            symptom_id = ids.get(symptom)
+            if symptom_id is not None:
+                mask |= 1 << symptom_id
+        return mask
+    
+    def decode(self, mask):
+        """Nombres de los síntomas de un bitset, en orden de ID"""
+        return [self.symptom_names[symptom_id] for symptom_id in self.ids(mask)]
+    
+    @staticmethod
+    def ids(mask):
+        """IDs de los bits activos de un bitset, en orden creciente"""
+        ids = []
+        while mask:
+            low_bit = mask & -mask
+            ids.append(low_bit.bit_length() - 1)
+            mask ^= low_bit
+        return ids
+    
+    def expand(self, query):
+        """Consulta con los ancestros de sus síntomas en la jerarquía: un OR por síntoma"""
+        for symptom_id in self.ids(query & self.hierarchy_mask):
+            query |= self.ancestor_masks[symptom_id]
+        return query
+    
+    def ancestors(self, symptom):
+        """Ancestros de un síntoma en la jerarquía, en orden de ID"""
+        symptom_id = self.symptom_ids.get(symptom)
+        if symptom_id is None:
+            return []
+        return self.decode(self.ancestor_masks[symptom_id] & ~(1 << symptom_id))
+    
+    def candidates(self, query):
+        """
+        Índices (en orden de la KB) de las enfermedades que comparten al
+        menos un síntoma con la consulta, según el índice invertido
+        """
+        found = set()
+        for symptom_id in self.ids(query):
+            found.update(self.main_postings[symptom_id])
+            found.update(self.secondary_postings[symptom_id])
+        return sorted(found)
+    
+    def diseases_with_symptom(self, symptom):
+        """Lista (enfermedad, es_principal) en orden de la KB"""
+        symptom_id = self.symptom_ids.get(symptom)
+        if symptom_id is None:
+            return []
+        postings = [(idx, True) for idx in self.main_postings[symptom_id]]
+        postings += [(idx, False) for idx in self.secondary_postings[symptom_id]]
+        postings.sort()
+        return [(self.disease_names[idx], is_main) for idx, is_main in postings]
+    
+    def _build_matrices(self):
+        """Matrices de incidencia enfermedad x síntoma (principales / todos), de solo lectura"""
+        main_matrix = np.zeros((self.num_diseases, self.num_symptoms), dtype=np.float32)
+        all_matrix = np.zeros((self.num_diseases, self.num_symptoms), dtype=np.float32)
+        for idx in range(self.num_diseases):
+            main_matrix[idx, self.ids(self.main_masks[idx])] = 1
+            all_matrix[idx, self.ids(self.all_masks[idx])] = 1
+        # Coordenadas (enfermedad, síntoma) de los principales, por filas
+        main_rows, main_cols = np.nonzero(main_matrix)
+        return {
+            'main': main_matrix,
+            'all': all_matrix,
+            'main_counts': np.array(self.main_counts, dtype=np.float64),
+            'all_counts': np.array(self.all_counts, dtype=np.float64),
+            'main_rows': main_rows,
+            'main_cols': main_cols,
+        }
+    
+    @staticmethod
+    def _build_bayes_matrices(main_matrix, all_matrix):
+        """Verosimilitudes y entropía binaria de cada celda (Naive Bayes)"""
+        likelihood = np.where(main_matrix > 0, LIKELIHOOD_MAIN,
+                              np.where(all_matrix > 0, LIKELIHOOD_SECONDARY, LIKELIHOOD_ABSENT))
+        log_likelihood = np.log(likelihood)
+        log_absent = np.log1p(-likelihood)
+        return {
+            'likelihood': likelihood,
+            'log_likelihood': log_likelihood,
+            'likelihood_entropy': -(likelihood * log_likelihood + (1 - likelihood) * log_absent),
+            # log P(síntoma ausente | enfermedad), para los ausentes confirmados
+            'log_absent': log_absent,
+            # log P(x|d) = log_absent_total[d] + Σ_{s presente} log_odds[d, s]
+            'log_odds': log_likelihood - log_absent,
+            'log_absent_total': log_absent.sum(axis=1),
+        }
+    
+    @staticmethod
+    def _build_noisy_or_matrices(main_matrix, all_matrix):
+        """Noisy-OR en espacio log: log P(ausente|d) = log(1 - leak) + log(1 - enlace)"""
+        link = np.where(main_matrix > 0, NOISY_OR_LINK_MAIN,
+                        np.where(all_matrix > 0, NOISY_OR_LINK_SECONDARY, 0.0))
+        log_absent = np.log1p(-NOISY_OR_LEAK) + np.log1p(-link)
+        log_present = np.log(-np.expm1(log_absent))
+        return {
+            'log_odds': log_present - log_absent,
+            'log_absent_total': log_absent.sum(axis=1),
+        }
+    
+    @staticmethod
+    def _read_only(matrices):
+        """Vista de solo lectura de un grupo de matrices"""
+        for array in matrices.values():
+            array.setflags(write=False)
+        return MappingProxyType(matrices)
+    
+    @property
+    def matrices(self):
+        """Matrices de incidencia NumPy de la KB, construidas la primera vez que se piden"""
+        if self._matrices is None:
+            with self._matrices_lock:
+                if self._matrices is None:
+                    self._matrices = self._read_only(self._build_matrices())
+        return self._matrices
+    
+    def model_matrices(self, model):
+        """
+        Matrices del modelo probabilístico model ('bayes' o 'noisy_or'),
+        construidas la primera vez que ese modelo las pide
+        """
+        group = self._model_matrices.get(model)
+        if group is None:
+            builder = {'bayes': self._build_bayes_matrices,
+                       'noisy_or': self._build_noisy_or_matrices}[model]
+            incidence = self.matrices
+            with self._matrices_lock:
+                group = self._model_matrices.get(model)
+                if group is None:
+                    group = self._read_only(builder(incidence['main'], incidence['all']))
+                    self._model_matrices[model] = group
+        return group
+    
+    def query_vector(self, query):
+        """Vector 0/1 (float32) de un bitset de consulta"""
+        vector = np.zeros(self.num_symptoms, dtype=np.float32)
+        vector[self.ids(query)] = 1
+        return vector
+    
+    @property
+    def num_symptoms(self):
+        return len(self.symptom_names)
+    
+    @property
+    def num_diseases(self):
+        return len(self.disease_names)
+
+
+def _ancestor_closure(parents, names):
+    """
+    Bitset de cada síntoma con todos sus ancestros (él incluido), por
+    búsqueda en profundidad con memoria; ValueError si hay un ciclo
+    """
+    closure = [None] * len(names)
+    in_progress = set()
+    
+    def visit(symptom_id):
+        if closure[symptom_id] is None:
+            if symptom_id in in_progress:
+                raise ValueError(f"Ciclo en la jerarquía de síntomas en '{names[symptom_id]}'")
+            in_progress.add(symptom_id)
+            mask = 1 << symptom_id
+            for parent_id in parents.get(symptom_id, ()):
+                mask |= visit(parent_id)
+            in_progress.discard(symptom_id)
+            closure[symptom_id] = mask
+        return closure[symptom_id]
+    
+    for symptom_id in range(len(names)):
+        visit(symptom_id)
+    return closure
+
+
+def get_symptom_hierarchy():
+    """Pares (síntoma, padre) de symptom_hierarchy.csv; vacío si no existe o no es válido"""
+    try:
+        return get_section('hierarchy')
+    except (FileNotFoundError, ValueError):
+        return []
+
+
+def _catalog_symptoms():
+    """Síntomas de symptoms_list.csv; vacío si no existe"""
+    try:
+        return [symptom for _, symptom in get_section('symptoms')]
+    except FileNotFoundError:
+        return []
+
+
+def _known_symptoms():
+    """Síntomas del catálogo y de las reglas (para internarlos en la KB compilada)"""
+    try:
+        rules = get_section('rules')
+    except (FileNotFoundError, ValueError):
+        rules = []
+    rule_symptoms = [
+        symptom
+        for rule in rules
+        for symptoms in rule['conditions'].values()
+        for symptom in symptoms
+    ]
+    return _catalog_symptoms() + rule_symptoms
+
+
+def compile_knowledge_base(knowledge_base=None, extra_symptoms=None, hierarchy=None):
+    """
+    Compila la base de conocimiento (por defecto, la cargada del dataset,
+    con los síntomas del catálogo y de las reglas como extra y la
+    jerarquía de symptom_hierarchy.csv)
+    """
+    if knowledge_base is None:
+        knowledge_base = get_knowledge_base()
+    if extra_symptoms is None:
+        extra_symptoms = _known_symptoms()
+    if hierarchy is None:
+        hierarchy = get_symptom_hierarchy()
+    return CompiledKnowledgeBase(knowledge_base, extra_symptoms, hierarchy)
+
+
+_compiled_cache = {'version': None, 'compiled': None, 'problem': None}
+_compiled_lock = threading.Lock()
+
+
+def get_compiled_knowledge_base():
+    """
+    KB compilada compartida; se recompila solo si cambian los datos. Una
+    jerarquía con ciclos se descarta (se compila sin ella) y queda como
+    problema de los datos
+    """
+    version = get_data_version()
+    if _compiled_cache['version'] != version:
+        with _compiled_lock:
+            if _compiled_cache['version'] != version:
+                try:
+                    compiled, problem = compile_knowledge_base(), None
+                except ValueError as e:
+                    compiled, problem = compile_knowledge_base(hierarchy=()), str(e)
+                _compiled_cache.update(compiled=compiled, problem=problem, version=version)
+    return _compiled_cache['compiled']
+
+def validate_rules(rules, knowledge_base, catalog):
+    """
+    Problemas de un conjunto de reglas: ids repetidos, confianzas fuera de
+    [0, 1], reglas sin síntomas requeridos (se dispararían con cualquier
+    consulta), síntomas que no están en el catálogo ni en la KB y
+    conclusiones que no son enfermedades de la KB. Los hechos intermedios (reglas de
+    tipo 'fact') valen como síntoma y como conclusión.
+    """
+    facts = {rule['conclusion'] for rule in rules if rule.get('type') == 'fact'}
+    known = set(catalog) | facts
+    for info in knowledge_base.values():
+        known.update(info['symptoms_all'])
+
+    problems = []
+    seen = set()
+    for rule in rules:
+        rule_id = rule['id']
+        if rule_id in seen:
+            problems.append(f"Regla '{rule_id}': id repetido")
+        seen.add(rule_id)
+        if not 0 <= rule['confidence'] <= 1:
+            problems.append(f"Regla '{rule_id}': confianza fuera de [0, 1]")
+        if not rule['conditions']['required']:
+            problems.append(f"Regla '{rule_id}': sin síntomas requeridos")
+        for symptom in list(rule['conditions']['required']) + list(rule['conditions'].get('optional', [])):
+            if symptom not in known:
+                problems.append(f"Regla '{rule_id}': síntoma desconocido '{symptom}'")
+        if rule['conclusion'] not in knowledge_base and rule['conclusion'] not in facts:
+            problems.append(f"Regla '{rule_id}': conclusión desconocida '{rule['conclusion']}'")
+    return problems
+
+
+_rules_cache = {'version': None, 'rules': None, 'problem': None}
+
+
+def get_rules():
+    """
+    Reglas IF-THEN de rules_knowledge.csv, validadas y congeladas. Se
+    cargan una vez por versión de los datos (cambiar el archivo basta para
+    publicar reglas nuevas). Si alguna regla no es válida se siguen
+    sirviendo las últimas reglas válidas (ninguna si no las hubo); sin el
+    archivo no hay reglas. El error queda en get_data_problems().
+    """
+    version = get_data_version()
+    if _rules_cache['version'] != version:
+        try:
+            rules = get_section('rules')
+            problems = validate_rules(rules, get_knowledge_base(), _catalog_symptoms())
+            if problems:
+                raise ValueError("Reglas inválidas:\n" + "\n".join(problems))
+            _rules_cache.update(rules=freeze_rules(rules), problem=None)
+        except FileNotFoundError as e:
+            _rules_cache.update(rules=(), problem=f"No se encontró el archivo de reglas {e}")
+        except ValueError as e:
+            if _rules_cache['rules'] is None:
+                _rules_cache['rules'] = ()
+            _rules_cache['problem'] = str(e)
+        _rules_cache['version'] = version
+    return _rules_cache['rules']
+
+
+def get_data_problems():
+    """
+    Errores de los datos actuales (CSV mal formados, reglas inválidas,
+    ciclos en la jerarquía) que se están sorteando con datos anteriores
+    """
+    get_rules()
+    get_compiled_knowledge_base()
+    problems = list(get_data_errors().values())
+    problems += [cache['problem'] for cache in (_rules_cache, _compiled_cache) if cache['problem']]
+    return list(dict.fromkeys(problems))
+
+
 def create_simple_rules():
-    """Reglas IF-THEN para diagnostico"""
+    """Reglas IF-THEN para diagnostico (copia editable de las del dataset)"""
     return [
-        {
-            'id': 'gripe_clasica',
-            'conditions': {
-                'required': ['Fiebre alta (más de 38.5°C)', 'Tos seca', 'Dolores musculares (mialgia)'],
-                'optional': ['Fatiga extrema', 'Dolor de cabeza (cefalea)']
-            },
-            'conclusion': 'Gripe (Influenza)',
-            'confidence': 0.85
-        },
-        {
-            'id': 'resfriado_tipico',
-            'conditions': {
-                'required': ['Congestión nasal', 'Estornudos frecuentes'],
-                'optional': ['Dolor de garganta']
-            },
-            'conclusion': 'Resfriado Común',
-            'confidence': 0.80
-        },
-        {
-            'id': 'gastritis_caracteristica',
-            'conditions': {
-                'required': ['Dolor en la parte superior del abdomen', 'Acidez estomacal'],
-                'optional': ['Náuseas', 'Ardor estomacal']
-            },
-            'conclusion': 'Gastritis Aguda',
-            'confidence': 0.75
-        },
-        {
-            'id': 'gastroenteritis_tipica',
-            'conditions': {
-                'required': ['Diarrea acuosa', 'Vómitos'],
-                'optional': ['Dolor abdominal', 'Fiebre baja (37.5°C - 38.5°C)']
-            },
-            'conclusion': 'Gastroenteritis',
-            'confidence': 0.80
-        },
-        {
-            'id': 'neumonia_grave',
-            'conditions': {
-                'required': ['Tos con flema (productiva)', 'Fiebre alta (más de 38.5°C)', 'Dificultad para respirar (disnea)'],
-                'optional': ['Dolor en el pecho al respirar', 'Escalofríos']
-            },
-            'conclusion': 'Neumonía',
-            'confidence': 0.88
-        },
-        {
-            'id': 'asma_crisis',
-            'conditions': {
-                'required': ['Dificultad para respirar (disnea)', 'Silbidos al respirar'],
-                'optional': ['Opresión en el pecho', 'Tos persistente']
-            },
-            'conclusion': 'Asma (Crisis)',
-            'confidence': 0.82
-        },
-        {
-            'id': 'amigdalitis_aguda',
-            'conditions': {
-                'required': ['Dolor de garganta intenso', 'Dolor al tragar', 'Fiebre alta (más de 38.5°C)'],
-                'optional': ['Inflamación de ganglios', 'Fatiga extrema']
-            },
-            'conclusion': 'Amigdalitis',
-            'confidence': 0.83
-        },
-        {
-            'id': 'migraña_severa',
-            'conditions': {
-                'required': ['Dolor de cabeza (cefalea)', 'Náuseas'],
-                'optional': ['Visión borrosa', 'Mareos']
-            },
-            'conclusion': 'Migraña',
-            'confidence': 0.70
-        },
-        {
-            'id': 'diabetes_inicial',
-            'conditions': {
-                'required': ['Sed intensa', 'Fatiga extrema', 'Visión borrosa'],
-                'optional': ['Pérdida de peso inexplicable', 'Mareos']
-            },
-            'conclusion': 'Diabetes Tipo 2 (síntomas iniciales)',
-            'confidence': 0.78
-        },
-        {
-            'id': 'hipertension_sintomatica',
-            'conditions': {
-                'required': ['Dolor de cabeza (cefalea)', 'Mareos'],
-                'optional': ['Visión borrosa', 'Palpitaciones']
-            },
-            'conclusion': 'Hipertensión (sospecha)',
-            'confidence': 0.72
-        },
-        {
-            'id': 'anemia_tipica',
-            'conditions': {
-                'required': ['Fatiga extrema', 'Debilidad general', 'Mareos'],
-                'optional': ['Dolor de cabeza (cefalea)', 'Falta de aliento']
-            },
-            'conclusion': 'Anemia (sospecha)',
-            'confidence': 0.75
-        },
-        {
-            'id': 'ansiedad_fisica',
-            'conditions': {
-                'required': ['Palpitaciones', 'Sudoración excesiva'],
-                'optional': ['Mareos', 'Dificultad para respirar']
-            },
-            'conclusion': 'Ansiedad (manifestación física)',
-            'confidence': 0.70
-        },
-        {
-            'id': 'angina_pecho',
-            'conditions': {
-                'required': ['Dolor en el pecho', 'Dolor que irradia al brazo izquierdo'],
-                'optional': ['Sudoración fría', 'Disnea de esfuerzo']
-            },
-            'conclusion': 'Angina de Pecho (sospecha)',
-            'confidence': 0.85
-        },
-        {
-            'id': 'infarto_miocardio',
-            'conditions': {
-                'required': ['Dolor en el pecho', 'Dolor que irradia al brazo izquierdo', 'Sudoración fría'],
-                'optional': ['Náuseas', 'Ansiedad intensa']
-            },
-            'conclusion': 'Infarto Agudo de Miocardio (sospecha)',
-            'confidence': 0.92
-        },
-        {
-            'id': 'acv_sospecha',
-            'conditions': {
-                'required': ['Debilidad muscular', 'Confusión mental', 'Dificultad para hablar'],
-                'optional': ['Pérdida de equilibrio', 'Visión borrosa']
-            },
-            'conclusion': 'Accidente Cerebrovascular (ACV - sospecha)',
-            'confidence': 0.90
-        },
-        {
-            'id': 'epilepsia_crisis',
-            'conditions': {
-                'required': ['Convulsiones', 'Pérdida de conciencia'],
-                'optional': ['Rigidez muscular', 'Confusión mental']
-            },
-            'conclusion': 'Epilepsia (Crisis Convulsiva)',
-            'confidence': 0.88
-        },
-        {
-            'id': 'pielonefritis',
-            'conditions': {
-                'required': ['Fiebre alta (más de 38.5°C)', 'Dolor en la zona lumbar', 'Dolor al orinar (disuria)'],
-                'optional': ['Náuseas', 'Orina turbia']
-            },
-            'conclusion': 'Pielonefritis (Infección Renal)',
-            'confidence': 0.84
-        },
-        {
-            'id': 'calculos_renales',
-            'conditions': {
-                'required': ['Dolor en la zona lumbar', 'Sangre en la orina (hematuria)'],
-                'optional': ['Náuseas', 'Vómitos']
-            },
-            'conclusion': 'Cálculos Renales (Cólico Renal)',
-            'confidence': 0.86
-        },
-        {
-            'id': 'insuficiencia_cardiaca',
-            'conditions': {
-                'required': ['Dificultad para respirar (disnea)', 'Hinchazón en piernas', 'Fatiga extrema'],
-                'optional': ['Edema periférico', 'Ortopnea']
-            },
-            'conclusion': 'Insuficiencia Cardíaca (descompensada)',
-            'confidence': 0.87
-        },
-        {
-            'id': 'crisis_hipertensiva',
-            'conditions': {
-                'required': ['Presión arterial sistólica >180 mmHg', 'Dolor de cabeza (cefalea)', 'Visión borrosa'],
-                'optional': ['Náuseas', 'Dolor en el pecho']
-            },
-            'conclusion': 'Crisis Hipertensiva',
-            'confidence': 0.89
-        },
-        {
-            'id': 'leucemia_aguda',
-            'conditions': {
-                'required': ['Fatiga extrema', 'Fiebre sin foco infeccioso', 'Sangrado fácil', 'Hematomas espontáneos'],
-                'optional': ['Petequias generalizadas', 'Adenopatías generalizadas']
-            },
-            'conclusion': 'Leucemia Aguda (sospecha)',
-            'confidence': 0.81
-        },
-        {
-            'id': 'meningitis_sospecha',
-            'conditions': {
-                'required': ['Fiebre alta (más de 38.5°C)', 'Dolor de cabeza (cefalea)', 'Rigidez de nuca'],
-                'optional': ['Fotofobia', 'Vómitos']
-            },
-            'conclusion': 'Meningitis (sospecha)',
-            'confidence': 0.91
-        },
-        {
-            'id': 'apendicitis',
-            'conditions': {
-                'required': ['Dolor periumbilical que migra a cuadrante inferior derecho', 'Náuseas', 'Fiebre'],
-                'optional': ['Vómitos', 'Rigidez abdominal']
-            },
-            'conclusion': 'Apendicitis Aguda',
-            'confidence': 0.85
-        },
-        {
-            'id': 'glaucoma_agudo',
-            'conditions': {
-                'required': ['Dolor ocular', 'Visión borrosa', 'Náuseas'],
-                'optional': ['Vómitos', 'Ojo rojo']
-            },
-            'conclusion': 'Glaucoma Agudo',
-            'confidence': 0.83
-        },
-        {
-            'id': 'embolia_pulmonar',
-            'conditions': {
-                'required': ['Dificultad para respirar (disnea)', 'Dolor en el pecho al respirar', 'Taquicardia'],
-                'optional': ['Tos con sangre (hemoptisis)', 'Ansiedad intensa']
-            },
-            'conclusion': 'Embolia Pulmonar (sospecha)',
-            'confidence': 0.88
-        },
-        {
-            'id': 'cetoacidosis_diabetica',
-            'conditions': {
-                'required': ['Sed intensa', 'Orina frecuente', 'Náuseas', 'Vómitos'],
-                'optional': ['Confusión mental', 'Respiración rápida (taquipnea)']
-            },
-            'conclusion': 'Cetoacidosis Diabética',
-            'confidence': 0.86
-        }
+        dict(rule, conditions={key: list(symptoms) for key, symptoms in rule['conditions'].items()})
+        for rule in get_rules()
     ]
 
+def freeze_knowledge_base(knowledge_base):
+    """Copia inmutable de la KB: mapping proxies y tuplas"""
+    return MappingProxyType({
+        name: MappingProxyType({
+            key: tuple(value) if isinstance(value, list) else value
+            for key, value in info.items()
+        })
+        for name, info in knowledge_base.items()
+    })
+
+
+def freeze_rules(rules):
+    """Copia inmutable de las reglas IF-THEN"""
+    return tuple(
+        MappingProxyType(dict(
+            rule,
+            conditions=MappingProxyType({
+                key: tuple(symptoms) for key, symptoms in rule['conditions'].items()
+            })
+        ))
+        for rule in rules
+    )
+
+
 def search_diseases_by_symptom(symptom):
-    """Busca enfermedades por sintoma"""
-    kb = get_knowledge_base()
-    results = []
-    for name, info in kb.items():
-        if symptom in info['symptoms_main']:
-            results.append((name, True))
-        elif symptom in info['symptoms_secondary']:
-            results.append((name, False))
-    return results
+    """Busca enfermedades por sintoma (consulta directa al indice invertido)"""
+    return get_compiled_knowledge_base().diseases_with_symptom(symptom)
 
 def get_all_categories():
     """Categorias disponibles"""
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+prover.py
+Encadenamiento hacia atrás dirigido por objetivos sobre las reglas IF-THEN
+Un objetivo se prueba si es un hecho dado o si alguna regla que lo concluye
+tiene todas sus condiciones requeridas probadas, recursivamente (a través de
+hechos intermedios). Los subobjetivos se tabulan durante la consulta, así
+que cada uno se expande una sola vez (los de un ciclo, una vez por pasada
+hasta el punto fijo), y los ciclos se detectan.
+"""
+
+from rules import rule_confidence
+
+# Cota "sin dependencias" para el número de visita más bajo alcanzado
+_NO_DEPENDENCY = float('inf')
+
+
+class GoalQuery:
+    """
+    Estado de una consulta: hechos dados, hechos confirmados ausentes,
+    tabla de subobjetivos resueltos (prueba o None si falló), pila de
+    objetivos en curso y objetivos provisionales de un ciclo aún abierto.
+    """
+
+    def __init__(self, prover, facts, absent=()):
+        self.prover = prover
+        self.facts = set(facts)
+        # Un hecho dado prevalece sobre su ausencia
+        self.absent = frozenset(absent).difference(self.facts)
+        self.table = {}
+        # Número de visita de los objetivos en curso
+        self.stack = {}
+        # Objetivos ya resueltos de un ciclo abierto: (prueba, número de visita)
+        self.provisional = {}
+        self.component = []
+        # Valor supuesto de los objetivos en curso que reaparecieron en un ciclo
+        self.estimate = {}
+        self.assumed = set()
+        self.visits = 0
+        # Objetivos expandidos (llamadas que recorrieron reglas)
+        self.expanded = 0
+
+    def prove(self, goal):
+        """Resultado de probar un objetivo, reutilizando la tabla de la consulta"""
+        proof, _ = self._solve(goal)
+        return {
+            'goal': goal,
+            'proven': proof is not None,
+            'certainty': proof['certainty'] if proof else 0.0,
+            'proof': proof
+        }
+
+    def _solve(self, goal):
+        """
+        Retorna (prueba o None, número de visita más bajo del que dependió).
+        Un objetivo en curso que reaparece cierra un ciclo y vale su
+        estimación (None en la primera pasada). Los objetivos que dependen de
+        uno más abajo en la pila quedan provisionales y no se reexpanden;
+        cuando termina el que abrió el ciclo se recalcula el grupo hasta que
+        las estimaciones no cambian y se tabula completo (componentes
+        fuertemente conexas, como en Tarjan).
+        """
+        if goal in self.facts:
+            return {'fact': goal, 'certainty': 1.0, 'rule': None, 'premises': []}, _NO_DEPENDENCY
+        if goal in self.absent:
+            return None, _NO_DEPENDENCY
+        if goal in self.table:
+            return self.table[goal], _NO_DEPENDENCY
+        if goal in self.stack:
+            self.assumed.add(goal)
+            return self.estimate.get(goal), self.stack[goal]
+        if goal in self.provisional:
+            return self.provisional[goal]
+
+        number = self.visits
+        self.visits += 1
+        self.stack[goal] = number
+        start = len(self.component)
+        while True:
+            best, low = self._expand(goal)
+            if low < number:
+                del self.stack[goal]
+                self.provisional[goal] = (best, number)
+                self.component.append(goal)
+                return best, low
+
+            results = {goal: best}
+            for member in self.component[start:]:
+                results[member] = self.provisional.pop(member)[0]
+            del self.component[start:]
+            # Punto fijo: los valores supuestos coinciden con los obtenidos
+            if all(_certainty(results[g]) == _certainty(self.estimate.get(g))
+                   for g in results if g in self.assumed):
+                break
+            self.estimate.update(results)
+            self.assumed.difference_update(results)
+
+        del self.stack[goal]
+        for g in results:
+            self.estimate.pop(g, None)
+        self.assumed.difference_update(results)
+        self.table.update(results)
+        return best, _NO_DEPENDENCY
+
+    def _expand(self, goal):
+        """Mejor prueba del objetivo entre las reglas que lo concluyen"""
+        self.expanded += 1
+        best = None
+        low = _NO_DEPENDENCY
+
+        for rule in self.prover.rules_for(goal):
+            required = dict.fromkeys(rule['conditions']['required'])
+            # Falla rápida: un requerido ausente descarta la regla sin probar el resto
+            if not self.absent.isdisjoint(required):
+                continue
+            premises = []
+            for condition in required:
+                proof, depends = self._solve(condition)
+                low = min(low, depends)
+                if proof is None:
+                    break
+                premises.append(proof)
+            else:
+                optional = list(dict.fromkeys(rule['conditions'].get('optional', [])))
+                optional_met = []
+                for condition in optional:
+                    proof, depends = self._solve(condition)
+                    low = min(low, depends)
+                    if proof is not None:
+                        optional_met.append(condition)
+
+                # Misma confianza que el encadenamiento hacia adelante
+                final_confidence = rule_confidence(rule['confidence'], len(optional_met), len(optional))
+                certainty = final_confidence * min((p['certainty'] for p in premises), default=1.0)
+
+                if best is None or certainty > best['certainty']:
+                    best = {
+                        'fact': goal,
+                        'certainty': certainty,
+                        'rule': rule['id'],
+                        'premises': premises,
+                        'optional_met': optional_met
+                    }
+        return best, low
+
+
+def _certainty(proof):
+    """Certeza de una prueba; -1 para un fallo"""
+    return -1.0 if proof is None else proof['certainty']
+
+
+class GoalProver:
+    """Reglas indexadas por conclusión para el encadenamiento hacia atrás"""
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.by_conclusion = {}
+        for rule in self.rules:
+            self.by_conclusion.setdefault(rule['conclusion'], []).append(rule)
+
+    def rules_for(self, goal):
+        """Reglas que concluyen el objetivo, en el orden de la base"""
+        return self.by_conclusion.get(goal, ())
+
+    def query(self, facts, absent=()):
+        """Consulta nueva sobre los hechos dados; su tabla vive lo que ella"""
+        return GoalQuery(self, facts, absent)
+
+    def prove(self, facts, goal, absent=()):
+        """Prueba un único objetivo"""
+        return self.query(facts, absent).prove(goal)
+
+
+def build_prover(rules):
+    """Indexa las reglas para el encadenamiento hacia atrás"""
+    return GoalProver(rules)
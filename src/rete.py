@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+rete.py
+Encadenamiento hacia adelante multinivel con red tipo Rete
+Las reglas pueden concluir hechos intermedios (p. ej. 'Síndrome febril')
+que otras reglas consumen. La red comparte los nodos de condición entre
+reglas y, al afirmar un hecho, solo se re-evalúan los nodos que lo prueban.
+"""
+
+import heapq
+from itertools import count
+
+from rules import is_fact_rule, rule_confidence
+
+
+class BetaNode:
+    """Nodo de unión: se satisface cuando su padre y su hecho lo están"""
+
+    __slots__ = ('id', 'parent', 'fact', 'children', 'rules')
+
+    def __init__(self, node_id, parent, fact):
+        self.id = node_id
+        self.parent = parent
+        self.fact = fact
+        self.children = []
+        # Reglas cuyas condiciones requeridas terminan en este nodo
+        self.rules = []
+
+
+class ReteNetwork:
+    """
+    Red de emparejamiento compilada a partir de las reglas IF-THEN.
+    Red alfa: hecho -> nodos beta que lo prueban (compartidos).
+    Red beta: cada regla es un camino desde la raíz por sus condiciones
+    requeridas, ordenadas de la más a la menos frecuente para que las
+    reglas con condiciones comunes compartan prefijo.
+    La red es inmutable tras construirse; el estado de cada ejecución
+    (memoria de trabajo y agenda) vive en run().
+    """
+
+    def __init__(self, rules):
+        self.rules = tuple(rules)
+        self.root = BetaNode(0, None, None)
+        self.nodes = [self.root]
+        self.alpha = {}
+
+        frequency = {}
+        for rule in self.rules:
+            for fact in set(rule['conditions']['required']):
+                frequency[fact] = frequency.get(fact, 0) + 1
+
+        shared = {}
+        for position, rule in enumerate(self.rules):
+            node = self.root
+            for fact in sorted(set(rule['conditions']['required']), key=lambda f: (-frequency[f], f)):
+                child = shared.get((node.id, fact))
+                if child is None:
+                    child = BetaNode(len(self.nodes), node, fact)
+                    self.nodes.append(child)
+                    node.children.append(child)
+                    self.alpha.setdefault(fact, []).append(child)
+                    shared[(node.id, fact)] = child
+                node = child
+            node.rules.append(position)
+
+        # Hay encadenamiento si alguna conclusión es condición de otra regla
+        self.chains = any(rule['conclusion'] in frequency for rule in self.rules)
+
+    def _fire(self, position, memory, depth):
+        """Resultado de disparar una regla sobre la memoria de trabajo"""
+        rule = self.rules[position]
+        required = list(dict.fromkeys(rule['conditions']['required']))
+        optional = set(rule['conditions'].get('optional', []))
+        optional_met = [fact for fact in optional if fact in memory]
+
+        # Ajustar confianza según opcionales (como en la inferencia por reglas)
+        final_confidence = rule_confidence(rule['confidence'], len(optional_met), len(optional))
+
+        # La certeza de una conclusión no supera la de su premisa más débil
+        certainty = min((memory[fact] for fact in required), default=1.0)
+        return {
+            'rule_id': rule['id'],
+            'conclusion': rule['conclusion'],
+            'confidence': final_confidence * certainty,
+            'required_met': required,
+            'optional_met': optional_met,
+            'depth': 1 + max((depth[fact] for fact in required), default=0)
+        }
+
+    def run(self, facts, absent=()):
+        """Ejecuta la red; ver _run"""
+        memory, fired = self._run(facts, absent)
+        return {'facts': memory, 'fired': [result for _, result in fired]}
+
+    def _run(self, facts, absent=()):
+        """
+        Ejecuta el ciclo reconocer-actuar hasta agotar la agenda.
+        Resolución de conflictos: mayor confianza, luego mayor
+        especificidad (más condiciones) y luego la activación más reciente.
+        Cada regla dispara a lo sumo una vez (refracción).
+        absent: hechos confirmados ausentes (un hecho dado prevalece). No
+        se derivan: las reglas que los concluyen no entran a la agenda y
+        los nodos que los prueban nunca se activan.
+        Retorna la memoria de trabajo {hecho: certeza} y la lista de
+        (posición, resultado) de las reglas en orden de disparo
+        """
+        facts = list(facts)
+        absent = set(absent).difference(facts)
+        memory = {}
+        depth = {}
+        active = {self.root.id}
+        agenda = []
+        sequence = count()
+        fired = []
+
+        def activate(node):
+            active.add(node.id)
+            for position in node.rules:
+                rule = self.rules[position]
+                if rule['conclusion'] in absent:
+                    continue
+                heapq.heappush(agenda, (-rule['confidence'], -len(rule['conditions']['required']),
+                                        -next(sequence), position))
+            for child in node.children:
+                if child.fact in memory:
+                    activate(child)
+
+        def assert_fact(fact, certainty, level):
+            if fact in memory:
+                return
+            memory[fact] = certainty
+            depth[fact] = level
+            # Solo se re-evalúan los nodos que prueban el hecho nuevo
+            for node in self.alpha.get(fact, ()):
+                if node.parent.id in active and node.id not in active:
+                    activate(node)
+
+        activate(self.root)
+        for fact in facts:
+            assert_fact(fact, 1.0, 0)
+
+        while agenda:
+            position = heapq.heappop(agenda)[-1]
+            result = self._fire(position, memory, depth)
+            fired.append((position, result))
+            assert_fact(result['conclusion'], result['confidence'], result['depth'])
+
+        return memory, fired
+
+    def infer(self, facts, absent=()):
+        """Reglas de diagnóstico disparadas, ordenadas como la inferencia por reglas"""
+        _, fired = self._run(facts, absent)
+        fired = sorted(pair for pair in fired if not is_fact_rule(self.rules[pair[0]]))
+        matched_rules = [result for _, result in fired]
+        matched_rules.sort(key=lambda x: x['confidence'], reverse=True)
+        return matched_rules
+
+
+def build_network(rules):
+    """Compila las reglas a una red Rete"""
+    return ReteNetwork(rules)
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+rules.py
+Reglas IF-THEN compiladas
+Cada regla se compila una vez a bitsets de síntomas requeridos/opcionales
+y se indexa bajo su síntoma requerido más selectivo (disparador): una
+consulta solo revisa las reglas cuyo disparador está presente. Las reglas
+que refinan a otra (requeridos superconjunto) cuelgan de ella en un DAG de
+subsunción y solo se prueban si la general se cumple. El emparejamiento se
+ejecuta como código generado (ver codegen.py).
+"""
+
+from knowledge_base import popcount
+from codegen import load_matcher
+
+# Tipo de regla cuya conclusión es un hecho intermedio y no un diagnóstico
+FACT_RULE = 'fact'
+
+# Bonificación máxima por opcionales y tope de la confianza de una regla
+OPTIONAL_BONUS = 0.15
+MAX_RULE_CONFIDENCE = 0.99
+
+
+def rule_confidence(base, met, total):
+    """Confianza de una regla cumplida: base más el bono por la fracción de opcionales presentes"""
+    if not total:
+        return base
+    return min(base + met / total * OPTIONAL_BONUS, MAX_RULE_CONFIDENCE)
+
+
+def is_fact_rule(rule):
+    """True si la regla concluye un hecho intermedio (p. ej. 'Síndrome febril')"""
+    return rule.get('type') == FACT_RULE
+
+
+class CompiledRule:
+    """Regla compilada: condiciones como bitsets sobre los IDs de síntomas"""
+
+    __slots__ = ('position', 'id', 'conclusion', 'confidence', 'required', 'optional',
+                 'required_names', 'optional_count', 'bound', 'trigger', 'is_fact', 'source',
+                 'anchor', 'delta')
+
+    def __init__(self, position, rule, encode):
+        conditions = rule['conditions']
+        self.position = position
+        self.id = rule['id']
+        self.conclusion = rule['conclusion']
+        self.confidence = rule['confidence']
+        # Requeridos sin duplicados, en el orden de la regla
+        self.required_names = tuple(dict.fromkeys(conditions['required']))
+        self.required = encode(self.required_names)
+        self.optional = encode(conditions.get('optional', ()))
+        self.optional_count = popcount(self.optional)
+        # Confianza máxima alcanzable (todos los opcionales presentes)
+        self.bound = rule_confidence(self.confidence, self.optional_count, self.optional_count)
+        self.trigger = None
+        self.is_fact = is_fact_rule(rule)
+        self.source = rule
+        # Regla general bajo la que se evalúa y requeridos que agrega
+        self.anchor = None
+        self.delta = self.required
+
+
+class CompiledRuleSet:
+    """
+    Conjunto de reglas compilado sobre la KB compilada. Los síntomas de las
+    reglas que la KB no conoce reciben IDs locales a continuación de los suyos.
+    """
+
+    def __init__(self, rules, compiled_kb):
+        self.compiled_kb = compiled_kb
+        self.extra_ids = {}
+        self.extra_names = []
+        self.rules = tuple(CompiledRule(position, rule, self._intern_all)
+                           for position, rule in enumerate(rules))
+
+        # Frecuencia de cada síntoma requerido entre las reglas
+        rule_frequency = {}
+        for rule in self.rules:
+            for symptom_id in compiled_kb.ids(rule.required):
+                rule_frequency[symptom_id] = rule_frequency.get(symptom_id, 0) + 1
+
+        self._build_subsumption()
+
+        # Índice de disparadores: el requerido más selectivo de cada regla
+        # raíz; los refinamientos se alcanzan desde su regla general
+        triggers = {}
+        always = []
+        for rule in self.rules:
+            if rule.anchor is not None:
+                continue
+            required_ids = compiled_kb.ids(rule.required)
+            if not required_ids:
+                always.append(rule.position)
+                continue
+            rule.trigger = min(required_ids, key=lambda symptom_id: (
+                self.disease_frequency(symptom_id), rule_frequency[symptom_id], symptom_id))
+            triggers.setdefault(rule.trigger, []).append(rule.position)
+
+        self.triggers = {symptom_id: tuple(positions) for symptom_id, positions in triggers.items()}
+        self.trigger_mask = 0
+        for symptom_id in self.triggers:
+            self.trigger_mask |= 1 << symptom_id
+        # Reglas sin requeridos: se cumplen siempre
+        self.always = tuple(always)
+        # Módulo generado con match(q); None = índice interpretado
+        self.matcher = None
+
+    def _build_subsumption(self):
+        """
+        DAG de subsunción sobre los requeridos: A es padre de B si los
+        requeridos de A son subconjunto de los de B (reducción transitiva).
+        Requeridos iguales se encadenan por posición. Cada regla se evalúa
+        bajo un solo padre (el más específico): si B se cumple, todos sus
+        padres también, así que basta recorrer ese árbol de cobertura.
+        """
+        rules = self.rules
+        self.parents = [() for _ in rules]
+        self.children = [[] for _ in rules]
+        self.refinements = [[] for _ in rules]
+
+        # Las reglas sin requeridos se cumplen siempre: no son padres útiles
+        order = sorted((rule for rule in rules if rule.required),
+                       key=lambda rule: (popcount(rule.required), rule.position))
+        for index, rule in enumerate(order):
+            general = [other for other in order[:index] if not other.required & ~rule.required]
+            parents = [
+                other for i, other in enumerate(general)
+                if not any(not other.required & ~more.required for more in general[i + 1:])
+            ]
+            if not parents:
+                continue
+            self.parents[rule.position] = tuple(parent.position for parent in parents)
+            for parent in parents:
+                self.children[parent.position].append(rule.position)
+            rule.anchor = parents[-1].position
+            rule.delta = rule.required & ~parents[-1].required
+            self.refinements[rule.anchor].append(rule.position)
+
+        self.parents = tuple(self.parents)
+        self.children = tuple(tuple(children) for children in self.children)
+        self.refinements = tuple(tuple(children) for children in self.refinements)
+
+    def subsumption_edges(self):
+        """Aristas (regla general, regla refinada) del DAG, por id de regla"""
+        return [
+            (self.rules[parent].id, rule.id)
+            for rule in self.rules
+            for parent in self.parents[rule.position]
+        ]
+
+    def disease_frequency(self, symptom_id):
+        """Cantidad de enfermedades de la KB que incluyen el síntoma"""
+        compiled_kb = self.compiled_kb
+        if symptom_id >= compiled_kb.num_symptoms:
+            return 0
+        return len(compiled_kb.main_postings[symptom_id]) + len(compiled_kb.secondary_postings[symptom_id])
+
+    def _intern_all(self, symptoms):
+        mask = 0
+        known = self.compiled_kb.symptom_ids
+        for symptom in symptoms:
+            symptom_id = known.get(symptom)
+            if symptom_id is None:
+                symptom_id = self.extra_ids.get(symptom)
+            if symptom_id is None:
+                symptom_id = self.compiled_kb.num_symptoms + len(self.extra_names)
+                self.extra_ids[symptom] = symptom_id
+                self.extra_names.append(symptom)
+            mask |= 1 << symptom_id
+        return mask
+
+    def encode(self, symptoms):
+        """Bitset de una consulta, incluyendo los síntomas propios de las reglas"""
+        mask = self.compiled_kb.encode(symptoms)
+        if self.extra_ids:
+            for symptom in symptoms:
+                symptom_id = self.extra_ids.get(symptom)
+                if symptom_id is not None:
+                    mask |= 1 << symptom_id
+        return mask
+
+    def decode(self, mask):
+        """Nombres de los síntomas de un bitset"""
+        num_symptoms = self.compiled_kb.num_symptoms
+        return [
+            self.compiled_kb.symptom_names[symptom_id] if symptom_id < num_symptoms
+            else self.extra_names[symptom_id - num_symptoms]
+            for symptom_id in self.compiled_kb.ids(mask)
+        ]
+
+    def match(self, query):
+        """
+        Posiciones (en orden) de las reglas cuyos requeridos están en la
+        consulta. Evaluación de un solo nivel: las reglas que consumen hechos
+        intermedios requieren la red Rete (ver rete.py).
+        """
+        if self.matcher is not None:
+            return self.matcher.match(query)
+        return self.match_indexed(query)
+
+    def match_indexed(self, query):
+        """match() recorriendo el índice de disparadores y el DAG, sin código generado"""
+        matched = list(self.always)
+        rules = self.rules
+        refinements = self.refinements
+        pending = [
+            position
+            for symptom_id in self.compiled_kb.ids(query & self.trigger_mask)
+            for position in self.triggers[symptom_id]
+            if not rules[position].required & ~query
+        ]
+        while pending:
+            position = pending.pop()
+            matched.append(position)
+            # Solo se prueban los requeridos que el refinamiento agrega
+            for child in refinements[position]:
+                if not rules[child].delta & ~query:
+                    pending.append(child)
+        matched.sort()
+        return matched
+
+    def evaluate(self, position, query):
+        """Resultado de una regla cumplida, con la bonificación por opcionales"""
+        rule = self.rules[position]
+        optional_met = query & rule.optional
+
+        return {
+            'rule_id': rule.id,
+            'conclusion': rule.conclusion,
+            'confidence': rule_confidence(rule.confidence, popcount(optional_met), rule.optional_count),
+            'required_met': list(rule.required_names),
+            'optional_met': self.decode(optional_met)
+        }
+
+    def infer(self, query):
+        """Todas las reglas de diagnóstico disparadas, ordenadas por confianza"""
+        matched_rules = [self.evaluate(position, query) for position in self.match(query)
+                         if not self.rules[position].is_fact]
+        matched_rules.sort(key=lambda x: x['confidence'], reverse=True)
+        return matched_rules
+
+
+def compile_rules(rules, compiled_kb, generate=True, persist=False):
+    """
+    Compila una lista de reglas IF-THEN sobre la KB compilada y, si
+    generate, carga su módulo generado (guardado en data/cache solo con
+    persist: las reglas del dataset)
+    """
+    rule_set = CompiledRuleSet(rules, compiled_kb)
+    if generate:
+        rule_set.matcher = load_matcher(rule_set, persist=persist)
+    return rule_set
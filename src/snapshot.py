@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+"""
+snapshot.py
+Snapshot binario compilado de los datasets del sistema
+Une la base de conocimiento, el catálogo de síntomas, la jerarquía de
+síntomas, las reglas IF-THEN y los casos de prueba en un único archivo versionado que se reconstruye solo cuando cambia un CSV
+Un CSV mal formado no impide cargar el resto: el error queda registrado en
+el snapshot y se sigue sirviendo la última versión válida de esa fuente.
+"""
+
+import csv
+import hashlib
+import os
+import pickle
+import tempfile
+import time
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data")
+CACHE_DIR = os.path.join(DATA_DIR, "cache")
+SNAPSHOT_PATH = os.path.join(CACHE_DIR, "knowledge_snapshot.bin")
+
+# Cambiar al modificar el formato del snapshot o de los parsers
+SNAPSHOT_FORMAT = 4
+SNAPSHOT_MAGIC = "SISTEMA-EXPERTO-SNAPSHOT"
+
+SOURCES = {
+    'diseases': "diseases_knowledge.csv",
+    'symptoms': "symptoms_list.csv",
+    'cases': "test_cases.csv",
+    'rules': "rules_knowledge.csv",
+    'hierarchy': "symptom_hierarchy.csv",
+}
+
+# Tipos de regla del dataset: 'diagnostico' concluye una enfermedad y
+# 'hecho' un hecho intermedio para el encadenamiento (ver rete.py)
+RULE_TYPES = {'diagnostico': None, 'hecho': 'fact'}
+
+# Snapshot en memoria por ruta: {ruta: (stats, snapshot)}
+_memory = {}
+
+# Intervalo mínimo (segundos) entre revisiones de las fuentes en get_data_version
+FRESHNESS_INTERVAL = 1.0
+_version = {'checked': None, 'digest': None}
+
+
+def _split_pipe(value):
+    """Separa una celda delimitada por '|'"""
+    return [item.strip() for item in value.split('|') if item.strip()]
+
+
+def _read_rows(path):
+    """
+    Lee un CSV como lista de diccionarios. ValueError (con el número de
+    línea) si una fila tiene menos o más celdas que el encabezado
+    """
+    rows = []
+    with open(path, encoding='utf-8', newline='') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            if None in row or None in row.values():
+                raise ValueError(f"{os.path.basename(path)}:{reader.line_num}: "
+                                 f"la fila no tiene las columnas del encabezado")
+            rows.append(row)
+    return rows
+
+
+def parse_diseases(path):
+    """Parsea diseases_knowledge.csv al formato de la base de conocimiento"""
+    knowledge_base = {}
+    for row in _read_rows(path):
+        main_symptoms = _split_pipe(row['sintomas_principales'])
+        secondary_symptoms = _split_pipe(row['sintomas_secundarios'])
+        knowledge_base[row['enfermedad'].strip()] = {
+            'symptoms_main': main_symptoms,
+            'symptoms_secondary': secondary_symptoms,
+            'symptoms_all': main_symptoms + secondary_symptoms,
+            'description': row['descripcion'].strip(),
+            'severity': row['severidad'].strip(),
+            'recommendations': _split_pipe(row['recomendaciones']),
+            'category': row['categoria'].strip()
+        }
+    return knowledge_base
+
+
+def parse_symptoms(path):
+    """Parsea symptoms_list.csv como lista de pares (categoria, sintoma)"""
+    rows = _read_rows(path)
+    if rows and ('categoria' not in rows[0] or 'sintoma' not in rows[0]):
+        raise ValueError("El dataset debe tener columnas 'categoria' y 'sintoma'")
+    return [(row['categoria'].strip(), row['sintoma'].strip()) for row in rows]
+
+
+def parse_cases(path):
+    """Parsea test_cases.csv al formato de casos de prueba"""
+    return [
+        {
+            'id': row['caso_id'].strip(),
+            'nombre': row['nombre_caso'].strip(),
+            'symptoms': _split_pipe(row['sintomas']),
+            'expected_diagnosis': row['diagnostico_esperado'].strip(),
+            'severity': row['severidad'].strip(),
+            'edad': int(row['edad']),
+            'sexo': row['sexo'].strip(),
+            'descripcion': row['descripcion_caso'].strip()
+        }
+        for row in _read_rows(path)
+    ]
+
+
+def parse_rules(path):
+    """Parsea rules_knowledge.csv al formato de reglas IF-THEN"""
+    rows = _read_rows(path)
+    columns = ('regla_id', 'tipo', 'sintomas_requeridos', 'sintomas_opcionales', 'conclusion', 'confianza')
+    if rows and any(column not in rows[0] for column in columns):
+        raise ValueError(f"El dataset de reglas debe tener columnas {', '.join(columns)}")
+    rules = []
+    for line, row in enumerate(rows, start=2):
+        rule_type = row['tipo'].strip() or 'diagnostico'
+        if rule_type not in RULE_TYPES:
+            raise ValueError(f"{SOURCES['rules']}:{line}: tipo de regla desconocido '{rule_type}'")
+        try:
+            confidence = float(row['confianza'])
+        except ValueError:
+            raise ValueError(f"{SOURCES['rules']}:{line}: confianza inválida '{row['confianza']}'")
+        rule = {
+            'id': row['regla_id'].strip(),
+            'conditions': {
+                'required': _split_pipe(row['sintomas_requeridos']),
+                'optional': _split_pipe(row['sintomas_opcionales'])
+            },
+            'conclusion': row['conclusion'].strip(),
+            'confidence': confidence
+        }
+        if RULE_TYPES[rule_type]:
+            rule['type'] = RULE_TYPES[rule_type]
+        rules.append(rule)
+    return rules
+
+
+def parse_hierarchy(path):
+    """Parsea symptom_hierarchy.csv como lista de pares (sintoma, padre): el síntoma es un caso del padre"""
+    rows = _read_rows(path)
+    if rows and ('sintoma' not in rows[0] or 'padre' not in rows[0]):
+        raise ValueError("El dataset de jerarquía debe tener columnas 'sintoma' y 'padre'")
+    pairs = []
+    for line, row in enumerate(rows, start=2):
+        symptom, parent = row['sintoma'].strip(), row['padre'].strip()
+        if not symptom or not parent or symptom == parent:
+            raise ValueError(f"{SOURCES['hierarchy']}:{line}: relación inválida '{symptom}' -> '{parent}'")
+        pairs.append((symptom, parent))
+    return pairs
+
+
+PARSERS = {
+    'diseases': parse_diseases,
+    'symptoms': parse_symptoms,
+    'cases': parse_cases,
+    'rules': parse_rules,
+    'hierarchy': parse_hierarchy,
+}
+
+
+def _source_path(name):
+    return os.path.join(DATA_DIR, SOURCES[name])
+
+
+def _stat_sources():
+    """(mtime_ns, tamaño) de cada fuente; None si no existe"""
+    stats = {}
+    for name in SOURCES:
+        try:
+            st_info = os.stat(_source_path(name))
+            stats[name] = (st_info.st_mtime_ns, st_info.st_size)
+        except FileNotFoundError:
+            stats[name] = None
+    return stats
+
+
+def _hash_file(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def _read_snapshot(path):
+    """Lee el snapshot en una sola lectura; None si no es válido"""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.loads(f.read())
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('magic') != SNAPSHOT_MAGIC:
+        return None
+    if snapshot.get('format') != SNAPSHOT_FORMAT:
+        return None
+    return snapshot
+
+
+def write_atomic(path, content):
+    """
+    Escribe bytes o texto (UTF-8) en un temporal propio (mkstemp: único
+    aunque escriban varios hilos a la vez) y lo renombra sobre path; un
+    directorio de solo lectura no es un error (caché en data/cache)
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    tmp_path = None
+    try:
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + '.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except OSError:
+        if tmp_path is not None:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+
+def _write_snapshot(snapshot, path):
+    """Guarda el snapshot serializado"""
+    write_atomic(path, pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _is_fresh(snapshot, stats):
+    """
+    Comprueba cada fuente: primero mtime/tamaño y, si difieren, el hash
+    del contenido. Retorna (vigente, hashes actualizados)
+    """
+    hashes = {}
+    for name, stat in stats.items():
+        recorded = snapshot['sources'].get(name)
+        if stat is None or recorded is None:
+            if stat != recorded:
+                return False, None
+            hashes[name] = None
+            continue
+        if tuple(recorded['stat']) == stat:
+            hashes[name] = recorded['sha256']
+            continue
+        digest = _hash_file(_source_path(name))
+        if digest != recorded['sha256']:
+            return False, None
+        hashes[name] = digest
+    return True, hashes
+
+
+def _parse_source(name, path):
+    """(datos, None) o (None, mensaje) si el CSV está mal formado"""
+    try:
+        return PARSERS[name](path), None
+    except (ValueError, csv.Error) as e:
+        return None, str(e)
+    except KeyError as e:
+        return None, f"{SOURCES[name]}: falta la columna {e}"
+
+
+def build_snapshot(stats=None, previous=None):
+    """
+    Compila los CSV en un snapshot nuevo. Una fuente que no se puede
+    parsear conserva los datos del snapshot previo (si los hay) y su
+    error queda en snapshot['errors']
+    """
+    stats = stats if stats is not None else _stat_sources()
+    sources = {}
+    data = {}
+    errors = {}
+    for name in PARSERS:
+        if stats[name] is None:
+            sources[name] = None
+            data[name] = None
+            continue
+        path = _source_path(name)
+        sources[name] = {'stat': stats[name], 'sha256': _hash_file(path)}
+        data[name], error = _parse_source(name, path)
+        if error:
+            errors[name] = error
+            if previous:
+                data[name] = previous['data'].get(name)
+    return _finalize({'magic': SNAPSHOT_MAGIC, 'format': SNAPSHOT_FORMAT,
+                      'sources': sources, 'data': data, 'errors': errors})
+
+
+def _finalize(snapshot):
+    """Calcula el digest global (versión de los datos) del snapshot"""
+    digest = hashlib.sha256(str(SNAPSHOT_FORMAT).encode())
+    for name in SOURCES:
+        source = snapshot['sources'].get(name)
+        digest.update(f"{name}:{source['sha256'] if source else '-'};".encode())
+    snapshot['digest'] = digest.hexdigest()
+    return snapshot
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    Retorna el snapshot vigente. Reutiliza la copia en memoria mientras
+    las fuentes no cambien y reconstruye el archivo solo si el contenido
+    de algún CSV cambió.
+    """
+    stats = _stat_sources()
+    cached = _memory.get(path)
+    if cached is not None and cached[0] == stats:
+        return cached[1]
+
+    snapshot = _read_snapshot(path)
+    fresh, hashes = _is_fresh(snapshot, stats) if snapshot else (False, None)
+    if fresh:
+        if any(snapshot['sources'][name] and tuple(snapshot['sources'][name]['stat']) != stats[name]
+               for name in SOURCES):
+            # Solo cambió el mtime: se actualiza el manifiesto sin re-parsear
+            for name in SOURCES:
+                if stats[name] is not None:
+                    snapshot['sources'][name] = {'stat': stats[name], 'sha256': hashes[name]}
+            _write_snapshot(snapshot, path)
+    else:
+        previous = snapshot or (cached[1] if cached else None)
+        snapshot = build_snapshot(stats, previous)
+        _write_snapshot(snapshot, path)
+
+    _memory[path] = (stats, snapshot)
+    return snapshot
+
+
+def get_section(name):
+    """
+    Datos compilados de una fuente; FileNotFoundError si el CSV no existe y
+    ValueError si está mal formado y no hay una versión válida anterior
+    """
+    snapshot = load_snapshot()
+    section = snapshot['data'][name]
+    if section is None:
+        if name in snapshot['errors']:
+            raise ValueError(snapshot['errors'][name])
+        raise FileNotFoundError(SOURCES[name])
+    return section
+
+
+def get_data_errors():
+    """Errores de parseo de las fuentes actuales: {fuente: mensaje}"""
+    return dict(load_snapshot()['errors'])
+
+
+def get_data_version():
+    """
+    Digest de los datos actualmente cargados. Las fuentes (os.stat de cada
+    CSV) se revisan como mucho una vez por FRESHNESS_INTERVAL: un cambio en
+    los datos se detecta con ese retraso máximo
+    """
+    now = time.monotonic()
+    if _version['checked'] is None or now - _version['checked'] >= FRESHNESS_INTERVAL:
+        _version['digest'] = load_snapshot()['digest']
+        _version['checked'] = now
+    return _version['digest']
@@ -8,14 +8,13 @@ Descripción:
     - Valida la entrada (mínimo 1 síntoma seleccionado)
 
 Funcionalidades:
-    - Carga de síntomas desde data/symptoms_list.csv
+    - Carga de síntomas desde data/symptoms_list.csv (vía snapshot compilado)
     - Interfaz Streamlit con checkboxes por categoría
     - Visualización de síntomas seleccionados
 """
 
 import streamlit as st
-import pandas as pd
-import os
+from snapshot import get_section
 
 # ====================================
 # CARGA DE SÍNTOMAS DESDE DATASET
@@ -23,23 +22,13 @@ import os
 
 def load_symptoms_from_dataset():
     """Carga los síntomas desde el dataset CSV."""
-    # Ruta al archivo de dataset
-    dataset_path = os.path.join(os.path.dirname(__file__), "..", "data", "symptoms_list.csv")
-    
     try:
-        # Leer el dataset
-        df = pd.read_csv(dataset_path)
-        
-        # Verificar que las columnas necesarias existan
-        if 'categoria' not in df.columns or 'sintoma' not in df.columns:
-            raise ValueError("El dataset debe tener columnas 'categoria' y 'sintoma'")
+        # Filas (categoria, sintoma) ya parseadas en el snapshot
+        rows = get_section('symptoms')
         
         # Crear diccionario con emojis
         symptoms_dict = {}
-        for _, row in df.iterrows():
-            categoria = str(row['categoria']).strip()
-            sintoma = str(row['sintoma']).strip()
-            
+        for categoria, sintoma in rows:
             # Asignar emoji según categoría
             if "Generales" in categoria:
                 key = f"🌡️ {categoria}"
@@ -283,7 +272,7 @@ def main():
 
         if st.button("🔄 Limpiar selección"):
             for k in list(st.session_state.keys()):
-                if k.startswith("symptom_") or k == "selected_symptoms":
+                if k.startswith("symptom_") or k in ("selected_symptoms", "dismissed_questions"):
                     del st.session_state[k]
             st.rerun()
     else:
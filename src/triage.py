@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+triage.py
+Triaje de emergencia previo al diagnóstico completo
+Nivel precompilado con las reglas y enfermedades de severidad 'grave': se
+evalúa con unas pocas operaciones de bitset antes del puntaje completo,
+para mostrar la alerta sin esperar al diferencial.
+"""
+
+from knowledge_base import popcount
+
+EMERGENCY_SEVERITY = 'grave'
+
+# Fracción de síntomas principales presentes que dispara la alerta
+# de una enfermedad grave sin regla cumplida
+TRIAGE_MAIN_FRACTION = 0.75
+
+
+class TriageTier:
+    """
+    Reglas cuya conclusión es grave (requeridos como bitset) y enfermedades
+    graves (principales como bitset). mask reúne todos sus síntomas: una
+    consulta sin ninguno sale con un solo AND.
+    """
+
+    def __init__(self, knowledge_base, compiled_kb, rule_set):
+        def is_emergency(disease):
+            info = knowledge_base.get(disease)
+            return info is not None and info['severity'].strip().lower() == EMERGENCY_SEVERITY
+
+        self.rules = tuple(
+            (rule.required, rule.id, rule.conclusion)
+            for rule in rule_set.rules
+            if not rule.is_fact and rule.required and is_emergency(rule.conclusion)
+        )
+        self.diseases = tuple(
+            (compiled_kb.main_masks[idx], compiled_kb.main_counts[idx], disease)
+            for idx, disease in enumerate(compiled_kb.disease_names)
+            if compiled_kb.main_counts[idx] and is_emergency(disease)
+        )
+        self.mask = 0
+        for required, _, _ in self.rules:
+            self.mask |= required
+        for main_mask, _, _ in self.diseases:
+            self.mask |= main_mask
+
+    def check(self, query):
+        """Alertas para el bitset de una consulta, sin duplicar enfermedades"""
+        if not query & self.mask:
+            return []
+        alerts = {}
+        for required, rule_id, disease in self.rules:
+            if not required & ~query and disease not in alerts:
+                alerts[disease] = {'disease': disease, 'source': 'rule', 'rule_id': rule_id}
+        for main_mask, main_count, disease in self.diseases:
+            if disease in alerts:
+                continue
+            main_matches = popcount(query & main_mask)
+            if main_matches and main_matches >= main_count * TRIAGE_MAIN_FRACTION:
+                alerts[disease] = {'disease': disease, 'source': 'symptoms', 'main_matches': main_matches}
+        return list(alerts.values())
+
+
+def build_triage(knowledge_base, compiled_kb, rule_set):
+    """Compila el nivel de triaje"""
+    return TriageTier(knowledge_base, compiled_kb, rule_set)
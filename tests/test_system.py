@@ -7,19 +7,54 @@ Pruebas Unitarias del Sistema Experto.
 import unittest
 import sys
 import os
+import pickle
+import numpy as np
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from itertools import combinations
 
 # Agregar src al path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
 
 from symptoms import get_all_symptoms, get_all_symptoms_flat, validate_symptoms
+import knowledge_base
 from knowledge_base import (
     get_knowledge_base, 
     get_disease_names, 
     get_disease_info,
-    create_simple_rules
+    create_simple_rules,
+    get_rules,
+    get_data_problems,
+    validate_rules,
+    compile_knowledge_base,
+    popcount,
+    search_diseases_by_symptom,
+    LIKELIHOOD_MAIN,
+    LIKELIHOOD_SECONDARY,
+    LIKELIHOOD_ABSENT,
+    NOISY_OR_LINK_MAIN,
+    NOISY_OR_LINK_SECONDARY,
+    NOISY_OR_LEAK
 )
-from inference_engine import InferenceEngine, diagnose
-from cases import load_test_cases, run_test_case
+import inference_engine
+from inference_engine import (
+    InferenceEngine,
+    DiagnosisResult,
+    DiagnosisSession,
+    diagnose,
+    diagnose_batch,
+    get_engine,
+    ABSENT_MAIN_PENALTY
+)
+from cases import load_test_cases, run_test_case, evaluate_test_cases
+import snapshot
+from rete import build_network
+from prover import build_prover
+from fuzzy import FUZZY_OPTIONAL_BONUS
+from rules import rule_confidence
+from comorbidity import explanation_cost
+import codegen
 
 
 class TestSymptoms(unittest.TestCase):
@@ -88,6 +123,162 @@ class TestKnowledgeBase(unittest.TestCase):
         self.assertIn('conditions', rule)
         self.assertIn('conclusion', rule)
         self.assertIn('confidence', rule)
+    
+    def test_rules_loaded_from_dataset(self):
+        """Las reglas se cargan del dataset una vez y se comparten compiladas"""
+        rules = get_rules()
+        self.assertIsInstance(rules, tuple)
+        self.assertIs(get_rules(), rules)
+        self.assertEqual(len(rules), len(create_simple_rules()))
+        
+        # create_simple_rules entrega copias editables
+        editable = create_simple_rules()
+        editable[0]['conditions']['required'].append('Tos seca')
+        self.assertNotEqual(len(rules[0]['conditions']['required']),
+                            len(editable[0]['conditions']['required']))
+        
+        first, second = InferenceEngine(), InferenceEngine()
+        self.assertIs(first.rules, rules)
+        self.assertIs(first.rule_set, second.rule_set)
+    
+    def test_validate_rules(self):
+        """Síntomas y conclusiones de las reglas se validan contra los datos"""
+        kb = get_knowledge_base()
+        catalog = get_all_symptoms_flat()
+        self.assertEqual(validate_rules(get_rules(), kb, catalog), [])
+        
+        rules = [
+            {'id': 'febril', 'type': 'fact', 'conditions': {'required': ['Escalofríos'], 'optional': []},
+             'conclusion': 'Síndrome febril', 'confidence': 0.9},
+            {'id': 'gripe', 'conditions': {'required': ['Síndrome febril', 'Tos seca'], 'optional': []},
+             'conclusion': 'Gripe (Influenza)', 'confidence': 0.8},
+            {'id': 'gripe', 'conditions': {'required': ['Síntoma inventado'], 'optional': []},
+             'conclusion': 'Enfermedad inventada', 'confidence': 1.5},
+        ]
+        problems = validate_rules(rules, kb, catalog)
+        self.assertEqual(len(problems), 4)
+        self.assertTrue(all("'gripe'" in problem for problem in problems))
+        
+        # Sin requeridos la regla se dispararía con cualquier consulta
+        rules = [{'id': 'siempre', 'conditions': {'required': [], 'optional': ['Tos seca']},
+                  'conclusion': 'Gripe (Influenza)', 'confidence': 0.5}]
+        self.assertEqual(validate_rules(rules, kb, catalog), ["Regla 'siempre': sin síntomas requeridos"])
+    
+    def test_invalid_rules_keep_last_valid(self):
+        """Unas reglas inválidas no impiden diagnosticar: se sirven las últimas válidas"""
+        valid = get_rules()
+        original_section, original_version = knowledge_base.get_section, knowledge_base.get_data_version
+        broken = [dict(create_simple_rules()[0], confidence=1.5)]
+        knowledge_base.get_section = lambda name: broken if name == 'rules' else original_section(name)
+        knowledge_base.get_data_version = lambda: 'reglas-rotas'
+        try:
+            self.assertEqual(get_rules(), valid)
+            self.assertTrue(any('confianza fuera de [0, 1]' in problem for problem in get_data_problems()))
+        finally:
+            knowledge_base.get_section, knowledge_base.get_data_version = original_section, original_version
+        self.assertEqual(get_rules(), valid)
+        self.assertEqual(get_data_problems(), [])
+        
+        # Sin archivo de reglas: ninguna regla, el diagnóstico sigue funcionando
+        def missing_rules(name):
+            if name == 'rules':
+                raise FileNotFoundError(snapshot.SOURCES['rules'])
+            return original_section(name)
+        knowledge_base.get_section = missing_rules
+        knowledge_base.get_data_version = lambda: 'sin-reglas'
+        try:
+            self.assertEqual(get_rules(), ())
+            self.assertTrue(any(snapshot.SOURCES['rules'] in problem for problem in get_data_problems()))
+            engine = InferenceEngine(rules=get_rules())
+            self.assertTrue(engine.diagnose(['Tos seca', 'Fiebre alta (más de 38.5°C)'], 'hybrid'))
+        finally:
+            knowledge_base.get_section, knowledge_base.get_data_version = original_section, original_version
+    
+    def test_compiled_knowledge_base(self):
+        """Verificar IDs enteros y bitsets de la KB compilada"""
+        kb = get_knowledge_base()
+        compiled = compile_knowledge_base(kb)
+        
+        self.assertEqual(compiled.num_diseases, len(kb))
+        for idx, (name, info) in enumerate(kb.items()):
+            self.assertEqual(compiled.disease_names[idx], name)
+            self.assertEqual(set(compiled.decode(compiled.main_masks[idx])), set(info['symptoms_main']))
+            self.assertEqual(set(compiled.decode(compiled.all_masks[idx])), set(info['symptoms_all']))
+    
+    def test_lazy_model_matrices(self):
+        """Cada modelo construye sus matrices la primera vez que las usa"""
+        compiled = compile_knowledge_base(get_knowledge_base())
+        self.assertFalse(compiled.matrices['all'].flags.writeable)
+        self.assertEqual(compiled._model_matrices, {})
+        
+        noisy_or = compiled.model_matrices('noisy_or')
+        self.assertEqual(set(compiled._model_matrices), {'noisy_or'})
+        self.assertIs(compiled.model_matrices('noisy_or'), noisy_or)
+        self.assertFalse(noisy_or['log_odds'].flags.writeable)
+        
+        bayes = compiled.model_matrices('bayes')
+        self.assertEqual(set(compiled._model_matrices), {'bayes', 'noisy_or'})
+        self.assertEqual(bayes['likelihood'].shape, compiled.matrices['all'].shape)
+    
+    def test_bitset_overlap(self):
+        """El AND + popcount coincide con la intersección de conjuntos"""
+        compiled = compile_knowledge_base()
+        info = get_disease_info(compiled.disease_names[0])
+        query = info['symptoms_main'][:2] + ['Síntoma inexistente']
+        
+        overlap = popcount(compiled.encode(query) & compiled.all_masks[0])
+        self.assertEqual(overlap, len(set(query) & set(info['symptoms_all'])))
+    
+    def test_search_by_symptom_index(self):
+        """La búsqueda por índice invertido equivale al recorrido lineal"""
+        kb = get_knowledge_base()
+        symptom = 'Fiebre alta (más de 38.5°C)'
+        expected = []
+        for name, info in kb.items():
+            if symptom in info['symptoms_main']:
+                expected.append((name, True))
+            elif symptom in info['symptoms_secondary']:
+                expected.append((name, False))
+        
+        self.assertEqual(search_diseases_by_symptom(symptom), expected)
+        self.assertEqual(search_diseases_by_symptom('Síntoma inexistente'), [])
+    
+    def test_candidate_pruning(self):
+        """Solo son candidatas las enfermedades que comparten algún síntoma"""
+        compiled = compile_knowledge_base()
+        query = compiled.encode(['Tos seca', 'Estornudos frecuentes'])
+        candidates = compiled.candidates(query)
+        
+        for idx in range(compiled.num_diseases):
+            shares = bool(query & compiled.all_masks[idx])
+            self.assertEqual(idx in candidates, shares)
+    
+    def test_symptom_hierarchy(self):
+        """El cierre de ancestros de la jerarquía es-un se precompila como bitset"""
+        compiled = compile_knowledge_base()
+        self.assertEqual(sorted(compiled.ancestors('Dolor pleurítico')),
+                         ['Dolor en el pecho', 'Dolor en el pecho al respirar'])
+        self.assertEqual(sorted(compiled.ancestors('Escalofríos con fiebre')), ['Escalofríos', 'Fiebre'])
+        self.assertEqual(compiled.ancestors('Tos seca'), ['Tos'])
+        self.assertEqual(compiled.ancestors('Fiebre'), [])
+        
+        query = compiled.encode(['Dolor pleurítico', 'Náuseas'])
+        self.assertEqual(set(compiled.decode(compiled.expand(query))),
+                         {'Dolor pleurítico', 'Náuseas', 'Dolor en el pecho', 'Dolor en el pecho al respirar'})
+        
+        with self.assertRaises(ValueError):
+            compile_knowledge_base(get_knowledge_base(), [], [('Tos', 'Tos seca'), ('Tos seca', 'Tos')])
+        
+        # La KB compartida se compila sin una jerarquía con ciclos y lo registra
+        original_section, original_version = knowledge_base.get_section, knowledge_base.get_data_version
+        cycle = [('Tos', 'Tos seca'), ('Tos seca', 'Tos')]
+        knowledge_base.get_section = lambda name: cycle if name == 'hierarchy' else original_section(name)
+        knowledge_base.get_data_version = lambda: 'jerarquia-con-ciclo'
+        try:
+            self.assertEqual(knowledge_base.get_compiled_knowledge_base().ancestors('Dolor pleurítico'), [])
+            self.assertTrue(any('Ciclo' in problem for problem in get_data_problems()))
+        finally:
+            knowledge_base.get_section, knowledge_base.get_data_version = original_section, original_version
 
 
 class TestInferenceEngine(unittest.TestCase):
@@ -129,12 +320,376 @@ class TestInferenceEngine(unittest.TestCase):
             self.assertIn('confidence', result)
             self.assertIn('matched_symptoms', result)
     
+    def test_vectorized_forward_chaining(self):
+        """El backend NumPy produce los mismos resultados que el de bitsets"""
+        python_engine = InferenceEngine(backend='python')
+        numpy_engine = InferenceEngine(backend='numpy')
+        
+        for symptoms in (self.test_symptoms, [c['symptoms'] for c in load_test_cases()][-1]):
+            expected = python_engine.forward_chaining(symptoms)
+            results = numpy_engine.forward_chaining(symptoms)
+            
+            self.assertEqual([r['disease'] for r in results], [r['disease'] for r in expected])
+            for result, reference in zip(results, expected):
+                self.assertAlmostEqual(result['confidence'], reference['confidence'], places=12)
+                self.assertEqual(result['matched_symptoms'], reference['matched_symptoms'])
+    
+    def test_invalid_backend(self):
+        """Un backend desconocido es un error"""
+        with self.assertRaises(ValueError):
+            InferenceEngine(backend='gpu')
+    
+    def test_next_questions(self):
+        """La ganancia vectorizada coincide con la entropía esperada de cada pregunta"""
+        symptoms = ['Fiebre alta (más de 38.5°C)', 'Tos seca']
+        posterior = self.engine.symptom_posterior(symptoms)
+        self.assertAlmostEqual(posterior.sum(), 1.0)
+        likelihood = self.engine.compiled.model_matrices('bayes')['likelihood']
+        
+        def entropy(p):
+            p = p[p > 0]
+            return -(p * np.log(p)).sum()
+        
+        questions = self.engine.next_questions(symptoms, top_n=5, candidates=get_all_symptoms_flat())
+        self.assertEqual(len(questions), 5)
+        gains = [q['information_gain'] for q in questions]
+        self.assertEqual(gains, sorted(gains, reverse=True))
+        for question in questions:
+            self.assertNotIn(question['symptom'], symptoms)
+            column = likelihood[:, self.engine.compiled.symptom_ids[question['symptom']]]
+            p_yes = (posterior * column).sum()
+            expected = entropy(posterior) - (p_yes * entropy(posterior * column / p_yes)
+                                             + (1 - p_yes) * entropy(posterior * (1 - column) / (1 - p_yes)))
+            self.assertAlmostEqual(question['information_gain'], expected)
+        
+        best = questions[0]['symptom']
+        following = self.engine.next_questions(symptoms, top_n=5, candidates=get_all_symptoms_flat(), exclude=[best])
+        self.assertNotIn(best, [q['symptom'] for q in following])
+        self.assertEqual(self.engine.next_questions(symptoms, candidates=['Tos seca']), [])
+        
+        # Una respuesta negativa multiplica el posterior por 1 - P(s|d)
+        column = likelihood[:, self.engine.compiled.symptom_ids[best]]
+        expected = posterior * (1 - column)
+        np.testing.assert_allclose(self.engine.symptom_posterior(symptoms, absent_symptoms=[best]),
+                                   expected / expected.sum())
+        answered = self.engine.next_questions(symptoms, top_n=5, candidates=get_all_symptoms_flat(),
+                                              absent_symptoms=[best])
+        self.assertNotIn(best, [q['symptom'] for q in answered])
+        self.assertNotEqual([q['information_gain'] for q in answered], [q['information_gain'] for q in following])
+    
+    def test_comorbidity_search(self):
+        """La búsqueda con poda encuentra los mismos conjuntos que enumerarlos todos"""
+        kb = get_knowledge_base()
+        symptoms = kb['Gastroenteritis']['symptoms_main'] + kb['Conjuntivitis']['symptoms_main'][:2]
+        compiled = self.engine.compiled
+        query = compiled.encode(symptoms)
+        
+        candidates = compiled.candidates(query)
+        ranked = sorted(
+            (explanation_cost(compiled, query, combo), size, list(combo))
+            for size in (1, 2, 3)
+            for combo in combinations(candidates, size)
+        )
+        expected = [(cost, [compiled.disease_names[i] for i in combo]) for cost, _, combo in ranked[:5]]
+        
+        explanations = self.engine.comorbidity_search(symptoms, max_size=3, top_n=5)
+        self.assertEqual([(e['cost'], e['diseases']) for e in explanations], expected)
+        
+        best = explanations[0]
+        self.assertEqual(best['diseases'], ['Gastroenteritis', 'Conjuntivitis'])
+        self.assertEqual(best['unexplained_symptoms'], [])
+        self.assertEqual(best['missing_symptoms'], ['Sensación de arena en ojos'])
+        self.assertEqual(best['coverage'], 1.0)
+    
+    def test_emergency_triage(self):
+        """El triaje marca las conclusiones graves sin el diagnóstico completo"""
+        cases = {case['expected_diagnosis']: case for case in load_test_cases()}
+        
+        result = self.engine.triage(cases['Infarto Agudo de Miocardio (sospecha)']['symptoms'])
+        self.assertTrue(result['emergency'])
+        self.assertEqual(result['alerts'][0]['disease'], 'Infarto Agudo de Miocardio (sospecha)')
+        self.assertEqual(result['alerts'][0]['source'], 'rule')
+        
+        self.assertEqual(self.engine.triage(cases['Resfriado Común']['symptoms']),
+                         {'emergency': False, 'alerts': []})
+        
+        # Toda regla grave disparada en el diagnóstico aparece en el triaje
+        kb = get_knowledge_base()
+        for case in cases.values():
+            alerts = {alert['disease'] for alert in self.engine.triage(case['symptoms'])['alerts']}
+            for fired in self.engine.rule_based_inference(case['symptoms']):
+                if kb[fired['conclusion']]['severity'] == 'grave':
+                    self.assertIn(fired['conclusion'], alerts)
+    
+    def test_backward_chaining_table(self):
+        """La tabla diferencial coincide con verificar cada hipótesis por separado"""
+        symptoms = load_test_cases()[0]['symptoms']
+        table = self.engine.backward_chaining_table(symptoms)
+        self.assertEqual(table['hypothesis'], list(self.engine.compiled.disease_names))
+        
+        for i, disease in enumerate(table['hypothesis']):
+            single = self.engine.backward_chaining(symptoms, disease)
+            self.assertEqual(bool(table['confirmed'][i]), single['confirmed'])
+            self.assertEqual(float(table['confidence'][i]), single['confidence'])
+            self.assertEqual(table['present_symptoms'][i], single['present_symptoms'])
+            self.assertEqual(table['missing_symptoms'][i], single['missing_symptoms'])
+            self.assertEqual(table['missing_count'][i], len(single['missing_symptoms']))
+        
+        # Subconjunto: en el orden pedido, sin enfermedades desconocidas
+        subset = self.engine.backward_chaining_table(symptoms, ['Migraña', 'No existe', 'Gripe (Influenza)'])
+        self.assertEqual(subset['hypothesis'], ['Migraña', 'Gripe (Influenza)'])
+        self.assertEqual(len(subset['confidence']), 2)
+    
+    def test_absent_symptoms(self):
+        """Los síntomas confirmados ausentes bajan el score de las enfermedades que los esperan"""
+        symptoms = ['Tos con flema (productiva)', 'Dificultad para respirar (disnea)', 'Escalofríos']
+        absent = ['Fiebre alta (más de 38.5°C)', 'Tos con flema (productiva)']
+        
+        def scores(results):
+            return {r['disease']: r['confidence'] for r in results}
+        
+        before = scores(self.engine.forward_chaining(symptoms))
+        after = scores(self.engine.forward_chaining(symptoms, absent_symptoms=absent))
+        # Neumonía: 1 de 4 principales ausente (Tos con flema está presente: prevalece)
+        self.assertAlmostEqual(after['Neumonía'], before['Neumonía'] * (1 - ABSENT_MAIN_PENALTY / 4))
+        
+        numpy_engine = InferenceEngine(backend='numpy')
+        for method in ('forward', 'hybrid', 'rules'):
+            expected = self.engine.diagnose(symptoms, method, absent_symptoms=absent)
+            self.assertEqual(numpy_engine.diagnose(symptoms, method, absent_symptoms=absent), expected)
+            self.assertEqual(DiagnosisSession(self.engine, symptoms).ranking(method, absent_symptoms=absent),
+                             expected)
+            for top_k in (1, 3):
+                self.assertEqual(self.engine.diagnose(symptoms, method, top_k=top_k, absent_symptoms=absent),
+                                 expected[:top_k])
+        
+        single = self.engine.backward_chaining(symptoms, 'Neumonía', absent_symptoms=absent)
+        self.assertEqual(single['absent_symptoms'], ['Fiebre alta (más de 38.5°C)'])
+        self.assertNotIn('Fiebre alta (más de 38.5°C)', single['missing_symptoms'])
+        table = self.engine.backward_chaining_table(symptoms, absent_symptoms=absent)
+        for i, disease in enumerate(table['hypothesis']):
+            single = self.engine.backward_chaining(symptoms, disease, absent_symptoms=absent)
+            self.assertAlmostEqual(float(table['confidence'][i]), single['confidence'])
+            self.assertEqual(table['missing_symptoms'][i], single['missing_symptoms'])
+            self.assertEqual(table['absent_symptoms'][i], single['absent_symptoms'])
+    
+    def test_symptom_hierarchy(self):
+        """Con jerarquía, un síntoma específico satisface los requisitos de sus ancestros"""
+        hierarchy_engine = InferenceEngine(hierarchy=True)
+        symptoms = ['Dolor periumbilical que migra a cuadrante inferior derecho', 'Náuseas',
+                    'Fiebre baja (37.5°C - 38.5°C)']
+        expanded = hierarchy_engine._expand_names(symptoms)
+        self.assertIn('Fiebre', expanded)
+        
+        for method in ('forward', 'rules', 'hybrid', 'bayes', 'noisy_or', 'fuzzy'):
+            self.assertEqual(hierarchy_engine.diagnose(symptoms, method),
+                             self.engine.diagnose(expanded, method))
+            self.assertEqual(DiagnosisSession(hierarchy_engine, symptoms).ranking(method),
+                             hierarchy_engine.diagnose(symptoms, method))
+        
+        # La regla de apendicitis pide 'Fiebre': solo se cumple con la jerarquía
+        fired = {r['rule_id'] for r in hierarchy_engine.rule_based_inference(symptoms)}
+        self.assertIn('apendicitis', fired)
+        self.assertNotIn('apendicitis', {r['rule_id'] for r in self.engine.rule_based_inference(symptoms)})
+        
+        # Las funciones de módulo usan el motor con jerarquía cuando se pide
+        batch = [symptoms, ['Tos seca']]
+        self.assertEqual(diagnose_batch(batch, 'hybrid', hierarchy=True),
+                         [diagnose(case, 'hybrid', hierarchy=True) for case in batch])
+        chest_pain = ['Dolor pleurítico', 'Dolor que irradia al brazo izquierdo', 'Sudoración fría']
+        self.assertFalse(inference_engine.triage(chest_pain)['emergency'])
+        alerts = inference_engine.triage(chest_pain, hierarchy=True)['alerts']
+        self.assertIn('infarto_miocardio', [alert.get('rule_id') for alert in alerts])
+    
     def test_rule_based_inference(self):
         """Verificar inferencia basada en reglas"""
         results = self.engine.rule_based_inference(self.test_symptoms)
         
         self.assertIsInstance(results, list)
     
+    def test_rule_trigger_index(self):
+        """Cada regla se indexa bajo su requerido más selectivo"""
+        rule_set = self.engine.rule_set
+        indexed = [p for positions in rule_set.triggers.values() for p in positions]
+        refined = [p for children in rule_set.refinements for p in children]
+        self.assertEqual(sorted(indexed + refined + list(rule_set.always)),
+                         list(range(len(self.engine.rules))))
+        
+        for rule in rule_set.rules:
+            if rule.anchor is not None:
+                continue
+            self.assertTrue(rule.required >> rule.trigger & 1)
+            frequencies = [rule_set.disease_frequency(i) for i in rule_set.compiled_kb.ids(rule.required)]
+            self.assertEqual(rule_set.disease_frequency(rule.trigger), min(frequencies))
+    
+    def test_compiled_rules_match_interpreted(self):
+        """Las reglas compiladas disparan lo mismo que la evaluación de conjuntos"""
+        for case in load_test_cases():
+            user_set = set(case['symptoms'])
+            expected = sorted(
+                rule['id'] for rule in self.engine.rules
+                if set(rule['conditions']['required']).issubset(user_set)
+            )
+            fired = self.engine.rule_based_inference(case['symptoms'])
+            self.assertEqual(sorted(r['rule_id'] for r in fired), expected)
+    
+    def test_subsumption_dag(self):
+        """Los refinamientos cuelgan de su regla general y se evalúan bajo ella"""
+        self.assertIn(('angina_pecho', 'infarto_miocardio'), self.engine.rule_set.subsumption_edges())
+        
+        def rule(rule_id, required):
+            return {'id': rule_id, 'conditions': {'required': required, 'optional': []},
+                    'conclusion': 'Migraña', 'confidence': 0.7}
+        
+        a, b, c, d = ['Dolor de cabeza (cefalea)', 'Náuseas', 'Mareos', 'Visión borrosa']
+        rules = [rule('ab', [a, b]), rule('a', [a]), rule('abc', [a, b, c]), rule('ac', [a, c]),
+                 rule('abc_bis', [c, b, a]), rule('d', [d])]
+        engine = InferenceEngine(rules=rules)
+        rule_set = engine.rule_set
+        self.assertEqual(sorted(rule_set.subsumption_edges()), [
+            ('a', 'ab'), ('a', 'ac'), ('ab', 'abc'), ('abc', 'abc_bis'), ('ac', 'abc')
+        ])
+        # Solo las raíces están en el índice de disparadores
+        self.assertEqual(sorted(p for ps in rule_set.triggers.values() for p in ps), [1, 5])
+        
+        for query in [[a], [a, b], [a, c], [a, b, c], [b, c], [a, b, c, d], [d]]:
+            expected = sorted(r['id'] for r in rules if set(r['conditions']['required']) <= set(query))
+            encoded = rule_set.encode(query)
+            self.assertEqual(rule_set.match(encoded), rule_set.match_indexed(encoded))
+            fired = engine.rule_based_inference(query)
+            self.assertEqual(sorted(r['rule_id'] for r in fired), expected)
+    
+    def test_generated_rule_module(self):
+        """El módulo generado se cachea por firma y empareja como el índice"""
+        rule_set = self.engine.rule_set
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        signature = codegen.rule_set_signature(rule_set)
+        codegen._modules.pop(signature, None)
+        stale = os.path.join(cache_dir, 'rules_0000000000000000.py')
+        with open(stale, 'w', encoding='utf-8') as f:
+            f.write('SIGNATURE = None\n')
+        
+        module = codegen.load_matcher(rule_set, cache_dir)
+        path = os.path.join(cache_dir, f"rules_{signature[:16]}.py")
+        self.assertTrue(os.path.exists(path))
+        # Solo queda el módulo del conjunto vigente
+        self.assertFalse(os.path.exists(stale))
+        with open(path, encoding='utf-8') as f:
+            source = f.read()
+        self.assertIn("'gripe_clasica'", source)
+        
+        # Otro proceso importaría el archivo existente sin regenerarlo
+        codegen._modules.pop(signature)
+        mtime = os.stat(path).st_mtime_ns
+        reloaded = codegen.load_matcher(rule_set, cache_dir)
+        self.assertEqual(os.stat(path).st_mtime_ns, mtime)
+        self.assertEqual(reloaded.SIGNATURE, signature)
+        self.assertIs(codegen.load_matcher(rule_set, cache_dir), reloaded)
+        
+        for case in load_test_cases():
+            query = rule_set.encode(case['symptoms'])
+            self.assertEqual(module.match(query), rule_set.match_indexed(query))
+            self.assertEqual(reloaded.match(query), rule_set.match_indexed(query))
+        
+        # Las reglas propias de un motor no se guardan en la caché
+        custom = InferenceEngine(rules=create_simple_rules()[:3]).rule_set
+        custom_name = f"rules_{codegen.rule_set_signature(custom)[:16]}.py"
+        self.assertFalse(os.path.exists(os.path.join(codegen.CACHE_DIR, custom_name)))
+    
+    def test_bayes_inference(self):
+        """Las posteriores de 'bayes' coinciden con Naive Bayes calculado síntoma a síntoma"""
+        kb = get_knowledge_base()
+        symptoms = set(self.test_symptoms)
+        vocabulary = self.engine.compiled.symptom_names
+        
+        log_scores = {}
+        for disease, info in kb.items():
+            total = 0.0
+            for symptom in vocabulary:
+                if symptom in info['symptoms_main']:
+                    p = LIKELIHOOD_MAIN
+                elif symptom in info['symptoms_all']:
+                    p = LIKELIHOOD_SECONDARY
+                else:
+                    p = LIKELIHOOD_ABSENT
+                total += np.log(p if symptom in symptoms else 1 - p)
+            log_scores[disease] = total
+        top = max(log_scores.values())
+        normalizer = sum(np.exp(score - top) for score in log_scores.values())
+        
+        results = self.engine.diagnose(self.test_symptoms, 'bayes')
+        self.assertEqual(results[0]['disease'], 'Gripe (Influenza)')
+        for result in results:
+            expected = np.exp(log_scores[result['disease']] - top) / normalizer
+            self.assertAlmostEqual(result['confidence'], expected)
+        confidences = [r['confidence'] for r in results]
+        self.assertEqual(confidences, sorted(confidences, reverse=True))
+        self.assertLessEqual(sum(confidences), 1 + 1e-9)
+    
+    def test_noisy_or_inference(self):
+        """'noisy_or' coincide con la verosimilitud noisy-OR calculada síntoma a síntoma"""
+        kb = get_knowledge_base()
+        symptoms = set(self.test_symptoms)
+        vocabulary = self.engine.compiled.symptom_names
+        
+        log_scores = {}
+        for disease, info in kb.items():
+            total = 0.0
+            for symptom in vocabulary:
+                if symptom in info['symptoms_main']:
+                    link = NOISY_OR_LINK_MAIN
+                elif symptom in info['symptoms_all']:
+                    link = NOISY_OR_LINK_SECONDARY
+                else:
+                    link = 0.0
+                p_absent = (1 - NOISY_OR_LEAK) * (1 - link)
+                total += np.log(1 - p_absent if symptom in symptoms else p_absent)
+            log_scores[disease] = total
+        top = max(log_scores.values())
+        normalizer = sum(np.exp(score - top) for score in log_scores.values())
+        
+        results = self.engine.diagnose(self.test_symptoms, 'noisy_or')
+        self.assertEqual(results[0]['disease'], 'Gripe (Influenza)')
+        for result in results:
+            expected = np.exp(log_scores[result['disease']] - top) / normalizer
+            self.assertAlmostEqual(result['confidence'], expected)
+        self.assertEqual(results, self.engine.noisy_or_batch([self.test_symptoms])[0])
+    
+    def test_fuzzy_inference(self):
+        """Grados difusos: min sobre requeridos, max sobre opcionales, calculados regla a regla"""
+        kb = get_knowledge_base()
+        intensities = {symptom: 1.0 for symptom in self.test_symptoms}
+        intensities['Fiebre alta (más de 38.5°C)'] = 0.4
+        intensities['Dolor de garganta'] = 0.6
+        memberships = self.engine.fuzzy_memberships(intensities)
+        
+        for idx, (disease, info) in enumerate(kb.items()):
+            main = [intensities.get(s, 0.0) for s in info['symptoms_main']]
+            secondary = [intensities.get(s, 0.0) for s in info['symptoms_all'] if s not in info['symptoms_main']]
+            required = min(main) if main else 0.0
+            optional = max(secondary) if secondary else 1.0
+            self.assertAlmostEqual(memberships['disease'][idx],
+                                   required * (1 - FUZZY_OPTIONAL_BONUS + FUZZY_OPTIONAL_BONUS * optional))
+        
+        rules = [rule for rule in self.engine.rules if rule.get('type') != 'fact']
+        for position, rule in enumerate(rules):
+            required = min((intensities.get(s, 0.0) for s in rule['conditions']['required']), default=1.0)
+            optional = [intensities.get(s, 0.0) for s in rule['conditions'].get('optional', [])]
+            confidence = rule_confidence(rule['confidence'], max(optional), 1) \
+                if optional else rule['confidence']
+            self.assertAlmostEqual(memberships['rule'][position], required * confidence)
+        
+        results = self.engine.diagnose(intensities, 'fuzzy')
+        self.assertEqual(results[0]['disease'], 'Gripe (Influenza)')
+        self.assertLessEqual(results[0]['confidence'], 0.4 + 1e-9)
+        self.assertLessEqual(set(results[0]['matched_symptoms']), set(intensities))
+        # Con intensidades 0/1 basta la lista de síntomas
+        self.assertEqual(self.engine.diagnose(self.test_symptoms, 'fuzzy'),
+                         self.engine.diagnose(dict.fromkeys(self.test_symptoms, 1.0), 'fuzzy'))
+        with self.assertRaises(ValueError):
+            self.engine.fuzzy_inference({'Tos seca': 1.5})
+    
     def test_hybrid_inference(self):
         """Verificar método híbrido"""
         results = self.engine.hybrid_inference(self.test_symptoms)
@@ -151,6 +706,162 @@ class TestInferenceEngine(unittest.TestCase):
         
         self.assertIsInstance(results, list)
     
+    def test_slotted_result_records(self):
+        """Los resultados son registros con slots que se comportan como dict"""
+        results = diagnose(self.test_symptoms, method='hybrid')
+        result = results[0]
+        info = get_disease_info(result['disease'])
+        
+        self.assertIsInstance(result, DiagnosisResult)
+        self.assertFalse(hasattr(result, '__dict__'))
+        self.assertEqual(result['description'], info['description'])
+        self.assertEqual(result['recommendations'], info['recommendations'])
+        self.assertEqual(result.get('confidence', 'sin clave'), 'sin clave')
+        self.assertIn('final_confidence', result)
+        self.assertEqual(set(result.keys()), set(dict(result).keys()))
+        with self.assertRaises(KeyError):
+            result['main_matches']
+        
+        # Al serializar se convierte en un dict simple
+        restored = pickle.loads(pickle.dumps(result))
+        self.assertIsInstance(restored, dict)
+        self.assertEqual(restored, dict(result))
+    
+    def test_diagnose_batch(self):
+        """El lote coincide con diagnósticos individuales"""
+        symptom_sets = [
+            self.test_symptoms,
+            ['Congestión nasal', 'Estornudos frecuentes'],
+            list(reversed(self.test_symptoms)),
+            [],
+            # Empate exacto en bayes (ACV / Pielonefritis): mismo orden que el individual
+            ['Escalofríos', 'Dolor en el pecho al respirar', 'Debilidad muscular súbita en un lado',
+             'Náuseas matutinas']
+        ]
+        
+        for method in ('forward', 'rules', 'hybrid', 'bayes', 'noisy_or', 'fuzzy'):
+            batch = diagnose_batch(symptom_sets, method=method)
+            self.assertEqual(len(batch), len(symptom_sets))
+            for symptoms, results in zip(symptom_sets, batch):
+                expected = diagnose(symptoms, method=method)
+                self.assertEqual([r['disease'] for r in results], [r['disease'] for r in expected])
+            
+            # Conjuntos idénticos: mismos resultados, listas independientes
+            self.assertEqual([r['disease'] for r in batch[0]], [r['disease'] for r in batch[2]])
+            self.assertIsNot(batch[0], batch[2])
+        
+        # Los modelos probabilísticos suman igual solos o en lote: mismos valores, no solo mismo orden
+        for method in ('bayes', 'noisy_or'):
+            for size in (1, 2, 5):
+                batch = diagnose_batch(symptom_sets[-1:] * size, method=method)
+                self.assertEqual(batch[0], diagnose(symptom_sets[-1], method=method))
+    
+    def test_top_k_matches_full_sort(self):
+        """El top-k con poda coincide con el ordenamiento completo"""
+        symptom_sets = [case['symptoms'] for case in load_test_cases()]
+        summary = lambda results: [(r['disease'], r.get('final_confidence', r.get('confidence'))) for r in results]
+        
+        for backend in ('python', 'numpy'):
+            # Segunda regla con la misma conclusión que otra existente
+            rules = create_simple_rules()
+            rules.append(dict(rules[0], id='regla_duplicada', confidence=0.5))
+            engine = InferenceEngine(backend=backend, rules=rules)
+            
+            for symptoms in symptom_sets:
+                for method in ('forward', 'rules', 'hybrid', 'bayes', 'noisy_or', 'fuzzy'):
+                    full = engine.diagnose(symptoms, method)
+                    for top_k in (1, 3, 5):
+                        top = engine.diagnose(symptoms, method, top_k=top_k)
+                        self.assertEqual(summary(top), summary(full[:top_k]))
+    
+    def test_incremental_session(self):
+        """La sesión incremental coincide con un diagnóstico completo"""
+        session = DiagnosisSession(self.engine)
+        summary = lambda results: [(r['disease'], r.get('final_confidence', r.get('confidence'))) for r in results]
+        
+        selected = []
+        for symptom in self.test_symptoms + ['Fatiga extrema']:
+            self.assertTrue(session.add_symptom(symptom))
+            selected.append(symptom)
+            for method in ('forward', 'rules', 'hybrid', 'bayes', 'noisy_or', 'fuzzy'):
+                self.assertEqual(summary(session.ranking(method)), summary(self.engine.diagnose(selected, method)))
+        
+        self.assertFalse(session.add_symptom('Tos seca'))
+        self.assertTrue(session.remove_symptom('Tos seca'))
+        selected.remove('Tos seca')
+        self.assertEqual(summary(session.ranking('hybrid', top_k=3)),
+                         summary(self.engine.diagnose(selected, 'hybrid', top_k=3)))
+        
+        session.sync([])
+        self.assertEqual(session.ranking(), [])
+        self.assertEqual(session.active, set())
+        self.assertEqual(sum(session.all_hits), 0)
+    
+    def test_shared_engine(self):
+        """El motor compartido se construye una vez por versión de datos"""
+        engine = get_engine()
+        self.assertIs(get_engine(), engine)
+        # KB compilada y reglas en el mismo espacio de IDs
+        self.assertIs(engine.compiled, engine.rule_set.compiled_kb)
+        self.assertIs(engine.fuzzy_scorer.compiled_kb, engine.compiled)
+        
+        # Simular un cambio de versión de la base de conocimiento
+        inference_engine._shared_engine['version'] = 'version-anterior'
+        rebuilt = get_engine()
+        self.assertIsNot(rebuilt, engine)
+        self.assertIs(get_engine(), rebuilt)
+    
+    def test_data_version_is_rate_limited(self):
+        """Las fuentes se revisan como mucho una vez por intervalo, no en cada get_engine"""
+        engine = get_engine()
+        version = snapshot.get_data_version()
+        original_load, original_interval = snapshot.load_snapshot, snapshot.FRESHNESS_INTERVAL
+        snapshot.load_snapshot = lambda path=None: self.fail("No debe revisar las fuentes")
+        snapshot.FRESHNESS_INTERVAL = float('inf')
+        try:
+            self.assertEqual(snapshot.get_data_version(), version)
+            self.assertIs(get_engine(), engine)
+        finally:
+            snapshot.load_snapshot, snapshot.FRESHNESS_INTERVAL = original_load, original_interval
+        
+        # Vencido el intervalo se revisan de nuevo
+        snapshot._version['checked'] = None
+        self.assertEqual(snapshot.get_data_version(), version)
+    
+    def test_frozen_engine_is_immutable(self):
+        """El motor congelado no expone estructuras mutables"""
+        engine = InferenceEngine(frozen=True)
+        disease = next(iter(engine.knowledge_base))
+        
+        with self.assertRaises(TypeError):
+            engine.knowledge_base[disease] = {}
+        with self.assertRaises(TypeError):
+            engine.knowledge_base[disease]['severity'] = 'leve'
+        with self.assertRaises(TypeError):
+            engine.rules[0]['confidence'] = 0.1
+        self.assertIsInstance(engine.rules, tuple)
+    
+    def test_results_do_not_alias_knowledge_base(self):
+        """Modificar un resultado no altera la KB ni diagnósticos posteriores"""
+        results = diagnose(self.test_symptoms, method='hybrid')
+        top = results[0]
+        expected = list(get_engine().knowledge_base[top['disease']]['recommendations'])
+        top['recommendations'].append('Recomendación inyectada')
+        
+        again = diagnose(self.test_symptoms, method='hybrid')
+        self.assertEqual(again[0]['recommendations'], expected)
+    
+    def test_concurrent_diagnoses(self):
+        """Un único motor congelado atiende diagnósticos concurrentes"""
+        engine = InferenceEngine(frozen=True)
+        symptom_sets = [case['symptoms'] for case in load_test_cases()] * 4
+        expected = [engine.diagnose(symptoms) for symptoms in symptom_sets]
+        
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            concurrent = list(pool.map(engine.diagnose, symptom_sets))
+        
+        self.assertEqual(concurrent, expected)
+    
     def test_confidence_label(self):
         """Verificar etiquetas de confianza"""
         label, emoji = self.engine.get_confidence_level_label(0.9)
@@ -170,6 +881,178 @@ class TestInferenceEngine(unittest.TestCase):
         self.assertEqual(emoji, "🔴")
 
 
+class TestReteChaining(unittest.TestCase):
+    """Pruebas del encadenamiento multinivel con red Rete"""
+    
+    def setUp(self):
+        self.rules = [
+            {
+                'id': 'sindrome_febril',
+                'type': 'fact',
+                'conditions': {'required': ['Fiebre alta (más de 38.5°C)', 'Escalofríos'], 'optional': []},
+                'conclusion': 'Síndrome febril',
+                'confidence': 0.9
+            },
+            {
+                'id': 'gripe_por_sindrome',
+                'conditions': {'required': ['Síndrome febril', 'Tos seca'], 'optional': ['Fatiga extrema']},
+                'conclusion': 'Gripe (Influenza)',
+                'confidence': 0.8
+            },
+            {
+                'id': 'neumonia_por_sindrome',
+                'conditions': {'required': ['Síndrome febril', 'Tos con flema (productiva)'], 'optional': []},
+                'conclusion': 'Neumonía',
+                'confidence': 0.85
+            }
+        ]
+        self.engine = InferenceEngine(rules=self.rules)
+    
+    def test_intermediate_facts(self):
+        """Una regla concluye un hecho intermedio que otra consume"""
+        symptoms = ['Fiebre alta (más de 38.5°C)', 'Escalofríos', 'Tos seca']
+        run = self.engine.chain_rules(symptoms)
+        
+        self.assertAlmostEqual(run['facts']['Síndrome febril'], 0.9)
+        self.assertEqual([r['rule_id'] for r in run['fired']], ['sindrome_febril', 'gripe_por_sindrome'])
+        self.assertEqual(run['fired'][1]['depth'], 2)
+        
+        # Los hechos intermedios no aparecen como diagnósticos
+        results = self.engine.rule_based_inference(symptoms)
+        self.assertEqual([r['conclusion'] for r in results], ['Gripe (Influenza)'])
+        self.assertAlmostEqual(results[0]['confidence'], 0.8 * 0.9)
+        self.assertEqual(self.engine.diagnose(symptoms, 'rules')[0]['disease'], 'Gripe (Influenza)')
+    
+    def test_shared_condition_nodes(self):
+        """Las reglas con condiciones comunes comparten nodos de la red"""
+        network = build_network(self.rules)
+        self.assertTrue(network.chains)
+        self.assertEqual(len(network.alpha['Síndrome febril']), 1)
+        # raíz + 2 (primera regla) + 1 compartido + 2 hojas
+        self.assertEqual(len(network.nodes), 6)
+    
+    def test_absent_facts_are_not_derived(self):
+        """Un hecho confirmado ausente no se deriva y las reglas que lo requieren no disparan"""
+        symptoms = ['Fiebre alta (más de 38.5°C)', 'Escalofríos', 'Tos seca']
+        run = self.engine.network.run(symptoms, absent=['Síndrome febril'])
+        self.assertEqual(run['fired'], [])
+        self.assertEqual(self.engine.rule_based_inference(symptoms, absent_symptoms=['Síndrome febril']), [])
+        # Un hecho dado prevalece sobre su ausencia
+        run = self.engine.network.run(symptoms, absent=['Tos seca'])
+        self.assertEqual([r['rule_id'] for r in run['fired']], ['sindrome_febril', 'gripe_por_sindrome'])
+    
+    def test_network_matches_flat_rules(self):
+        """Sin encadenamiento, la red dispara lo mismo que las reglas compiladas"""
+        engine = InferenceEngine()
+        self.assertFalse(engine.network.chains)
+        for case in load_test_cases():
+            flat = engine.rule_based_inference(case['symptoms'])
+            chained = engine.network.infer(case['symptoms'])
+            self.assertEqual([(r['rule_id'], r['confidence']) for r in chained],
+                             [(r['rule_id'], r['confidence']) for r in flat])
+
+
+class TestGoalProver(unittest.TestCase):
+    """Pruebas del encadenamiento hacia atrás dirigido por objetivos"""
+    
+    @staticmethod
+    def rule(rule_id, required, conclusion, confidence=1.0, rule_type='fact'):
+        return {'id': rule_id, 'type': rule_type, 'conditions': {'required': required, 'optional': []},
+                'conclusion': conclusion, 'confidence': confidence}
+    
+    def test_prove_through_intermediate_facts(self):
+        """La hipótesis se prueba a través de un hecho intermedio"""
+        rules = [
+            self.rule('sindrome_febril', ['Fiebre alta (más de 38.5°C)', 'Escalofríos'], 'Síndrome febril', 0.9),
+            self.rule('gripe_por_sindrome', ['Síndrome febril', 'Tos seca'], 'Gripe (Influenza)', 0.8, None)
+        ]
+        engine = InferenceEngine(rules=rules)
+        symptoms = ['Fiebre alta (más de 38.5°C)', 'Escalofríos', 'Tos seca']
+        
+        result = engine.prove_hypothesis(symptoms, 'Gripe (Influenza)')
+        self.assertTrue(result['proven'])
+        self.assertAlmostEqual(result['certainty'], 0.8 * 0.9)
+        self.assertEqual(result['proof']['rule'], 'gripe_por_sindrome')
+        self.assertEqual(result['proof']['premises'][0]['rule'], 'sindrome_febril')
+        # Coincide con el encadenamiento hacia adelante
+        self.assertAlmostEqual(engine.chain_rules(symptoms)['facts']['Gripe (Influenza)'], result['certainty'])
+        
+        self.assertFalse(engine.prove_hypothesis(symptoms[1:], 'Gripe (Influenza)')['proven'])
+    
+    def test_shared_subgoals_are_tabled(self):
+        """Cada subobjetivo se expande una vez: sin tabla serían 2^n expansiones"""
+        levels = 30
+        rules = [self.rule('a0', ['x'], 'a0'), self.rule('b0', ['y'], 'b0')]
+        for level in range(1, levels):
+            previous = [f'a{level - 1}', f'b{level - 1}']
+            rules.append(self.rule(f'a{level}', previous, f'a{level}'))
+            rules.append(self.rule(f'b{level}', previous, f'b{level}'))
+        
+        query = build_prover(rules).query(['x', 'y'])
+        self.assertTrue(query.prove(f'a{levels - 1}')['proven'])
+        self.assertEqual(query.expanded, 2 * levels - 1)
+        
+        query = build_prover(rules).query(['x'])
+        self.assertFalse(query.prove(f'a{levels - 1}')['proven'])
+        self.assertLessEqual(query.expanded, 2 * levels + 1)
+    
+    def test_absent_required_fails_fast(self):
+        """Una regla con un requerido confirmado ausente se descarta sin probar el resto"""
+        levels = 20
+        rules = [self.rule('a0', ['x'], 'a0')]
+        for level in range(1, levels):
+            rules.append(self.rule(f'a{level}', [f'a{level - 1}'], f'a{level}'))
+        rules.append(self.rule('meta', [f'a{levels - 1}', 'z'], 'meta'))
+        prover = build_prover(rules)
+        
+        query = prover.query(['x'])
+        self.assertFalse(query.prove('meta')['proven'])
+        self.assertEqual(query.expanded, levels + 2)
+        
+        query = prover.query(['x'], absent=['z'])
+        self.assertFalse(query.prove('meta')['proven'])
+        self.assertEqual(query.expanded, 1)
+        # Un subobjetivo ausente falla sin expandirse
+        query = prover.query(['x'], absent=['a0'])
+        self.assertFalse(query.prove(f'a{levels - 1}')['proven'])
+        self.assertEqual(query.expanded, levels - 1)
+    
+    def test_cycles(self):
+        """Un ciclo cuenta como fallo y no deja fallos provisionales en la tabla"""
+        rules = [
+            self.rule('a_desde_b', ['b'], 'a'),
+            self.rule('b_desde_a', ['a'], 'b'),
+            self.rule('a_desde_s', ['s'], 'a'),
+            self.rule('meta', ['a', 'b'], 'meta')
+        ]
+        prover = build_prover(rules)
+        self.assertFalse(prover.prove([], 'meta')['proven'])
+        # 'b' falla mientras 'a' está en curso, pero luego 'a' se prueba por 's'
+        self.assertTrue(prover.prove(['s'], 'meta')['proven'])
+    
+    def test_cycles_are_tabled(self):
+        """Un ciclo se tabula completo al cerrarse: sin reexpandir por cada camino"""
+        levels = 14
+        rules = []
+        for level in range(levels):
+            rules.append(self.rule(f'g{level}', [f'a{level}', f'b{level}'], f'g{level}'))
+            rules.append(self.rule(f'a{level}', [f'g{level + 1}'], f'a{level}'))
+            rules.append(self.rule(f'b{level}', [f'g{level + 1}'], f'b{level}'))
+        rules.append(self.rule('vuelta', ['g0'], f'g{levels}'))
+        rules.append(self.rule('base', ['z'], f'g{levels}'))
+        
+        query = build_prover(rules).query(['z'])
+        self.assertTrue(query.prove('g0')['proven'])
+        # 3n+1 subobjetivos; una pasada más para confirmar el punto fijo
+        self.assertLessEqual(query.expanded, 2 * (3 * levels + 1))
+        self.assertTrue(query.prove(f'a{levels - 1}')['proven'])
+        self.assertLessEqual(query.expanded, 2 * (3 * levels + 1))
+        
+        query = build_prover(rules).query([])
+        self.assertFalse(query.prove('g0')['proven'])
+        self.assertLessEqual(query.expanded, 3 * levels + 1)
+
+
 class TestCases(unittest.TestCase):
     """Pruebas de casos de prueba"""
     
@@ -203,6 +1086,128 @@ class TestCases(unittest.TestCase):
             self.assertIn('results', result)
             self.assertIn('expected_found', result)
             self.assertIn('total_diagnoses', result)
+    
+    def test_evaluate_cases_batch(self):
+        """La evaluación por lotes coincide con la ejecución caso a caso"""
+        cases = load_test_cases()
+        evaluation = evaluate_test_cases(cases, method='hybrid')
+        
+        self.assertEqual(evaluation['total_cases'], len(cases))
+        for case, detail in zip(cases, evaluation['detailed_results']):
+            single = run_test_case(case, method='hybrid')
+            self.assertEqual(detail['expected_position'], single['expected_position'])
+
+
+class TestSnapshot(unittest.TestCase):
+    """Pruebas del snapshot binario compilado"""
+    
+    def setUp(self):
+        """Copia los datasets a un directorio temporal"""
+        self.tmp_dir = tempfile.mkdtemp()
+        self.original_data_dir = snapshot.DATA_DIR
+        for filename in snapshot.SOURCES.values():
+            shutil.copy(os.path.join(self.original_data_dir, filename), self.tmp_dir)
+        snapshot.DATA_DIR = self.tmp_dir
+        self.path = os.path.join(self.tmp_dir, 'cache', 'snapshot.bin')
+    
+    def tearDown(self):
+        snapshot.DATA_DIR = self.original_data_dir
+        snapshot._memory.pop(self.path, None)
+        shutil.rmtree(self.tmp_dir)
+    
+    def test_snapshot_matches_sources(self):
+        """El snapshot contiene las tres fuentes parseadas"""
+        data = snapshot.load_snapshot(self.path)['data']
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(data['diseases'], get_knowledge_base())
+        self.assertEqual(len(data['cases']), len(load_test_cases()))
+        self.assertGreater(len(data['symptoms']), 0)
+        self.assertEqual(data['rules'], create_simple_rules())
+    
+    def test_snapshot_reused_when_unchanged(self):
+        """Un cambio solo de mtime no reconstruye el snapshot"""
+        digest = snapshot.load_snapshot(self.path)['digest']
+        snapshot._memory.pop(self.path)
+        os.utime(os.path.join(self.tmp_dir, snapshot.SOURCES['cases']), ns=(1, 1))
+        
+        original_build = snapshot.build_snapshot
+        snapshot.build_snapshot = lambda stats=None: self.fail("No debe reconstruirse")
+        try:
+            self.assertEqual(snapshot.load_snapshot(self.path)['digest'], digest)
+        finally:
+            snapshot.build_snapshot = original_build
+    
+    def test_snapshot_rebuilt_on_content_change(self):
+        """Un cambio de contenido invalida el snapshot"""
+        digest = snapshot.load_snapshot(self.path)['digest']
+        cases_path = os.path.join(self.tmp_dir, snapshot.SOURCES['cases'])
+        with open(cases_path, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        with open(cases_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines[:2]) + '\n')
+        
+        rebuilt = snapshot.load_snapshot(self.path)
+        self.assertNotEqual(rebuilt['digest'], digest)
+        self.assertEqual(len(rebuilt['data']['cases']), 1)
+    
+    def test_invalid_rules_file(self):
+        """Un archivo de reglas mal formado se registra y se sirven las últimas reglas válidas"""
+        valid = snapshot.load_snapshot(self.path)
+        rules_path = os.path.join(self.tmp_dir, snapshot.SOURCES['rules'])
+        with open(rules_path, 'a', encoding='utf-8') as f:
+            f.write('regla_rota,diagnostico,Tos seca,,Gripe (Influenza),alta\n')
+        
+        rebuilt = snapshot.load_snapshot(self.path)
+        self.assertIn("confianza inválida 'alta'", rebuilt['errors']['rules'])
+        self.assertEqual(rebuilt['data']['rules'], valid['data']['rules'])
+        self.assertEqual(rebuilt['data']['diseases'], valid['data']['diseases'])
+        
+        # Sin una versión válida anterior la fuente queda vacía, no el snapshot
+        snapshot._memory.pop(self.path)
+        os.remove(self.path)
+        rebuilt = snapshot.load_snapshot(self.path)
+        self.assertIsNone(rebuilt['data']['rules'])
+        self.assertIn('rules', rebuilt['errors'])
+        self.assertEqual(rebuilt['data']['diseases'], valid['data']['diseases'])
+    
+    def test_truncated_rules_row(self):
+        """Una fila con menos celdas que el encabezado se registra con su línea"""
+        valid = snapshot.load_snapshot(self.path)
+        rules_path = os.path.join(self.tmp_dir, snapshot.SOURCES['rules'])
+        with open(rules_path, encoding='utf-8') as f:
+            line = len(f.read().splitlines()) + 1
+        with open(rules_path, 'a', encoding='utf-8') as f:
+            f.write('regla_rota,diagnostico,Tos seca\n')
+        
+        rebuilt = snapshot.load_snapshot(self.path)
+        self.assertIn(f"{snapshot.SOURCES['rules']}:{line}:", rebuilt['errors']['rules'])
+        self.assertEqual(rebuilt['data']['rules'], valid['data']['rules'])
+    
+    def test_invalid_hierarchy_file(self):
+        """Una relación de jerarquía inválida se registra sin impedir la carga"""
+        hierarchy_path = os.path.join(self.tmp_dir, snapshot.SOURCES['hierarchy'])
+        with open(hierarchy_path, 'a', encoding='utf-8') as f:
+            f.write('Tos,Tos\n')
+        rebuilt = snapshot.load_snapshot(self.path)
+        self.assertIn("relación inválida 'Tos' -> 'Tos'", rebuilt['errors']['hierarchy'])
+        self.assertEqual(rebuilt['errors'].keys(), {'hierarchy'})
+    
+    def test_concurrent_atomic_writes(self):
+        """Escrituras simultáneas desde varios hilos: el archivo queda entero y sin temporales"""
+        path = os.path.join(self.tmp_dir, 'cache', 'concurrente.bin')
+        contents = [bytes([i]) * 200000 for i in range(8)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(lambda content: snapshot.write_atomic(path, content), contents * 4))
+        with open(path, 'rb') as f:
+            self.assertIn(f.read(), contents)
+        self.assertEqual(os.listdir(os.path.dirname(path)), ['concurrente.bin'])
+    
+    def test_corrupt_snapshot_is_rebuilt(self):
+        """Un archivo corrupto se descarta y se reconstruye"""
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as f:
+            f.write(b'corrupto')
+        self.assertIsNotNone(snapshot.load_snapshot(self.path)['data']['diseases'])
 
 
 class TestIntegration(unittest.TestCase):
@@ -274,7 +1279,10 @@ def run_tests():
     suite.addTests(loader.loadTestsFromTestCase(TestSymptoms))
     suite.addTests(loader.loadTestsFromTestCase(TestKnowledgeBase))
     suite.addTests(loader.loadTestsFromTestCase(TestInferenceEngine))
+    suite.addTests(loader.loadTestsFromTestCase(TestReteChaining))
+    suite.addTests(loader.loadTestsFromTestCase(TestGoalProver))
     suite.addTests(loader.loadTestsFromTestCase(TestCases))
+    suite.addTests(loader.loadTestsFromTestCase(TestSnapshot))
     suite.addTests(loader.loadTestsFromTestCase(TestIntegration))
     
     # Ejecutar pruebas